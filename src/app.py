@@ -122,7 +122,10 @@ def load_symbols(
         # return [df.symbol.drop_duplicates().to_list()]
 
     df_screener_symbols = (
-        Screener().apply_screeners(screeners=screeners, df=df_signals, trend=trend).loc[:, ["symbol"]].drop_duplicates()
+        Screener(crossovers=config.get("config").get("crossovers"))
+        .apply_screeners(screeners=screeners, df=df_signals, trend=trend)
+        .loc[:, ["symbol"]]
+        .drop_duplicates()
     )
 
     if df_screener_symbols.empty or df_screener_symbols is None:
@@ -1,5 +1,6 @@
 from pandas import HDFStore, DataFrame, read_hdf, read_parquet
 from pathlib import Path
+from schema import read_frame
 import yaml
 
 
@@ -18,13 +19,13 @@ def get_candle_data(path: Path, symbol: str, period: str, candle: str) -> DataFr
 
     # ohlc_key = f"/OHLCV/{period}/"
     # print("OHLC_key", ohlc_key)
-    ohlc_df = read_parquet(path=path / f"OHLCV/{period}/data.parquet").query(f"symbol == '{symbol}'")
+    ohlc_df = read_frame(path=path / f"OHLCV/{period}/data.parquet", filters=[("symbol", "==", symbol)])
     if candle == "ohlc":
         return ohlc_df.sort_values("Date", ascending=False).reset_index(drop=True)  # .drop("Index", axis=1)
 
     if candle == "ha":
         # ha_key = f"/Signals/{period}/heikin_ashi/"
-        ha_df = read_parquet(path=path / f"signals/{period}/heikin_ashi.parquet").query(f"symbol == '{symbol}'")
+        ha_df = read_frame(path=path / f"signals/{period}/heikin_ashi.parquet", filters=[("symbol", "==", symbol)])
         # print("ha_df", ha_df)
         # print("ohlc_df", ohlc_df)
 
@@ -52,13 +53,13 @@ def load_screener_data(path: Path, period: str, lookback: list[int] = [0, 1]) ->
     # screener_key = f"Signals/{period}/merged"
     # print("lookback", lookback)
     return (
-        read_parquet(path=path / f"signals/{period}/merged.parquet")
+        read_frame(path=path / f"signals/{period}/merged.parquet")
         .sort_values("Date", ascending=True)
         .groupby("symbol")
         .tail(lookback[1])
         .groupby("symbol")
         .head(lookback[1] - lookback[0])
-        .drop("index", axis=1)
+        .drop(columns=["index"], errors="ignore")
     )
 
 
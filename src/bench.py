@@ -0,0 +1,266 @@
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Optional
+from pandas import DataFrame, MultiIndex, read_parquet
+from icecream import ic
+
+from app_utilities import get_candle_data, load_screener_data, get_symbol_info
+from calcs import calculations, merged_signals
+from indicators import make_indicators
+from instrument import memory_watch
+from lines import make_lines
+from panel import Panel, STATE_SUFFIX
+from patterns import get_patterns
+from registry import default_indicators, run_registry
+from schema import write_frame, read_frame, expand
+from screener import Screener
+from synthetic import synthetic_dataset
+from ta_lib import index_closes
+
+
+BENCH_PATH = Path("./benchmarks").absolute()
+REPO_PATH = Path(__file__).parent
+# Synthetic panel sizes, in stocks (the index ETFs come on top) and daily bars
+SCALES = {
+    "small": {"n_symbols": 50, "n_bars": 500},
+    "medium": {"n_symbols": 200, "n_bars": 1260},
+    "large": {"n_symbols": 1000, "n_bars": 1260},
+}
+SUITES = ["calculations", "indicators", "incremental", "screeners", "loaders"]
+
+
+def timed(func: Callable, repeat: int = 3, **kwargs) -> tuple[dict, object]:
+    """Best and mean wall time and peak RSS of repeated calls, with the result of the last one"""
+    times = []
+    with memory_watch().watch() as memory:
+        for _ in range(repeat):
+            start = perf_counter()
+            result = func(**kwargs)
+            times.append(perf_counter() - start)
+    return {"best_s": min(times), "mean_s": sum(times) / len(times), "rss_peak_mb": memory["peak"] / 2**20}, result
+
+
+def bench_calculations(df: DataFrame, calc_set: str, repeat: int = 1, n_jobs: int = 1) -> list[dict]:
+    """The whole indicator engine over a period's panel"""
+    timing, _ = timed(calculations, repeat=repeat, df=df, calc_set=calc_set, n_jobs=n_jobs)
+    return [{"name": f"calculations_{calc_set}", "rows": len(df), **timing}]
+
+
+def bench_indicators(df: DataFrame, repeat: int = 3) -> list[dict]:
+    """Each default indicator alone on a fresh panel, so its intermediates are counted too"""
+    panel = Panel(df=df)
+    # the index closes calculations adds for the Mansfield RSI
+    df = panel.df.assign(index_close=index_closes(panel=panel)[0])
+    records = []
+    for indicator in default_indicators():
+
+        def run() -> dict:
+            return run_registry(panel=Panel(df=df), indicators=[indicator])
+
+        timing, results = timed(run, repeat=repeat)
+        records.append({"name": indicator.key, "rows": sum(len(result) for result in results.values()), **timing})
+    return records
+
+
+def bench_screeners(data_path: Path, period: str = "D", repeat: int = 5) -> list[dict]:
+    """Each Screener method on the latest bar of every symbol, as the app screens it"""
+    df = load_screener_data(path=data_path, period=period, lookback=[0, 1])
+    screener = Screener()
+    runs = {
+        "ha_streak_screener": lambda: screener.ha_streak_screener(df=df.copy()),
+        "supertrend_screener": lambda: screener.supertrend_screener(df=df.copy()),
+        "macd_screener": lambda: screener.macd_screener(df=df.copy()),
+        "stoch_rsi_screener": lambda: screener.stoch_rsi_screener(df=df.copy()),
+        **{
+            f"ma_screener_{label}": lambda ma1=ma1, ma2=ma2: screener.ma_screener(df=df.copy(), ma1=ma1, ma2=ma2)
+            for label, (ma1, ma2) in screener.crossovers.items()
+        },
+        "apply_screeners": lambda: screener.apply_screeners(
+            df=df.copy(), screeners=["ha", "st", "macd", "srsi"] + list(screener.crossovers)
+        ),
+    }
+    records = []
+    for name, run in runs.items():
+        timing, result = timed(run, repeat=repeat)
+        records.append({"name": name, "rows": len(df), **timing})
+    return records
+
+
+def bench_loaders(data_path: Path, period: str = "D", symbol: str = "S0000", repeat: int = 5) -> list[dict]:
+    """The app data loaders for one symbol, and the screener data for all of them"""
+    runs = {
+        "get_candle_data_ohlc": lambda: get_candle_data(path=data_path, symbol=symbol, period=period, candle="ohlc"),
+        "get_candle_data_ha": lambda: get_candle_data(path=data_path, symbol=symbol, period=period, candle="ha"),
+        "load_screener_data": lambda: load_screener_data(path=data_path, period=period, lookback=[0, 1]),
+        "get_symbol_info": lambda: get_symbol_info(path=data_path, symbol=symbol),
+        "make_indicators": lambda: make_indicators(
+            path=data_path, period=period, symbol=symbol, indicators=["ha", "st", "macd", "srsi", "sma"]
+        ),
+        "make_lines": lambda: make_lines(path=data_path, period=period, symbol=symbol, lines=["sma20", "ema20"]),
+        "get_patterns": lambda: get_patterns(path=data_path, period=period, symbol=symbol),
+    }
+    records = []
+    for name, run in runs.items():
+        timing, result = timed(run, repeat=repeat)
+        records.append({"name": name, "rows": len(result), **timing})
+    return records
+
+
+def calculate_signals(data_path: Path, prices: DataFrame, calc_set: str, n_jobs: int = 1) -> DataFrame:
+    """Calculate and write a period's signals in the layout the app reads, returning the panel input"""
+    df = prices.merge(
+        read_parquet(data_path / "info/merged_info.parquet").loc[:, ["symbol", "index_symbol"]], on="symbol"
+    )
+    results = calculations(df=df, calc_set=calc_set, n_jobs=n_jobs)
+    for key, result in results.items():
+        write_frame(df=result.reset_index(drop=True), path=data_path / f"signals/{calc_set}/{key}.parquet")
+    write_frame(
+        df=merged_signals(prices=prices, results=results, calc_set=calc_set),
+        path=data_path / f"signals/{calc_set}/merged.parquet",
+    )
+    return df
+
+
+def _differences(key: str, expected: DataFrame, actual: DataFrame, suffix: str = "") -> dict[str, int]:
+    """Rows that differ per column between two frames of a result with the same rows, a missing value being equal to
+    another, or the difference in rows under the result's key when they do not have the same rows"""
+    expected, actual = [
+        frame.sort_values(["symbol", "Date"], kind="mergesort").reset_index(drop=True) for frame in [expected, actual]
+    ]
+    if len(expected) != len(actual):
+        return {f"{key}{suffix}": abs(len(expected) - len(actual))}
+    differences = {}
+    for col in expected.columns:
+        differ = (expected[col] != actual[col]) & ~(expected[col].isna() & actual[col].isna())
+        if differ.any():
+            differences[f"{col}{suffix}"] = int(differ.sum())
+    return differences
+
+
+def check_incremental(data_path: Path, df: DataFrame, calc_set: str = "D", n_new: int = 3) -> dict[str, int]:
+    """Store the signals without the last n_new bars of every symbol and refresh them incrementally.
+
+    The refreshed bars and states are compared in memory, at float64, with a full recompute. Everything stored is
+    then compared again once written and read back at the storage precision, as a separate check whose columns are
+    suffixed " (stored)". Returns the rows that differ per column, empty when the refresh is bit-identical."""
+    stored_path = Path(data_path) / f"incremental/{calc_set}/stored"
+    full_path = Path(data_path) / f"incremental/{calc_set}/full"
+    for path in [stored_path, full_path]:
+        path.mkdir(parents=True, exist_ok=True)
+        for file in path.glob("*.parquet"):
+            file.unlink()
+
+    older = df.groupby("symbol", sort=False).cumcount(ascending=False) >= n_new
+    for key, result in calculations(df=df.loc[older].reset_index(drop=True), calc_set=calc_set, n_jobs=1).items():
+        write_frame(df=result.reset_index(drop=True), path=stored_path / f"{key}.parquet")
+    refreshed = calculations(df=df, calc_set=calc_set, n_jobs=1, signals_path=stored_path)
+    full = calculations(df=df, calc_set=calc_set, n_jobs=1)
+
+    # the stored bars of the refresh were read back from storage, so only the new ones are its own float64 values
+    new_rows = MultiIndex.from_frame(df.loc[~older, ["symbol", "Date"]])
+    mismatches = {}
+    for key, result in full.items():
+        if key.endswith(STATE_SUFFIX):
+            mismatches.update(_differences(key=key, expected=result, actual=refreshed[key]))
+            continue
+        expected, actual = [
+            frame.loc[MultiIndex.from_frame(frame.loc[:, ["symbol", "Date"]]).isin(new_rows)]
+            for frame in [result, refreshed[key]]
+        ]
+        mismatches.update(_differences(key=key, expected=expected, actual=actual))
+
+    for key, result in full.items():
+        write_frame(df=result.reset_index(drop=True), path=full_path / f"{key}.parquet")
+        write_frame(df=refreshed[key].reset_index(drop=True), path=stored_path / f"{key}.parquet")
+        expected, actual = [expand(read_frame(path=path / f"{key}.parquet")) for path in [full_path, stored_path]]
+        mismatches.update(_differences(key=key, expected=expected, actual=actual, suffix=" (stored)"))
+    return mismatches
+
+
+def bench_incremental(data_path: Path, df: DataFrame, calc_set: str = "D", n_new: int = 3) -> list[dict]:
+    """An incremental refresh of the last n_new bars, which must store what a full recompute does"""
+    timing, mismatches = timed(check_incremental, repeat=1, data_path=data_path, df=df, calc_set=calc_set, n_new=n_new)
+    if mismatches:
+        raise ValueError(f"Incremental signals differ from a full recompute in {mismatches}")
+    return [{"name": f"check_incremental_{calc_set}", "rows": len(df), **timing}]
+
+
+def run_benchmarks(
+    data_path: Path,
+    scales: Optional[list[str]] = None,
+    suites: Optional[list[str]] = None,
+    periods: Optional[list[str]] = None,
+    repeat: int = 3,
+    n_jobs: int = 1,
+    seed: int = 0,
+) -> DataFrame:
+    """Time the suites on a deterministic synthetic dataset per scale, written under data_path/<scale>"""
+    scales, suites, periods = scales or ["small", "medium"], suites or SUITES, periods or ["D"]
+    records = []
+    for scale in scales:
+        scale_path = Path(data_path) / scale
+        ic(f"Benchmarks - {scale}: {SCALES[scale]}")
+        prices = synthetic_dataset(data_path=scale_path, seed=seed, periods=periods, **SCALES[scale])
+        for period in periods:
+            df = calculate_signals(data_path=scale_path, prices=prices[period], calc_set=period, n_jobs=n_jobs)
+            labels = {"scale": scale, "period": period, "symbols": df["symbol"].nunique()}
+            if "calculations" in suites:
+                runs = bench_calculations(df=df, calc_set=period, repeat=max(repeat // 3, 1), n_jobs=n_jobs)
+                records += [{"suite": "calculations", **labels, **run} for run in runs]
+            if "indicators" in suites:
+                records += [{"suite": "indicators", **labels, **run} for run in bench_indicators(df=df, repeat=repeat)]
+            if "incremental" in suites:
+                runs = bench_incremental(data_path=scale_path, df=df, calc_set=period)
+                records += [{"suite": "incremental", **labels, **run} for run in runs]
+            if "screeners" in suites:
+                runs = bench_screeners(data_path=scale_path, period=period, repeat=repeat)
+                records += [{"suite": "screeners", **labels, **run} for run in runs]
+            if "loaders" in suites:
+                runs = bench_loaders(data_path=scale_path, period=period, repeat=repeat)
+                records += [{"suite": "loaders", **labels, **run} for run in runs]
+    return DataFrame(records)
+
+
+def git_revision() -> str:
+    """Short hash of the checked out commit, with +dirty when the tree has changes"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=REPO_PATH
+        )
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, cwd=REPO_PATH
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit.stdout.strip() + ("+dirty" if status.stdout.strip() else "")
+
+
+def save_benchmarks(results: DataFrame, path: Path = BENCH_PATH) -> Path:
+    """Store the results as <timestamp>_<revision>.parquet, so runs of different commits can be compared"""
+    revision = git_revision()
+    started = datetime.now()
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    file = path / f"{started:%Y%m%d_%H%M%S}_{revision}.parquet"
+    results.assign(revision=revision, run_at=started.isoformat(timespec="seconds")).to_parquet(file)
+    return file
+
+
+def compare_benchmarks(base: Path, head: Path) -> DataFrame:
+    """Best times of two stored runs side by side, with head / base (under 1 is faster)"""
+    keys = ["suite", "scale", "period", "name"]
+    compared = (
+        read_parquet(base)
+        .loc[:, keys + ["best_s"]]
+        .merge(read_parquet(head).loc[:, keys + ["best_s"]], on=keys, how="outer", suffixes=("_base", "_head"))
+    )
+    compared["ratio"] = compared["best_s_head"] / compared["best_s_base"]
+    return compared.sort_values("ratio", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    results = run_benchmarks(data_path=BENCH_PATH / "data")
+    print(results.to_string())
+    print(save_benchmarks(results=results))
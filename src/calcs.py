@@ -1,440 +1,234 @@
-# from nasdaq import Nasdaq
-# from yahoo import Yahoo
-# from yahoo_info import YahooInfo
-from pandas import DataFrame, concat
-from tqdm.auto import tqdm
+from pandas import DataFrame, MultiIndex, concat
+from pandas.arrays import IntegerArray
+from numpy import add, where, nan, ndarray
 from icecream import ic
+from joblib import Parallel, delayed
+from pathlib import Path
+from typing import Optional, Union
+
+from panel import Panel, STATE_SUFFIX, shard_bounds
+from registry import Indicator, default_indicators, run_registry, run_incremental
+from ta_lib import index_closes
+from schema import read_frame, expand
+from instrument import RunReport, active_report, measure, memory_watch, rows
+
+# Results stored as event tables rather than one row per bar, so they are not merged into the wide frame, nor are the
+# states (keys ending in STATE_SUFFIX) of one row per symbol
+SPARSE_RESULTS = ["pattern_recognition"]
+
+
+def calculate_shard(
+    df: DataFrame, calc_set: str = "D", indicators: Optional[list[Indicator]] = None, debug: bool = False
+) -> dict[str, DataFrame]:
+    """Run the indicator set (the default one when None) over a frame of whole symbols"""
+    panel = Panel(df=df)
+    results = run_registry(
+        panel=panel, indicators=indicators or default_indicators(), desc=f"Indicators - {calc_set}", debug=debug
+    )
+    ic(panel.cache_report())
+    return results
 
-tqdm.pandas(bar_format="{desc}{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}, iter={n}]")
-# from pathlib import Path
-# from joblib import Parallel, delayed
-# from multiprocessing import cpu_count
-# from typing import Optional
-from ta_lib import *
-from ha import heikin_ashi, heikin_ashi_signals
-from future_calcs import future_max, future_end
-
-# from joblib import Parallel, delayed
 
+def measured_shard(
+    df: DataFrame,
+    calc_set: str = "D",
+    indicators: Optional[list[Indicator]] = None,
+    debug: bool = False,
+    shard: int = 0,
+    run_id: Optional[str] = None,
+    profile: Optional[list[str]] = None,
+) -> tuple[dict[str, DataFrame], list[dict]]:
+    """calculate_shard in a worker process, under a report of its own whose records are returned with the results"""
+    report = RunReport(run_id=run_id, profile=profile)
+    with report.active(), report.stage("shard", kind="shard", calc_set=calc_set, shard=shard) as record:
+        results = calculate_shard(df=df, calc_set=calc_set, indicators=indicators, debug=debug)
+        record["rows"] = len(df)
+    return results, report.records
+
+
+def stored_signals(signals_path: Path) -> dict[str, DataFrame]:
+    """Signals saved by a previous run, keyed by result name"""
+    return {
+        path.stem: expand(read_frame(path=path))
+        for path in sorted(Path(signals_path).glob("*.parquet"))
+        if path.stem not in ["merged", "index_close"]
+    }
+
+
+def incremental_calculations(
+    panel: Panel, stored: dict[str, DataFrame], indicators: Optional[list[Indicator]] = None, debug: bool = False
+) -> Optional[dict[str, DataFrame]]:
+    """Compute only the bars after the last stored Date of each symbol and append them to the stored signals"""
+    last_date = concat(
+        [
+            signal.groupby("symbol").Date.max()
+            for key, signal in stored.items()
+            if key not in SPARSE_RESULTS and not key.endswith(STATE_SUFFIX)
+        ],
+        axis=1,
+    ).min(axis=1)
+    dates = panel.df.Date
+    is_new = (dates > panel.df.symbol.map(last_date)) | panel.df.symbol.map(last_date).isna()
+    # dates are sorted within each symbol, so the new bars are a suffix of every symbol
+    first_new = panel.ends - add.reduceat(is_new.to_numpy(), panel.starts)
+
+    states = {key: signal for key, signal in stored.items() if key.endswith(STATE_SUFFIX)}
+    new_results = run_incremental(
+        panel=panel, indicators=indicators or default_indicators(), first_new=first_new, states=states, debug=debug
+    )
+    if not new_results.keys() <= stored.keys():
+        return None
 
-def calculations(df: DataFrame, n_jobs: int = 8, calc_set: str = "D") -> dict[DataFrame]:
     results = {}
-    # symbols = df.symbol.drop_duplicates().unique()
-
-    # ha_tmp = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(heikin_ashi)(df=df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="heikin ashi")
-    #     )
-    # )
-
-    ic("Index Close")
-    index_tmp = (
-        df.loc[df.symbol.isin(df.index_symbol.unique()), ["symbol", "Date", "Close"]]
-        .drop_duplicates()
-        .rename(columns={"symbol": "index_symbol", "Close": "index_close"})
-    )
-    # ic(index_tmp)
-    index_close_df = (
-        df.merge(index_tmp, how="inner", on=["Date", "index_symbol"])
-        .loc[:, ["symbol", "Date", "index_close"]]
-        .drop_duplicates()
-        .reset_index(drop=True)
-    )
-    results["index_close"] = index_close_df
-
-    ic("Mansfield RSI")
-    results["mansfield_rsi"] = (
-        df.merge(right=index_close_df, how="left", on=["symbol", "Date"])
-        .groupby("symbol", group_keys=False)
-        .progress_apply(lambda data: mansfield_rsi(df=data))
-    )
-
-    ic("Heikin Ashi")
-    ha_tmp = df.groupby("symbol", group_keys=False).progress_apply(lambda data: heikin_ashi(df=data))
-    ic("Heikin Ashi signals")
-    results["heikin_ashi"] = ha_tmp.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: heikin_ashi_signals(df=data)
-    )
-
-    # results["heikin_ashi"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(heikin_ashi_signals)(df=ha_tmp.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="heikin ashi signals")
-    #     )
-    # )
-
-    # results["bollinger_bands"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(bollinger_bands)(df=df.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="bollinger bands")
-    #     )
-    # )
-    ic("Bollinger bands")
-    results["bollinger_bands"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: bollinger_bands(df=data)
-    )
-
-    # results["rsi"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(rsi)(df=df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="rsi")
-    #     )
-    # )
-    ic("RSI")
-    results["rsi"] = df.groupby("symbol", group_keys=False).progress_apply(lambda data: rsi(df=data))
-
-    # results["stochastic_rsi"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(stochastic_rsi)(df=df.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="stochastic_rsi")
-    #     )
-    # )
-    ic("Stochastic RSI")
-    results["stochastic_rsi"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: stochastic_rsi(df=data)
-    )
-
-    # results["macd"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(macd)(df=df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="macd")
-    #     )
-    # )
-    ic("MACD")
-    results["macd"] = df.groupby("symbol", group_keys=False).progress_apply(lambda data: macd(df=data))
-
-    # results["natr_14"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(natr)(df=df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="natr")
-    #     )
-    # )
-    ic("NATR 14")
-    results["natr_14"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: natr(df=data, timeperiod=14)
-    )
-
-    # results["volume_ema_10"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(volume_ema)(df=df.query(f'symbol == "{symbol}"'), timeperiod=10)
-    #         for symbol in tqdm(symbols, desc="volume_ema")
-    #     )
-    # )
-    ic("Volume EMA 10")
-    results["volume_ema_10"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: volume_ema(df=data, timeperiod=10)
-    )
-
-    ic("Volume SMA 21")
-    results["volume_sma_21"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: volume_sma(df=data, timeperiod=21)
-    )
-
-    # results["obv"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(natr)(df=df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="obv")
-    #     )
-    # )
-
-    ic("OBV")
-    results["obv"] = df.groupby("symbol", group_keys=False).progress_apply(lambda data: obv(df=data))
-
-    # results["sma"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(simple_moving_averages)(df=df.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="simple moving averages")
-    #     )
-    # )
-    ic("SMA")
-    results["sma"] = df.groupby("symbol", group_keys=False).progress_apply(lambda data: simple_moving_averages(df=data))
-
-    ic("EMA")
-    results["ema"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: exponential_moving_averages(df=data)
-    )
-
-    ic("SATA moving averages")
-    results["sata_moving_averages"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: sata_moving_averages(df=data)
-    )
-
-    # results["ema"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(exponential_moving_averages)(df=df.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="exponential moving averages")
-    #     )
-    # )
-
-    # results["supertrend"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(supertrend)(df.query(f'symbol == "{symbol}"')) for symbol in tqdm(symbols, desc="supertrend")
-    #     )
-    # )
-    ic("Supertrend")
-    results["supertrend"] = df.groupby("symbol", group_keys=False).progress_apply(lambda data: supertrend(df=data))
-
-    # results["pattern_recognition"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(pattern_recognition)(df=df.query(f'symbol == "{symbol}"'))
-    #         for symbol in tqdm(symbols, desc="Pattern Recognition")
-    #     )
-    # )
-    # ic("Patterns")
-    # results["pattern_recognition"] = df.groupby("symbol", group_keys=False).progress_apply(
-    #     lambda data: pattern_recognition(df=data)
-    # )
-
-    # results["periods_since_bottom_10"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_bottom)(df=df.query(f'symbol == "{symbol}"'), num_periods=10, low_column="Low")
-    #         for symbol in tqdm(symbols, desc="Periods since 10 period bottom")
-    #     )
-    # )
-    ic("Periods since bottom 10")
-    results["periods_since_bottom_10"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_bottom(df=data, num_periods=10, low_column="Low")
-    )
-    ic("Periods since bottom 20")
-    results["periods_since_bottom_20"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_bottom(df=data, num_periods=20, low_column="Low")
-    )
-    ic("Periods since bottom 40")
-    results["periods_since_bottom_40"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_bottom(df=data, num_periods=40, low_column="Low")
-    )
-
-    # results["periods_since_bottom_20"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_bottom)(df=df.query(f'symbol == "{symbol}"'), num_periods=20, low_column="Low")
-    #         for symbol in tqdm(symbols, desc="Periods since 20 period bottom")
-    #     )
-    # )
-
-    # results["periods_since_bottom_40"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_bottom)(df=df.query(f'symbol == "{symbol}"'), num_periods=40, low_column="Low")
-    #         for symbol in tqdm(symbols, desc="Periods since 40 period bottom")
-    #     )
-    # )
-
-    # results["periods_since_top_10"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_top)(df=df.query(f'symbol == "{symbol}"'), num_periods=10, high_column="High")
-    #         for symbol in tqdm(symbols, desc="Periods since 10 period top")
-    #     )
-    # )
-
-    # results["periods_since_top_20"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_top)(df=df.query(f'symbol == "{symbol}"'), num_periods=20, high_column="High")
-    #         for symbol in tqdm(symbols, desc="Periods since 20 period top")
-    #     )
-    # )
-
-    # results["periods_since_top_40"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(periods_since_top)(df=df.query(f'symbol == "{symbol}"'), num_periods=40, high_column="High")
-    #         for symbol in tqdm(symbols, desc="Periods since 30 period top")
-    #     )
-    # )
-    ic("Periods since top 10")
-    results["periods_since_top_10"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_top(df=data, num_periods=10, high_column="High")
-    )
-    ic("Periods since top 20")
-    results["periods_since_top_20"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_top(df=data, num_periods=20, high_column="High")
-    )
-    ic("Periods since top 40")
-    results["periods_since_top_40"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: periods_since_top(df=data, num_periods=40, high_column="High")
-    )
-
-    # results["find_slope_10"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(find_slope)(df=df.query(f'symbol == "{symbol}"'), num_periods=10)
-    #         for symbol in tqdm(symbols, desc="Find the 10 period slope")
-    #     )
-    # )
-
-    # results["find_slope_20"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(find_slope)(df=df.query(f'symbol == "{symbol}"'), num_periods=20)
-    #         for symbol in tqdm(symbols, desc="Find the 20 period slope")
-    #     )
-    # )
+    for key, new in new_results.items():
+        signal = stored[key]
+        if key.endswith(STATE_SUFFIX):
+            # one row per symbol, replaced by the state after its new bars
+            signal = signal.loc[signal.symbol.isin(panel.symbols) & ~signal.symbol.isin(new.symbol)]
+        else:
+            first_recomputed = signal.symbol.map(new.groupby("symbol").Date.min())
+            signal = signal.loc[signal.symbol.isin(panel.symbols) & ~(signal.Date >= first_recomputed)]
+        results[key] = (
+            concat([signal, new], ignore_index=True)
+            .sort_values(["symbol", "Date"], kind="mergesort")
+            .reset_index(drop=True)
+        )
+    return results
 
-    # results["find_slope_40"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(find_slope)(df=df.query(f'symbol == "{symbol}"'), num_periods=40)
-    #         for symbol in tqdm(symbols, desc="Find the 40 period slope")
-    #     )
-    # )
-    ic("Find slope 10")
-    results["find_slope_10"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: find_slope_(df=data, num_periods=10)
-    )
-    ic("Find slope 20")
-    results["find_slope_20"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: find_slope_(df=data, num_periods=20)
-    )
-    ic("Find slope 40")
-    results["find_slope_40"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: find_slope_(df=data, num_periods=40)
-    )
 
-    ic("Change ratio 1")
-    results["change_ratio_1"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: change_ratio(df=data, num_periods=1, col="Close")
-    )
-    ic("Change ratio 2")
-    results["change_ratio_2"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: change_ratio(df=data, num_periods=2, col="Close")
-    )
-    ic("Change ratio 5")
-    results["change_ratio_5"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: change_ratio(df=data, num_periods=5, col="Close")
-    )
-    ic("Change ratio 10")
-    results["change_ratio_10"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: change_ratio(df=data, num_periods=10, col="Close")
-    )
-    ic("Change ratio 20")
-    results["change_ratio_20"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: change_ratio(df=data, num_periods=20, col="Close")
-    )
+def calculations(
+    df: DataFrame,
+    n_jobs: int = 8,
+    calc_set: str = "D",
+    signals_path: Optional[Path] = None,
+    indicators: Optional[list[Indicator]] = None,
+    debug: bool = False,
+    index_prices: Optional[DataFrame] = None,
+) -> dict[DataFrame]:
+    """The results of the indicators over a frame of prices. The index closes are gathered from the index ETFs in the
+    frame, or from index_prices when they are not in it (a batch of a streamed run)."""
+    results = {}
 
-    # results["close_5_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=5)
-    #         for symbol in tqdm(symbols, desc="close_5_max")
-    #     )
-    # )
-    # results["close_10_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=10)
-    #         for symbol in tqdm(symbols, desc="close_10_max")
-    #     )
-    # )
-    # results["close_20_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=20)
-    #         for symbol in tqdm(symbols, desc="close_20_max")
-    #     )
-    # )
+    ic("Panel")
+    with measure("panel", calc_set=calc_set) as record:
+        panel = Panel(df=df)
+        record["rows"] = len(panel)
 
-    ic("Close max 2")
-    results["close_2_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="Close", periods=2)
-    )
-    ic("Close max 5")
-    results["close_5_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="Close", periods=5)
-    )
-    ic("Close max 10")
-    results["close_10_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="Close", periods=10)
-    )
-    ic("Close max 20")
-    results["close_20_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="Close", periods=20)
-    )
-    ic("Close max 40")
-    results["close_40_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="Close", periods=40)
-    )
+    ic("Index Close")
+    with measure("index_close", calc_set=calc_set) as record:
+        index_close, found = index_closes(panel=panel, index_prices=index_prices)
+        # every shard needs the closes, and the index ETFs may be in another shard
+        panel.df["index_close"] = index_close
+        results["index_close"] = panel.df.loc[found, ["symbol", "Date", "index_close"]].reset_index(drop=True)
+        record["rows"] = len(results["index_close"])
+
+    stored = stored_signals(signals_path=signals_path) if signals_path is not None else {}
+    if stored:
+        ic(f"Incremental indicators - {calc_set}")
+        with measure("incremental", calc_set=calc_set) as record:
+            incremental = incremental_calculations(panel=panel, stored=stored, indicators=indicators, debug=debug)
+            record["rows"] = rows(incremental or {})
+        if incremental is not None:
+            results.update(incremental)
+            return results
+        ic("Stored signals are incomplete, recomputing everything")
+
+    ic(f"Indicators - {calc_set}")
+    shards = shard_bounds(panel=panel, n_shards=max(n_jobs, 1))
+    if len(shards) <= 1:
+        with measure("shard", kind="shard", calc_set=calc_set, shard=0) as record:
+            results.update(calculate_shard(df=panel.df, calc_set=calc_set, indicators=indicators, debug=debug))
+            record["rows"] = len(panel)
+        return results
+
+    # Shards are contiguous runs of symbols, so concatenating them in order keeps the (symbol, Date) order
+    report = active_report()
+    if report is None:
+        shard_results = Parallel(n_jobs=min(n_jobs, len(shards)))(
+            delayed(calculate_shard)(df=panel.df.iloc[start:end], calc_set=calc_set, indicators=indicators, debug=debug)
+            for start, end in shards
+        )
+    else:
+        measured = Parallel(n_jobs=min(n_jobs, len(shards)))(
+            delayed(measured_shard)(
+                df=panel.df.iloc[start:end],
+                calc_set=calc_set,
+                indicators=indicators,
+                debug=debug,
+                shard=shard,
+                run_id=report.run_id,
+                profile=report.profile,
+            )
+            for shard, (start, end) in enumerate(shards)
+        )
+        shard_results = [shard_result for shard_result, _ in measured]
+        for _, records in measured:
+            report.add(records=records)
+    for key in shard_results[0]:
+        results[key] = concat([shard[key] for shard in shard_results], ignore_index=True)
 
-    # results["close_40_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=40)
-    #         for symbol in tqdm(symbols, desc="close_40_max")
-    #     )
-    # )
-    # results["high_5_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="High", periods=5)
-    #         for symbol in tqdm(symbols, desc="high_5_max")
-    #     )
-    # )
-    # results["high_10_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="High", periods=10)
-    #         for symbol in tqdm(symbols, desc="high_10_max")
-    #     )
-    # )
-    # results["high_20_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="High", periods=20)
-    #         for symbol in tqdm(symbols, desc="high_20_max")
-    #     )
-    # )
-    ic("High max 2")
-    results["high_2_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="High", periods=2)
-    )
-    ic("High max 5")
-    results["high_5_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="High", periods=5)
-    )
-    ic("High max 10")
-    results["high_10_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="High", periods=10)
-    )
-    ic("High max 20")
-    results["high_20_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="High", periods=20)
-    )
-    ic("High max 40")
-    results["high_40_max"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_max(df=data, value_col="High", periods=40)
-    )
+    return results
 
-    # results["high_40_max"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_max)(df=df.query(f'symbol == "{symbol}"'), value_col="High", periods=40)
-    #         for symbol in tqdm(symbols, desc="high_40_max")
-    #     )
-    # )
-    # results["close_5_end"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_end)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=5)
-    #         for symbol in tqdm(symbols, desc="close_5_end")
-    #     )
-    # )
-    # results["close_10_end"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_end)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=10)
-    #         for symbol in tqdm(symbols, desc="close_10_end")
-    #     )
-    # )
-    # results["close_20_end"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_end)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=20)
-    #         for symbol in tqdm(symbols, desc="close_20_end")
-    #     )
-    # )
-    ic("Close end 2")
-    results["close_2_end"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_end(df=data, value_col="Close", periods=2)
-    )
-    ic("Close end 5")
-    results["close_5_end"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_end(df=data, value_col="Close", periods=5)
-    )
-    ic("Close end 10")
-    results["close_10_end"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_end(df=data, value_col="Close", periods=10)
-    )
-    ic("Close end 20")
-    results["close_20_end"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_end(df=data, value_col="Close", periods=20)
-    )
-    ic("Close end 40")
-    results["close_40_end"] = df.groupby("symbol", group_keys=False).progress_apply(
-        lambda data: future_end(df=data, value_col="Close", periods=40)
-    )
-    # results["close_40_end"] = concat(
-    #     Parallel(n_jobs=n_jobs)(
-    #         delayed(future_end)(df=df.query(f'symbol == "{symbol}"'), value_col="Close", periods=40)
-    #         for symbol in tqdm(symbols, desc="close_40_end")
-    #     )
-    # )
 
-    return results
+def _row_positions(
+    result: DataFrame, symbols: ndarray, dates: ndarray, rows: MultiIndex, layouts: list[tuple]
+) -> Optional[ndarray]:
+    """Positions of the merged rows in a result, -1 where it has no row (as in a left merge), and None when the
+    result already has the merged rows in the same order. Row layouts already looked up are reused."""
+    result_symbols, result_dates = result["symbol"].to_numpy(), result["Date"].to_numpy()
+    for known_symbols, known_dates, positions in [(symbols, dates, None)] + layouts:
+        if (
+            len(known_symbols) == len(result_symbols)
+            and (known_symbols == result_symbols).all()
+            and (known_dates == result_dates).all()
+        ):
+            return positions
+    positions = MultiIndex.from_arrays([result_symbols, result_dates]).get_indexer(rows)
+    layouts.append((result_symbols, result_dates, positions))
+    return positions
+
+
+def _with_missing(values: ndarray, missing: ndarray) -> Union[ndarray, IntegerArray]:
+    """The values with the missing rows NaN, or NA for integer values (the int8 flags and int16 streaks), which are
+    kept in a nullable array of their own dtype instead of being cast to float64"""
+    if values.dtype.kind in "iu":
+        return IntegerArray(values, missing)
+    return where(missing, nan, values)
+
+
+def merged_signals(prices: DataFrame, results: dict[str, DataFrame], calc_set: str = "D") -> DataFrame:
+    """The prices with every per-bar result as extra columns, one row per (symbol, Date).
+
+    The results are in the (symbol, Date) order of the panel, so the frame is built once from their column arrays
+    without copying them, instead of merging each result on its keys. Results with other rows (the index closes, or
+    stored signals of symbols that are no longer priced) are aligned with one index lookup. Columns already in the
+    frame, such as Volume, are not repeated.
+    """
+    # the resident set size the memory watch polls, which unlike tracemalloc does not slow the threads of the other
+    # periods assembling theirs at the same time, and whose peak is of the whole process
+    with memory_watch().watch() as memory:
+        prices = prices.sort_values(["symbol", "Date"], kind="mergesort").reset_index(drop=True)
+        symbols, dates = prices["symbol"].to_numpy(), prices["Date"].to_numpy()
+        rows = MultiIndex.from_arrays([prices["symbol"], prices["Date"]])
+        columns = {col: prices[col].to_numpy() for col in prices.columns}
+        layouts = []
+        for key, result in results.items():
+            if key in SPARSE_RESULTS or key.endswith(STATE_SUFFIX):
+                continue
+            positions = _row_positions(result=result, symbols=symbols, dates=dates, rows=rows, layouts=layouts)
+            for col in result.columns:
+                if col in columns:
+                    continue
+                values = result[col].to_numpy()
+                if positions is None:
+                    columns[col] = values
+                else:
+                    missing = positions < 0
+                    columns[col] = _with_missing(values[positions], missing) if missing.any() else values[positions]
+        # one block per column, so building the frame does not copy the arrays into a consolidated block
+        merged = DataFrame(columns, copy=False)
+    ic(
+        f"Merged - {calc_set}: {merged.memory_usage(deep=True).sum() / 2**20:.1f} MB, "
+        f"peak RSS {memory['peak'] / 2**20:.1f} MB while assembling"
+    )
+    return merged
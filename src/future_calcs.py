@@ -1,5 +1,8 @@
 from pandas import DataFrame
+from numpy import array, isnan, where, nan, arange, int64
 from ta_utils import validate_columns
+from kernels import rolling_arg_extreme
+from panel import Panel
 
 
 def future_max(df: DataFrame, value_col: str = "Close", periods: int = 5) -> DataFrame:
@@ -27,3 +30,38 @@ def future_end(df: DataFrame, value_col: str = "Close", periods: int = 5) -> Dat
     df = df.assign(**{new_col: df[value_col].shift(periods)})
     df = df.assign(**{new_col_ratio: df[new_col] / df["Close"]})
     return df.loc[:, ["Date", "symbol", new_col, new_col_ratio]].sort_values(by="Date", ascending=True)
+
+
+def future_labels(
+    panel: Panel,
+    max_cols: list[str] = ["Close", "High"],
+    end_cols: list[str] = ["Close"],
+    horizons: list[int] = [2, 5, 10, 20, 40],
+) -> DataFrame:
+    """Forward max and end values with their close ratios for every column and horizon, as one frame"""
+
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Close"] + max_cols + end_cols)
+
+    close = panel.array("Close")
+    labels = {}
+
+    # A trailing window over the reversed rows is a forward window over the original rows
+    n = len(panel)
+    reversed_starts, reversed_ends = n - panel.ends, n - panel.starts
+    rows = arange(n, dtype=int64)
+    for value_col in max_cols:
+        values = panel.array(value_col)[::-1].copy()
+        ages = rolling_arg_extreme(values, reversed_starts, reversed_ends, array(horizons, dtype=int64), True)
+        for i, periods in enumerate(horizons):
+            found = ~isnan(ages[i])
+            future_max = where(found, values[where(found, rows - ages[i], 0).astype(int64)], nan)[::-1]
+            labels[f"{value_col}_{periods}_max"] = future_max
+            labels[f"{value_col}_{periods}_max_close_ratio"] = future_max / close
+
+    for value_col in end_cols:
+        for periods in horizons:
+            future_end = panel.shift(values=panel.array(value_col), periods=-periods)
+            labels[f"{value_col}_{periods}_end"] = future_end
+            labels[f"{value_col}_{periods}_end_close_ratio"] = future_end / close
+
+    return panel.df.loc[:, ["Date", "symbol"]].assign(**labels)
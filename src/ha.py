@@ -1,6 +1,9 @@
 from pandas import DataFrame
-from numpy import where
+from numpy import where, empty, zeros, float64, int64, array, nan, isnan
+from numba import njit
 from ta_utils import validate_columns
+from panel import Panel
+from kernels import trend_streaks, unseeded
 
 
 # def heikin_ashi(df: pls.DataFrame) -> pls.DataFrame:
@@ -32,6 +35,62 @@ from ta_utils import validate_columns
 #     return df.select(["Date", "symbol", "HA_Open", "HA_High", "HA_Low", "HA_Close", "Volume"])
 
 
+@njit(cache=True)
+def _heikin_ashi_kernel(open_, high, low, close, starts, ends, resume, seed):
+    """Heikin Ashi candles, signals and trend over flat arrays, restarting at every symbol boundary.
+
+    A symbol with a seed (1, then the open and close of its last candle) carries on from it at its resume row.
+    Returns the same state after the last row of every symbol too.
+    """
+    n = len(open_)
+    ha_open = empty(n, dtype=float64)
+    ha_high = empty(n, dtype=float64)
+    ha_low = empty(n, dtype=float64)
+    ha_close = empty(n, dtype=float64)
+    ha_signal = zeros(n, dtype=int64)
+    ha_trend = zeros(n, dtype=int64)
+    ha_open[:] = nan
+    ha_high[:] = nan
+    ha_low[:] = nan
+    ha_close[:] = nan
+    state = empty((len(starts), 3), dtype=float64)
+
+    for s in range(len(starts)):
+        seeded = not isnan(seed[s, 0])
+        first = resume[s] if seeded else starts[s]
+        prev_open, prev_close = (seed[s, 1], seed[s, 2]) if seeded else (nan, nan)
+        for i in range(first, ends[s]):
+            ha_close[i] = (open_[i] + high[i] + low[i] + close[i]) / 4
+            if i == starts[s] and not seeded:
+                ha_open[i] = open_[i]
+            else:
+                ha_open[i] = (prev_open + prev_close) / 2
+
+            # Same ordering as the builtin max/min so NaN inputs resolve identically
+            ha_high[i] = ha_open[i]
+            ha_low[i] = ha_open[i]
+            for value in (ha_close[i], low[i], high[i]):
+                if value > ha_high[i]:
+                    ha_high[i] = value
+                if value < ha_low[i]:
+                    ha_low[i] = value
+
+            is_increasing = ha_close[i] > ha_open[i]
+            is_increasing_yday = (i > starts[s] or seeded) and prev_close > prev_open
+            if is_increasing and not is_increasing_yday:
+                ha_signal[i] = 1
+            elif not is_increasing and is_increasing_yday:
+                ha_signal[i] = -1
+            else:
+                ha_signal[i] = 0
+
+            ha_trend[i] = 1 if ha_close[i] >= ha_open[i] else -1
+            prev_open, prev_close = ha_open[i], ha_close[i]
+        state[s, 0], state[s, 1], state[s, 2] = 1.0, prev_open, prev_close
+
+    return ha_open, ha_high, ha_low, ha_close, ha_signal, ha_trend, state
+
+
 def heikin_ashi(df: DataFrame) -> DataFrame:
     """Heikin Ashi Algorithm"""
 
@@ -41,19 +100,51 @@ def heikin_ashi(df: DataFrame) -> DataFrame:
 
     df = df.sort_values("Date", ascending=True).loc[:, cols].reset_index(drop=True)
 
-    df["HA_Close"] = df.loc[:, ["Open", "High", "Low", "Close"]].apply(sum, axis=1).divide(4)
-
-    df["HA_Open"] = float(0)
-    df.loc[0, "HA_Open"] = df.loc[0, "Open"]
-    for index in range(1, len(df)):
-        df.at[index, "HA_Open"] = (df["HA_Open"][index - 1] + df["HA_Close"][index - 1]) / 2
-
-    df["HA_High"] = df.loc[:, ["HA_Open", "HA_Close", "Low", "High"]].apply(max, axis=1)
-    df["HA_Low"] = df.loc[:, ["HA_Open", "HA_Close", "Low", "High"]].apply(min, axis=1)
+    ha_open, ha_high, ha_low, ha_close, *_ = _heikin_ashi_kernel(
+        df.Open.to_numpy(dtype=float64),
+        df.High.to_numpy(dtype=float64),
+        df.Low.to_numpy(dtype=float64),
+        df.Close.to_numpy(dtype=float64),
+        array([0], dtype=int64),
+        array([len(df)], dtype=int64),
+        array([0], dtype=int64),
+        unseeded(n_symbols=1, width=3),
+    )
+    df = df.assign(HA_Close=ha_close, HA_Open=ha_open, HA_High=ha_high, HA_Low=ha_low)
     df.name = "Heiken_Ashi"
     return df.loc[:, ["Date", "symbol", "HA_Open", "HA_High", "HA_Low", "HA_Close", "Volume"]]
 
 
+def heikin_ashi_panel(panel: Panel) -> DataFrame:
+    """Heikin Ashi candles and signals for every symbol of the panel in a single pass"""
+
+    validate_columns(
+        df_columns=panel.df.columns, required_columns=["Date", "symbol", "Open", "High", "Low", "Close", "Volume"]
+    )
+
+    ha_open, ha_high, ha_low, ha_close, ha_signal, ha_trend, state = _heikin_ashi_kernel(
+        panel.array("Open"),
+        panel.array("High"),
+        panel.array("Low"),
+        panel.array("Close"),
+        panel.starts,
+        panel.ends,
+        panel.resume,
+        panel.seed("heikin_ashi", width=3),
+    )
+    panel.keep("heikin_ashi", state)
+    return panel.df.loc[:, ["Date", "symbol"]].assign(
+        HA_Open=ha_open,
+        HA_High=ha_high,
+        HA_Low=ha_low,
+        HA_Close=ha_close,
+        Volume=panel.df["Volume"].to_numpy(),
+        HA_Signal=ha_signal,
+        HA_Trend=ha_trend,
+        HA_Streak=panel.streaks(names=["heikin_ashi:streak"], values=ha_trend)[:, 0],
+    )
+
+
 def heikin_ashi_signals(df: DataFrame) -> DataFrame:
     """Heiken Ashi Signals"""
 
@@ -66,7 +157,7 @@ def heikin_ashi_signals(df: DataFrame) -> DataFrame:
 
     df["HA_Signal"] = where(buy_signal == 1, buy_signal, sell_signal)
     df["HA_Trend"] = where(df["HA_Close"] >= df["HA_Open"], 1, -1)
-    df["HA_Streak"] = df["HA_Trend"].groupby((df["HA_Trend"] != df["HA_Trend"].shift()).cumsum()).cumcount() + 1
+    df["HA_Streak"] = trend_streaks(values=df["HA_Trend"].to_numpy(), starts=array([0]))[:, 0]
     df.name = "Heiken_Ashi_Signals"
     return df.loc[
         :,
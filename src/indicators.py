@@ -1,5 +1,6 @@
-from pandas import DataFrame, read_parquet, read_hdf, HDFStore, to_datetime, read_parquet
+from pandas import DataFrame, read_hdf, HDFStore, to_datetime
 from pathlib import Path
+from schema import read_frame
 from numpy import where
 
 
@@ -45,8 +46,7 @@ def make_indicators(path: Path, period: str, symbol: str, indicators: list[str])
 def ha_indicator(path: Path, period: str, symbol: str):
     """Heikin Ashi indicator"""
     df = (
-        read_parquet(path=path / f"signals/{period}/heikin_ashi.parquet")
-        .query(f'symbol == "{symbol}"')
+        read_frame(path=path / f"signals/{period}/heikin_ashi.parquet", filters=[("symbol", "==", symbol)])
         .loc[:, ["Date", "HA_Trend"]]
         .rename(columns={"HA_Trend": "value"})
     )
@@ -57,8 +57,7 @@ def ha_indicator(path: Path, period: str, symbol: str):
 def supertrend_indicator(path: Path, period: str, symbol: str):
     """Supertrend indicator"""
     df = (
-        read_parquet(path=path / f"signals/{period}/supertrend.parquet")
-        .query(f'symbol == "{symbol}"')
+        read_frame(path=path / f"signals/{period}/supertrend.parquet", filters=[("symbol", "==", symbol)])
         .loc[:, ["Date", "supertrend"]]
         .rename(columns={"supertrend": "value"})
     )
@@ -69,8 +68,7 @@ def supertrend_indicator(path: Path, period: str, symbol: str):
 def macd_indicator(path: Path, period: str, symbol: str):
     """MACD trend indicator"""
     df = (
-        read_parquet(path=path / f"signals/{period}/macd.parquet")
-        .query(f'symbol == "{symbol}"')
+        read_frame(path=path / f"signals/{period}/macd.parquet", filters=[("symbol", "==", symbol)])
         .loc[:, ["Date", "macdtrend"]]
         .rename(columns={"macdtrend": "value"})
     )
@@ -81,8 +79,7 @@ def macd_indicator(path: Path, period: str, symbol: str):
 def stochastic_rsi_indicator(path: Path, period: str, symbol: str):
     """Stochastic RSI trend indicator"""
     df = (
-        read_parquet(path=path / f"signals/{period}/stochastic_rsi.parquet")
-        .query(f'symbol == "{symbol}"')
+        read_frame(path=path / f"signals/{period}/stochastic_rsi.parquet", filters=[("symbol", "==", symbol)])
         .loc[:, ["Date", "stochastic_rsi_K", "stochastic_rsi_D", "stochastic_rsi_crossover"]]
         .rename(columns={"stochastic_rsi_crossover": "value"})
     )
@@ -92,11 +89,9 @@ def stochastic_rsi_indicator(path: Path, period: str, symbol: str):
 
 def sma_crossover_indicator(path: Path, period: str, symbol: str):
     """SMA Crossover indicator"""
-    df = (
-        read_parquet(path=path / f"signals/{period}/sma.parquet")
-        .query(f'symbol == "{symbol}"')
-        .loc[:, ["Date", "sma20", "sma50"]]
-    )
+    df = read_frame(path=path / f"signals/{period}/sma.parquet", filters=[("symbol", "==", symbol)]).loc[
+        :, ["Date", "sma20", "sma50"]
+    ]
     df["value"] = where(df["sma20"] >= df["sma50"], 1, -1)
     df.name = "SMA 20/50 Crossover"
     return df
@@ -0,0 +1,217 @@
+import json
+import os
+import sys
+import psutil
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Lock, Thread, get_ident, local
+from time import perf_counter, sleep, thread_time, time
+from typing import Iterator, Optional
+from numpy import ndarray
+from pandas import DataFrame
+
+
+# The report stages are recorded in, set by RunReport.active for the whole process
+_active = None
+# Stages open in each thread, as (name, labels), so nested records carry their parent and labels
+_open = local()
+
+
+class MemoryWatch:
+    """Polls the resident set size of this process from a background thread and keeps the peak of every open watch"""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peaks = {}
+        self.lock = Lock()
+        Thread(target=self._run, daemon=True).start()
+
+    def rss(self) -> int:
+        return self.process.memory_info().rss
+
+    def _run(self) -> None:
+        while True:
+            rss = self.rss()
+            with self.lock:
+                for token, peak in self.peaks.items():
+                    self.peaks[token] = max(peak, rss)
+            sleep(self.interval)
+
+    @contextmanager
+    def watch(self) -> Iterator[dict]:
+        """Yields a dict whose "peak" is the largest RSS seen while the block ran, set when it exits"""
+        token, result = object(), {}
+        with self.lock:
+            self.peaks[token] = self.rss()
+        try:
+            yield result
+        finally:
+            rss = self.rss()
+            with self.lock:
+                result["peak"] = max(self.peaks.pop(token), rss)
+            result["end"] = rss
+
+
+_memory_watch = None
+
+
+def memory_watch() -> MemoryWatch:
+    """The memory watch of this process, started on first use (worker processes start their own)"""
+    global _memory_watch
+    if _memory_watch is None or _memory_watch.process.pid != os.getpid():
+        _memory_watch = MemoryWatch()
+    return _memory_watch
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread at a fixed interval and counts the collapsed stacks, the input of flame graph
+    tools such as flamegraph.pl and speedscope"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "SamplingProfiler":
+        self.thread.start()
+        return self
+
+    def stop(self) -> dict[str, int]:
+        self.stopped.set()
+        self.thread.join()
+        return dict(self.stacks)
+
+
+class RunReport:
+    """Wall time, CPU time, peak RSS and output rows of every stage of a run.
+
+    CPU time is that of the thread running the stage, so a stage whose shards run in worker processes shows little
+    of it; the indicator records from the workers carry theirs. Stages named in profile are sampled by a
+    SamplingProfiler and their collapsed stacks are written next to the report.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, profile: Optional[list[str]] = None) -> None:
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.profile = list(profile or [])
+        self.records = []
+        self.lock = Lock()
+
+    @contextmanager
+    def active(self) -> Iterator["RunReport"]:
+        """Record the stages measured anywhere in this process in the report while the block runs"""
+        global _active
+        previous = _active
+        _active = self
+        try:
+            yield self
+        finally:
+            _active = previous
+
+    def add(self, records: list[dict]) -> None:
+        with self.lock:
+            self.records.extend(records)
+
+    def record(self, name: str, kind: str, **labels) -> dict:
+        """A new record, under the stages open in this thread and with their labels"""
+        parents = getattr(_open, "stages", [])
+        return {
+            "run_id": self.run_id,
+            "kind": kind,
+            "name": name,
+            "parent": "/".join(parent for parent, _ in parents),
+            **(parents[-1][1] if parents else {}),
+            **labels,
+            "pid": os.getpid(),
+            "start": time(),
+            "rows": None,
+        }
+
+    @contextmanager
+    def stage(self, name: str, kind: str = "stage", **labels) -> Iterator[dict]:
+        """Measure a block, yielding its record so the caller can set the rows it produced"""
+        parents = getattr(_open, "stages", [])
+        record = self.record(name=name, kind=kind, **labels)
+        labels = {**(parents[-1][1] if parents else {}), **labels}
+        _open.stages = parents + [(name, labels)]
+        profiler = SamplingProfiler(thread_id=get_ident()).start() if name in self.profile else None
+        start_wall, start_cpu = perf_counter(), thread_time()
+        try:
+            with memory_watch().watch() as memory:
+                yield record
+        finally:
+            record["wall_s"] = perf_counter() - start_wall
+            record["cpu_s"] = thread_time() - start_cpu
+            record["rss_peak_mb"] = memory["peak"] / 2**20
+            record["rss_mb"] = memory["end"] / 2**20
+            if profiler is not None:
+                record["profile"] = profiler.stop()
+            _open.stages = parents
+            self.add(records=[record])
+
+    def frame(self) -> DataFrame:
+        """One row per record, without the profiles"""
+        return DataFrame([{key: value for key, value in record.items() if key != "profile"} for record in self.records])
+
+    def write(self, path: Path) -> Path:
+        """Write the report as <run_id>.json and <run_id>.parquet, and each profile as a collapsed stack file"""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        records = []
+        for number, record in enumerate(self.records):
+            if "profile" in record:
+                profile_path = path / f"{self.run_id}_{number}_{record['name']}.collapsed"
+                profile_path.write_text("".join(f"{stack} {count}\n" for stack, count in record["profile"].items()))
+                record = {**record, "profile": str(profile_path)}
+            records.append(record)
+        (path / f"{self.run_id}.json").write_text(json.dumps({"run_id": self.run_id, "records": records}, default=str))
+        self.frame().to_parquet(path / f"{self.run_id}.parquet")
+        return path / f"{self.run_id}.json"
+
+
+def active_report() -> Optional[RunReport]:
+    return _active
+
+
+@contextmanager
+def measure(name: str, kind: str = "stage", **labels) -> Iterator[dict]:
+    """Measure a block in the active report. Yields the record to set the rows on, a throwaway dict when no report is
+    active"""
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, kind=kind, **labels) as record:
+        yield record
+
+
+def add_totals(name: str, kind: str, wall_s: float, cpu_s: float, rows: int) -> None:
+    """Record times summed over many calls, such as a per-symbol indicator over every symbol, in the active report"""
+    if _active is not None:
+        record = _active.record(name=name, kind=kind)
+        record.update(wall_s=wall_s, cpu_s=cpu_s, rows=rows)
+        _active.add(records=[record])
+
+
+def rows(result) -> int:
+    """Rows of a result: a frame, an array (its last axis holds the rows), or a dict or tuple of them"""
+    if isinstance(result, dict):
+        return sum(rows(value) for value in result.values())
+    if isinstance(result, tuple):
+        return rows(result[0]) if result else 0
+    if isinstance(result, ndarray):
+        return result.shape[-1] if result.ndim else 0
+    return len(result)
@@ -0,0 +1,144 @@
+from numpy import ndarray, array, int64, stack
+from panel import Panel, intermediate
+from kernels import (
+    BLOCK,
+    true_range,
+    wilder_atr,
+    wilder_rsi,
+    stochastic_fast,
+    block_sums,
+    sma_sweep,
+    stddev_sweep,
+    ema_sweep,
+)
+
+
+@intermediate("ohlc4")
+def ohlc4(panel: Panel) -> ndarray:
+    """Average of open, high, low and close"""
+    return (panel.array("Open") + panel.array("High") + panel.array("Low") + panel.array("Close")) / 4
+
+
+@intermediate("relative_performance")
+def relative_performance(panel: Panel) -> ndarray:
+    """Close as a percentage of the close of the symbol's index ETF"""
+    return panel.array("Close") / panel.array("index_close") * 100
+
+
+@intermediate("block_sums")
+def block_sums_(panel: Panel, col: str = "Close", size: int = BLOCK) -> tuple[ndarray, ndarray]:
+    """Per-symbol block sums of a column, shared by every partial window mean of it"""
+    return block_sums(panel.source(col), panel.starts, panel.ends, size)
+
+
+@intermediate("sma")
+def sma(panel: Panel, col: str = "Close", timeperiod: int = 20) -> ndarray:
+    """Simple moving average"""
+    name = f"sma:{col}:{timeperiod}"
+    out, state = sma_sweep(
+        panel.source(col), panel.starts, panel.ends, timeperiod, panel.resume, panel.seed(name, width=3)
+    )
+    panel.keep(name, state)
+    return out
+
+
+def _ema(panel: Panel, values: ndarray, names: list[str], timeperiods: tuple) -> ndarray:
+    """EMAs of the periods carried on from the seeded states of their names, one row per period"""
+    seed = stack([panel.seed(name, width=3) for name in names])
+    out, state = ema_sweep(values, panel.starts, panel.ends, array(timeperiods, dtype=int64), panel.resume, seed)
+    for name, ended in zip(names, state):
+        panel.keep(name, ended)
+    return out
+
+
+@intermediate("ema")
+def ema(panel: Panel, col: str = "Close", timeperiod: int = 20) -> ndarray:
+    """Exponential moving average"""
+    return _ema(panel, panel.source(col), names=[f"ema:{col}:{timeperiod}"], timeperiods=(timeperiod,))[0]
+
+
+@intermediate("ema_family")
+def ema_family(panel: Panel, col: str = "Close", timeperiods: tuple = (10, 20)) -> ndarray:
+    """Exponential moving averages of several periods from one sweep, one row per period"""
+    return _ema(panel, panel.source(col), names=[f"ema:{col}:{n}" for n in timeperiods], timeperiods=timeperiods)
+
+
+@intermediate("stddev")
+def stddev(panel: Panel, col: str = "Close", timeperiod: int = 20) -> ndarray:
+    """Rolling population standard deviation"""
+    name = f"stddev:{col}:{timeperiod}"
+    out, state = stddev_sweep(
+        panel.source(col), panel.starts, panel.ends, timeperiod, panel.resume, panel.seed(name, width=6)
+    )
+    panel.keep(name, state)
+    return out
+
+
+@intermediate("rsi")
+def rsi(panel: Panel, col: str = "Close", timeperiod: int = 14) -> ndarray:
+    """Relative strength index"""
+    name = f"rsi:{col}:{timeperiod}"
+    out, state = wilder_rsi(
+        panel.source(col), panel.starts, panel.ends, timeperiod, panel.resume, panel.seed(name, width=4)
+    )
+    panel.keep(name, state)
+    return out
+
+
+@intermediate("rsi_ema", inputs=lambda col, timeperiod, ema_length: [("rsi", {"col": col, "timeperiod": timeperiod})])
+def rsi_ema(panel: Panel, col: str = "Close", timeperiod: int = 14, ema_length: int = 10) -> ndarray:
+    """Exponential moving average of the RSI"""
+    return _ema(
+        panel,
+        panel.get("rsi", col=col, timeperiod=timeperiod),
+        names=[f"rsi_ema:{col}:{timeperiod}:{ema_length}"],
+        timeperiods=(ema_length,),
+    )[0]
+
+
+@intermediate(
+    "stochastic_rsi",
+    inputs=lambda col, timeperiod, fastk_period, fastd_period, fastd_matype: [
+        ("rsi", {"col": col, "timeperiod": timeperiod})
+    ],
+)
+def stochastic_rsi(
+    panel: Panel,
+    col: str = "Close",
+    timeperiod: int = 14,
+    fastk_period: int = 5,
+    fastd_period: int = 3,
+    fastd_matype: int = 0,
+) -> tuple[ndarray, ndarray]:
+    """Fast stochastic of the RSI, like STOCHRSI without recomputing the RSI"""
+    if fastd_matype != 0:
+        raise ValueError(f"fastd must be a simple moving average (fastd_matype 0), not matype {fastd_matype}")
+    name = f"stochastic_rsi:{col}:{timeperiod}:{fastk_period}:{fastd_period}"
+    fastk, fastd, state = stochastic_fast(
+        panel.get("rsi", col=col, timeperiod=timeperiod),
+        panel.starts,
+        panel.ends,
+        fastk_period,
+        fastd_period,
+        panel.resume,
+        panel.seed(name, width=fastk_period + fastd_period),
+    )
+    panel.keep(name, state)
+    return fastk, fastd
+
+
+@intermediate("true_range")
+def true_range_(panel: Panel) -> ndarray:
+    """True range, using the previous close of the same symbol"""
+    return true_range(panel.array("High"), panel.array("Low"), panel.array("Close"), panel.starts, panel.ends)
+
+
+@intermediate("atr", inputs=lambda timeperiod: [("true_range", {})])
+def atr(panel: Panel, timeperiod: int = 14) -> ndarray:
+    """Wilder average true range"""
+    name = f"atr:{timeperiod}"
+    out, state = wilder_atr(
+        panel.get("true_range"), panel.starts, panel.ends, timeperiod, panel.resume, panel.seed(name, width=3)
+    )
+    panel.keep(name, state)
+    return out
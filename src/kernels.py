@@ -0,0 +1,810 @@
+from numpy import (
+    empty,
+    nan,
+    float64,
+    isnan,
+    ndarray,
+    arange,
+    where,
+    maximum,
+    asarray,
+    zeros,
+    full,
+    int64,
+    degrees,
+    arctan,
+    nonzero,
+    repeat,
+    diff,
+    sqrt,
+    r_,
+)
+from numba import njit
+from typing import Optional
+
+
+@njit(cache=True)
+def true_range(high, low, close, starts, ends):
+    """True range per row, using the previous close of the same symbol only"""
+    out = empty(len(high), dtype=float64)
+    for s in range(len(starts)):
+        for i in range(starts[s], ends[s]):
+            out[i] = abs(high[i] - low[i])
+            if i > starts[s]:
+                # NaN-skipping max, the same as DataFrame.max(axis=1)
+                for value in (abs(high[i] - close[i - 1]), abs(close[i - 1] - low[i])):
+                    if isnan(out[i]) or value > out[i]:
+                        out[i] = value
+    return out
+
+
+@njit(cache=True)
+def ewm_mean(values, alpha, min_periods, starts, ends, resume, seed):
+    """Adjusted exponentially weighted mean per symbol, matching Series.ewm(alpha=alpha, min_periods=n).mean().
+
+    A symbol with a seed (observations, weighted mean and old weight, as OnlineEWM keeps them) carries on from it at
+    its resume row. Returns the means and the same state after the last row of every symbol.
+    """
+    out = empty(len(values), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 3), dtype=float64)
+    # pandas converts alpha to a centre of mass and back again
+    alpha = 1.0 / (1.0 + (1.0 / alpha - 1.0))
+    old_wt_factor = 1.0 - alpha
+    min_periods = max(min_periods, 1)
+    for s in range(len(starts)):
+        start = starts[s]
+        if isnan(seed[s, 0]):
+            if start == ends[s]:
+                state[s, 0], state[s, 1], state[s, 2] = seed[s, 0], seed[s, 1], seed[s, 2]
+                continue
+            weighted = values[start]
+            nobs = 0 if isnan(weighted) else 1
+            out[start] = weighted if nobs >= min_periods else nan
+            old_wt = 1.0
+            start += 1
+        else:
+            nobs, weighted, old_wt = int(seed[s, 0]), seed[s, 1], seed[s, 2]
+            start = resume[s]
+        for i in range(start, ends[s]):
+            cur = values[i]
+            is_observation = not isnan(cur)
+            nobs += is_observation
+            if not isnan(weighted):
+                old_wt *= old_wt_factor
+                if is_observation:
+                    if weighted != cur:
+                        weighted = old_wt * weighted + cur
+                        weighted /= old_wt + 1.0
+                    old_wt += 1.0
+            elif is_observation:
+                weighted = cur
+            out[i] = weighted if nobs >= min_periods else nan
+        state[s, 0], state[s, 1], state[s, 2] = nobs, weighted, old_wt
+    return out, state
+
+
+def unseeded(n_symbols: int, width: int) -> ndarray:
+    """Seeds of symbols that all start from their first row"""
+    return full((n_symbols, width), nan, dtype=float64)
+
+
+def _carried_resets(reset: ndarray, starts: ndarray, resume: ndarray, carried: ndarray) -> ndarray:
+    """Rows of the seeded symbols (a carried value per column, NaN for none) whose streak goes on from the seed"""
+    ends = r_[starts[1:], len(reset)]
+    forced = zeros(reset.shape, dtype=bool)
+    has_rows = resume < ends
+    symbols, columns = nonzero(~isnan(carried) & has_rows[:, None])
+    forced[resume[symbols], columns] = ~reset[resume[symbols], columns]
+    return forced
+
+
+def streak_lengths(
+    reset: ndarray, starts: ndarray, resume: Optional[ndarray] = None, carried: Optional[ndarray] = None
+) -> ndarray:
+    """Rows since the last reset for every column, restarting at each symbol start.
+
+    A symbol with a carried length per column (NaN when it has none) carries on from its resume row as if the row
+    before had that length, so its rows before resume are not read.
+    """
+    reset = asarray(reset, dtype=bool).reshape(len(reset), -1).copy()
+    forced = None
+    if carried is not None:
+        carried = asarray(carried, dtype=float64).reshape(len(starts), -1)
+        # before the resets at the symbol starts, as a seeded symbol may resume on its first row
+        forced = _carried_resets(reset=reset, starts=starts, resume=resume, carried=carried)
+    reset[starts] = True
+    if forced is not None:
+        reset |= forced
+    rows = arange(len(reset), dtype=int64)[:, None]
+    last = maximum.accumulate(where(reset, rows, 0), axis=0)
+    lengths = rows - last
+    if forced is not None:
+        symbol = repeat(arange(len(starts), dtype=int64), diff(r_[starts, len(reset)]))
+        columns = arange(reset.shape[1], dtype=int64)[None, :]
+        inherited = forced[last, columns]
+        lengths[inherited] += (carried[symbol[:, None], columns][inherited] + 1).astype(int64)
+    return lengths
+
+
+def trend_streaks(
+    values: ndarray,
+    starts: ndarray,
+    resume: Optional[ndarray] = None,
+    previous: Optional[ndarray] = None,
+    lengths: Optional[ndarray] = None,
+) -> ndarray:
+    """Length of the current run of equal values, starting at 1.
+
+    A symbol with the previous value and length of every column (NaN lengths when it has none) carries on from them at
+    its resume row, as OnlineTrendStreak does.
+    """
+    values = asarray(values).reshape(len(values), -1)
+    changed = zeros(values.shape, dtype=bool)
+    changed[1:] = values[1:] != values[:-1]
+    carried = None
+    if lengths is not None:
+        carried = asarray(lengths, dtype=float64).reshape(len(starts), -1) - 1
+        symbols, columns = nonzero(~isnan(carried) & (resume < r_[starts[1:], len(values)])[:, None])
+        rows = resume[symbols]
+        changed[rows, columns] = values[rows, columns] != asarray(previous).reshape(len(starts), -1)[symbols, columns]
+    return streak_lengths(reset=changed, starts=starts, resume=resume, carried=carried) + 1
+
+
+def threshold_streaks(
+    values: ndarray,
+    starts: ndarray,
+    threshold: float = 1.0,
+    resume: Optional[ndarray] = None,
+    previous: Optional[ndarray] = None,
+    lengths: Optional[ndarray] = None,
+) -> ndarray:
+    """Periods since the values last crossed the threshold, 0 on a cross or a missing value.
+
+    A symbol with the previous value and length of every column (NaN lengths when it has none) carries on from them at
+    its resume row, as OnlineThresholdStreak does.
+    """
+    values = asarray(values, dtype=float64).reshape(len(values), -1)
+    above = values >= threshold
+    below = values < threshold
+    crossed = zeros(values.shape, dtype=bool)
+    crossed[1:] = (above[1:] & below[:-1]) | (below[1:] & above[:-1])
+    if lengths is not None:
+        lengths = asarray(lengths, dtype=float64).reshape(len(starts), -1)
+        symbols, columns = nonzero(~isnan(lengths) & (resume < r_[starts[1:], len(values)])[:, None])
+        rows = resume[symbols]
+        before = asarray(previous, dtype=float64).reshape(len(starts), -1)[symbols, columns]
+        crossed[rows, columns] = (above[rows, columns] & (before < threshold)) | (
+            below[rows, columns] & (before >= threshold)
+        )
+    return streak_lengths(reset=crossed | isnan(values), starts=starts, resume=resume, carried=lengths)
+
+
+@njit(cache=True)
+def rolling_arg_extreme(values, starts, ends, windows, find_max):
+    """Periods since the most recent min (or max) of each trailing window, one row per window.
+
+    Every window length is tracked with its own monotonic deque during a single sweep over each symbol, so the
+    cost is O(n) per window. Windows that are incomplete or contain a missing value are NaN.
+    """
+    n_windows = len(windows)
+    out = empty((n_windows, len(values)), dtype=float64)
+    deques = empty((n_windows, windows.max()), dtype=int64)
+    heads = empty(n_windows, dtype=int64)
+    sizes = empty(n_windows, dtype=int64)
+    for s in range(len(starts)):
+        heads[:] = 0
+        sizes[:] = 0
+        last_nan = starts[s] - 1
+        for i in range(starts[s], ends[s]):
+            value = values[i]
+            if isnan(value):
+                last_nan = i
+                sizes[:] = 0
+                out[:, i] = nan
+                continue
+            for w in range(n_windows):
+                window = windows[w]
+                deque = deques[w]
+                # drop the front once it slides out of the window
+                if sizes[w] > 0 and deque[heads[w]] <= i - window:
+                    heads[w] = (heads[w] + 1) % window
+                    sizes[w] -= 1
+                # drop older values that can no longer be the (most recent) extreme
+                while sizes[w] > 0:
+                    back = deque[(heads[w] + sizes[w] - 1) % window]
+                    if (values[back] <= value) if find_max else (values[back] >= value):
+                        sizes[w] -= 1
+                    else:
+                        break
+                deque[(heads[w] + sizes[w]) % window] = i
+                sizes[w] += 1
+                if i - starts[s] + 1 < window or i - last_nan < window:
+                    out[w, i] = nan
+                else:
+                    out[w, i] = i - deque[heads[w]]
+    return out
+
+
+@njit(cache=True)
+def wilder_atr(tr, starts, ends, timeperiod, resume, seed):
+    """Wilder-smoothed average true range per symbol, seeded with the mean of the first n ranges like TA-Lib.
+
+    The first row of each symbol has no previous close, so its range is left out of the average. A symbol with a seed
+    (the ranges counted, -1 before the first row, their total and the average) carries on from it at its resume row.
+    Returns the averages and the same state after the last row of every symbol.
+    """
+    out = empty(len(tr), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 3), dtype=float64)
+    for s in range(len(starts)):
+        if isnan(seed[s, 0]):
+            first, count, total, prev = starts[s], -1, 0.0, nan
+        else:
+            first, count, total, prev = resume[s], int(seed[s, 0]), seed[s, 1], seed[s, 2]
+        for i in range(first, ends[s]):
+            if count == -1:
+                count = 0
+            elif count < timeperiod:
+                # leading missing ranges are skipped
+                if count == 0 and isnan(tr[i]):
+                    continue
+                total += tr[i]
+                count += 1
+                if count == timeperiod:
+                    prev = total / timeperiod
+                    out[i] = prev
+            else:
+                prev *= timeperiod - 1
+                prev += tr[i]
+                prev /= timeperiod
+                out[i] = prev
+        state[s, 0], state[s, 1], state[s, 2] = count, total, prev
+    return out, state
+
+
+@njit(cache=True)
+def wilder_rsi(values, starts, ends, timeperiod, resume, seed):
+    """Wilder RSI per symbol, matching talib.RSI.
+
+    A symbol with a seed (the changes counted, -1 before the first value, the previous value and the average gain and
+    loss, as OnlineRSI keeps them) carries on from it at its resume row. Returns the RSI and the same state after the
+    last row of every symbol.
+    """
+    out = empty(len(values), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 4), dtype=float64)
+    inverse = 1.0 / timeperiod
+    for s in range(len(starts)):
+        if isnan(seed[s, 0]):
+            first, count, prev_value, gain, loss = starts[s], -1, nan, 0.0, 0.0
+        else:
+            first, count, prev_value, gain, loss = resume[s], int(seed[s, 0]), seed[s, 1], seed[s, 2], seed[s, 3]
+        for i in range(first, ends[s]):
+            value = values[i]
+            if count == -1:
+                # leading missing values are skipped
+                if not isnan(value):
+                    prev_value = value
+                    count = 0
+                continue
+            change = value - prev_value
+            prev_value = value
+            # TA-Lib's branchless split, which sends a missing change to the loss only
+            up = change if change > 0 else 0.0
+            if count >= timeperiod:
+                gain *= timeperiod - 1
+                loss *= timeperiod - 1
+            gain += up
+            loss = (up - change) + loss
+            count += 1
+            if count < timeperiod:
+                continue
+            # TA-Lib multiplies by the reciprocal of the period rather than dividing by it
+            gain *= inverse
+            loss *= inverse
+            total = loss + gain
+            out[i] = gain / total * 100.0 if total > 0 else 0.0
+        state[s, 0], state[s, 1], state[s, 2], state[s, 3] = count, prev_value, gain, loss
+    return out, state
+
+
+@njit(cache=True)
+def stochastic_fast(values, starts, ends, fastk_period, fastd_period, resume, seed):
+    """Fast stochastic of a series against its own trailing range per symbol, like talib.STOCHF with the series as
+    high, low and close and a simple moving average for fastd.
+
+    The fastk window is scanned (it is a few rows wide, where a scan is faster than keeping monotonic deques) and fastd
+    is TA-Lib's running sum of the fastk values, so both match TA-Lib and start fastk_period + fastd_period - 2 rows
+    after the first value. A window with a missing value is NaN. A symbol with a seed (the values counted up to those
+    rows plus one, the running fastd total, then the last fastk_period - 1 values and the last fastd_period - 1 fastk
+    values) carries on from it at its resume row. Returns fastk, fastd and the same state after the last row of every
+    symbol.
+    """
+    n_values = fastk_period - 1
+    n_ks = fastd_period - 1
+    filled = fastk_period + fastd_period - 1
+    fastk = empty(len(values), dtype=float64)
+    fastd = empty(len(values), dtype=float64)
+    fastk[:] = nan
+    fastd[:] = nan
+    state = empty((len(starts), 2 + n_values + n_ks), dtype=float64)
+    # the seeded values and fastk values come first, then those of the symbol's rows
+    offset = max(fastk_period, fastd_period)
+    longest = offset + (ends - starts).max() if len(starts) > 0 else offset
+    series = empty(longest, dtype=float64)
+    ks = empty(longest, dtype=float64)
+    for s in range(len(starts)):
+        series[:offset] = nan
+        ks[:offset] = nan
+        if isnan(seed[s, 0]):
+            first, count, total = starts[s], 0, 0.0
+        else:
+            first, count, total = resume[s], int(seed[s, 0]), seed[s, 1]
+            series[offset - n_values : offset] = seed[s, 2 : 2 + n_values]
+            ks[offset - n_ks : offset] = seed[s, 2 + n_values :]
+        last_missing = -1
+        for back in range(offset - n_values, offset):
+            if isnan(series[back]):
+                last_missing = back
+        at = offset - 1
+        for i in range(first, ends[s]):
+            value = values[i]
+            if count == 0 and isnan(value):
+                # leading missing values are skipped
+                continue
+            at += 1
+            count = min(count + 1, filled)
+            series[at] = value
+            if isnan(value):
+                last_missing = at
+            if count < fastk_period:
+                continue
+            if at - last_missing < fastk_period:
+                k = nan
+            else:
+                highest, lowest = value, value
+                for back in range(at - n_values, at):
+                    if series[back] > highest:
+                        highest = series[back]
+                    if series[back] < lowest:
+                        lowest = series[back]
+                spread = highest - lowest
+                # TA-Lib's zero test of the spread, relative to the size of the values
+                if (abs(highest) + abs(lowest)) * 1e-14 < abs(spread):
+                    k = (value - lowest) / spread * 100.0
+                else:
+                    k = 0.0
+            ks[at] = k
+            total += k
+            if count < filled:
+                continue
+            fastk[i] = k
+            fastd[i] = total / fastd_period
+            total -= ks[at - n_ks]
+        state[s, 0], state[s, 1] = count, total
+        state[s, 2 : 2 + n_values] = series[at - n_values + 1 : at + 1]
+        state[s, 2 + n_values :] = ks[at - n_ks + 1 : at + 1]
+    return fastk, fastd, state
+
+
+# the EMA steps fuse into multiply-adds where the CPU has them, as TA-Lib picks its FMA build there
+@njit(cache=True, fastmath={"contract"})
+def macd_sweep(values, starts, ends, fastperiod, slowperiod, signalperiod, resume, seed):
+    """MACD, signal and histogram per symbol, matching talib.MACD.
+
+    The slow EMA is seeded with the mean of the first slowperiod values and the fast one with the mean of the last
+    fastperiod of them, and nothing is reported until the signal line is seeded, as in TA-Lib. A symbol with a seed
+    (the values counted, the fast and slow EMAs, the signal's count, total and value, the last reported MACD and the
+    values buffered until the slow EMA is seeded) carries on from it at its resume row, whose previous row gets the
+    seeded MACD. Returns the three series and the same state after the last row of every symbol.
+    """
+    if slowperiod < fastperiod:
+        fastperiod, slowperiod = slowperiod, fastperiod
+    k_fast = 2.0 / (fastperiod + 1)
+    k_slow = 2.0 / (slowperiod + 1)
+    k_signal = 2.0 / (signalperiod + 1)
+    macd_out = empty(len(values), dtype=float64)
+    signal_out = empty(len(values), dtype=float64)
+    hist_out = empty(len(values), dtype=float64)
+    macd_out[:] = nan
+    signal_out[:] = nan
+    hist_out[:] = nan
+    state = empty((len(starts), 7 + slowperiod), dtype=float64)
+    for s in range(len(starts)):
+        buffer = empty(slowperiod, dtype=float64)
+        buffer[:] = nan
+        if isnan(seed[s, 0]):
+            first, count, fast, slow = starts[s], 0, nan, nan
+            signal_count, signal_total, signal, reported = 0, 0.0, nan, nan
+        else:
+            first, count, fast, slow = resume[s], int(seed[s, 0]), seed[s, 1], seed[s, 2]
+            signal_count, signal_total, signal, reported = int(seed[s, 3]), seed[s, 4], seed[s, 5], seed[s, 6]
+            buffer[:] = seed[s, 7 : 7 + slowperiod]
+            if first > starts[s]:
+                macd_out[first - 1] = reported
+        for i in range(first, ends[s]):
+            value = values[i]
+            reported = nan
+            if count < slowperiod:
+                # leading missing values are skipped
+                if count == 0 and isnan(value):
+                    continue
+                buffer[count] = value
+                count += 1
+                if count < slowperiod:
+                    continue
+                total = 0.0
+                for j in range(slowperiod):
+                    total += buffer[j]
+                slow = total / slowperiod
+                total = 0.0
+                for j in range(slowperiod - fastperiod, slowperiod):
+                    total += buffer[j]
+                fast = total / fastperiod
+            else:
+                fast = ((value - fast) * k_fast) + fast
+                slow = ((value - slow) * k_slow) + slow
+            macd = fast - slow
+            if signal_count < signalperiod:
+                signal_total += macd
+                signal_count += 1
+                if signal_count < signalperiod:
+                    continue
+                signal = signal_total / signalperiod
+            else:
+                signal = ((macd - signal) * k_signal) + signal
+            reported = macd
+            macd_out[i] = macd
+            signal_out[i] = signal
+            hist_out[i] = macd - signal
+        state[s, 0], state[s, 1], state[s, 2] = count, fast, slow
+        state[s, 3], state[s, 4], state[s, 5], state[s, 6] = signal_count, signal_total, signal, reported
+        state[s, 7:] = buffer
+    return macd_out, signal_out, hist_out, state
+
+
+@njit(cache=True)
+def obv_sweep(close, volume, starts, ends, resume, seed):
+    """On balance volume per symbol, matching talib.OBV from the first row with both a close and a volume.
+
+    A symbol with a seed (1 once started, else 0, the previous close and the OBV) carries on from it at its resume
+    row. Returns the OBV and the same state after the last row of every symbol.
+    """
+    out = empty(len(close), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 3), dtype=float64)
+    for s in range(len(starts)):
+        if isnan(seed[s, 0]):
+            first, started, prev_close, value = starts[s], False, nan, nan
+        else:
+            first, started, prev_close, value = resume[s], seed[s, 0] > 0, seed[s, 1], seed[s, 2]
+        for i in range(first, ends[s]):
+            if not started:
+                if isnan(close[i]) or isnan(volume[i]):
+                    continue
+                started = True
+                value = volume[i]
+            elif close[i] > prev_close:
+                value += volume[i]
+            elif close[i] < prev_close:
+                value -= volume[i]
+            prev_close = close[i]
+            out[i] = value
+        state[s, 0], state[s, 1], state[s, 2] = 1.0 if started else 0.0, prev_close, value
+    return out, state
+
+
+@njit(cache=True)
+def _compensated(total, compensation, value):
+    """Neumaier's compensated sum: the total plus the value, and the rounding error kept apart from the total"""
+    added = total + value
+    if abs(total) >= abs(value):
+        compensation += (total - added) + value
+    else:
+        compensation += (value - added) + total
+    return added, compensation
+
+
+# state columns of rolling_regression before the last values of the window
+REGRESSION_SUMS = 7
+
+
+@njit(cache=True)
+def rolling_regression(values, starts, ends, windows, resume, seed):
+    """Rolling least squares fit of every trailing window, one row per window.
+
+    Returns the slope per bar, the intercept (fitted value at the oldest bar of the window), the fitted value at
+    the current bar and the population stddev of the residuals. Windows that are incomplete or contain a missing
+    value are NaN. A window is fitted from its own values when it fills, after which its mean, the sum of squared
+    deviations from it and the co-moment with the centred bar numbers slide along with one value in and one out, in
+    compensated sums. A symbol with a seed (per window, the values counted since the last missing one up to the
+    window, the three sums and their compensations, then the last window values, padded to the widest window) carries
+    on from it at its resume row. Returns the fits and the same state after the last row of every symbol.
+    """
+    n_windows = len(windows)
+    slope = empty((n_windows, len(values)), dtype=float64)
+    intercept = empty((n_windows, len(values)), dtype=float64)
+    fitted = empty((n_windows, len(values)), dtype=float64)
+    resid_std = empty((n_windows, len(values)), dtype=float64)
+    slope[:] = nan
+    intercept[:] = nan
+    fitted[:] = nan
+    resid_std[:] = nan
+    state = empty((n_windows, len(starts), seed.shape[2]), dtype=float64)
+    state[:] = nan
+    # the seeded values come first, then those of the symbol's rows
+    offset = windows.max() if n_windows > 0 else 0
+    longest = offset + (ends - starts).max() if len(starts) > 0 else offset
+    series = empty(longest, dtype=float64)
+    for w in range(n_windows):
+        window = windows[w]
+        # x runs 0..window-1 from the oldest bar of the window
+        centre = (window - 1) / 2.0
+        sxx = window * (window * window - 1) / 12.0
+        for s in range(len(starts)):
+            series[:offset] = nan
+            if isnan(seed[w, s, 0]):
+                first, count = starts[s], 0
+                mean, squares, moment = 0.0, 0.0, 0.0
+                mean_error, squares_error, moment_error = 0.0, 0.0, 0.0
+            else:
+                first, count = resume[s], int(seed[w, s, 0])
+                mean, squares, moment = seed[w, s, 1], seed[w, s, 2], seed[w, s, 3]
+                mean_error, squares_error, moment_error = seed[w, s, 4], seed[w, s, 5], seed[w, s, 6]
+                series[offset - window : offset] = seed[w, s, REGRESSION_SUMS : REGRESSION_SUMS + window]
+            at = offset - 1
+            for i in range(first, ends[s]):
+                value = values[i]
+                at += 1
+                series[at] = value
+                if isnan(value):
+                    count = 0
+                    continue
+                if count == window:
+                    # slide the window on by one value
+                    leaving = series[at - window]
+                    previous = mean + mean_error
+                    mean, mean_error = _compensated(mean, mean_error, (value - leaving) / window)
+                    squares, squares_error = _compensated(
+                        squares, squares_error, (value - leaving) * (value - (mean + mean_error) + leaving - previous)
+                    )
+                    moment, moment_error = _compensated(
+                        moment, moment_error, (centre + 1) * (leaving - previous) + centre * (value - previous)
+                    )
+                else:
+                    count += 1
+                    if count < window:
+                        continue
+                    # fit the window from its own values once it fills
+                    total = 0.0
+                    for j in range(window):
+                        total += series[at - window + 1 + j]
+                    mean, squares, moment = total / window, 0.0, 0.0
+                    for j in range(window):
+                        deviation = series[at - window + 1 + j] - mean
+                        squares += deviation * deviation
+                        moment += (j - centre) * deviation
+                    mean_error, squares_error, moment_error = 0.0, 0.0, 0.0
+                b = (moment + moment_error) / sxx
+                a = mean + mean_error - b * centre
+                slope[w, i] = b
+                intercept[w, i] = a
+                fitted[w, i] = a + b * (window - 1)
+                resid_std[w, i] = sqrt(max(squares + squares_error - b * (moment + moment_error), 0.0) / window)
+            state[w, s, 0], state[w, s, 1], state[w, s, 2], state[w, s, 3] = count, mean, squares, moment
+            state[w, s, 4], state[w, s, 5], state[w, s, 6] = mean_error, squares_error, moment_error
+            state[w, s, REGRESSION_SUMS : REGRESSION_SUMS + window] = series[at - window + 1 : at + 1]
+    return slope, intercept, fitted, resid_std, state
+
+
+def regression_angle(slope: ndarray) -> ndarray:
+    """Angle of a slope in degrees, scaled to -1..1"""
+    return degrees(arctan(slope)) / 90
+
+
+# rows summed directly into each block of block_sums, the windows of window_means are added up from blocks
+BLOCK = 16
+
+
+@njit(cache=True)
+def block_sums(values, starts, ends, size):
+    """Sum and count of the non-missing values among each row and the size - 1 rows before it in the same symbol.
+
+    Every block is summed from its own values instead of differencing running sums, so a window added up from
+    whole blocks is the same however far back the panel starts.
+    """
+    sums = empty(len(values), dtype=float64)
+    counts = empty(len(values), dtype=int64)
+    for s in range(len(starts)):
+        for i in range(starts[s], ends[s]):
+            total = 0.0
+            n = 0
+            for j in range(max(i - size + 1, starts[s]), i + 1):
+                if not isnan(values[j]):
+                    total += values[j]
+                    n += 1
+            sums[i] = total
+            counts[i] = n
+    return sums, counts
+
+
+@njit(cache=True)
+def window_means(values, sums, counts, starts, ends, window, size, partial):
+    """Trailing means of a window per symbol from the block_sums of the given size, NaN where the window is
+    incomplete or has a missing value. partial averages up to a window of values instead, skipping the missing ones
+    like rolling(min_periods=1).mean().
+
+    A row's mean only reads the rows of its own window, whole blocks ending at the row and the rest one by one, so
+    an incremental run that starts a window earlier reproduces it exactly.
+    """
+    out = empty(len(values), dtype=float64)
+    out[:] = nan
+    for s in range(len(starts)):
+        for i in range(starts[s], ends[s]):
+            span = min(window, i - starts[s] + 1)
+            if span < window and not partial:
+                continue
+            total = 0.0
+            n = 0
+            last = i
+            for _ in range(span // size):
+                total += sums[last]
+                n += counts[last]
+                last -= size
+            for j in range(i - span + 1, last + 1):
+                if not isnan(values[j]):
+                    total += values[j]
+                    n += 1
+            if partial:
+                if n > 0:
+                    out[i] = total / n
+            elif n == window:
+                out[i] = total / window
+    return out
+
+
+@njit(cache=True)
+def sma_sweep(values, starts, ends, timeperiod, resume, seed):
+    """Simple moving average per symbol, matching talib.SMA.
+
+    The window is TA-Lib's running total, adding each value and taking off the one leaving the window, so the sums
+    are the same as TA-Lib's from the first value of each symbol. Leading NaNs of each symbol are skipped and a later
+    one carries through the total as it does in TA-Lib. A symbol with a seed (the values counted up to timeperiod, the
+    running total and the last mean) carries on from it at its resume row, which needs the timeperiod - 1 rows before
+    it, and whose previous row gets the seeded mean. Returns the means and the same state after the last row of every
+    symbol.
+    """
+    out = empty(len(values), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 3), dtype=float64)
+    for s in range(len(starts)):
+        if isnan(seed[s, 0]):
+            first, count, total, mean = starts[s], 0, 0.0, nan
+        else:
+            first, count, total, mean = resume[s], int(seed[s, 0]), seed[s, 1], seed[s, 2]
+            if first > starts[s]:
+                out[first - 1] = mean
+        for i in range(first, ends[s]):
+            if count == 0 and isnan(values[i]):
+                continue
+            total += values[i]
+            count = min(count + 1, timeperiod)
+            if count == timeperiod:
+                mean = total / timeperiod
+                out[i] = mean
+                total -= values[i - timeperiod + 1]
+        state[s, 0], state[s, 1], state[s, 2] = count, total, mean
+    return out, state
+
+
+@njit(cache=True)
+def stddev_sweep(values, starts, ends, timeperiod, resume, seed):
+    """Population standard deviation per symbol, matching talib.STDDEV with nbdev 1.
+
+    As in TA-Lib, the sums of the values and their squares are kept around a shift, first the symbol's first value,
+    and are summed again around the mean of the window whenever the variance loses precision against them, a leaving
+    square dwarfs them or 32 windows have passed. A symbol with a seed (the values counted up to timeperiod, the
+    shift, both sums, the windows left until the next re-sum and the last deviation) carries on from it at its resume
+    row, which needs the timeperiod - 1 rows before it, and whose previous row gets the seeded deviation. Returns the
+    deviations and the same state after the last row of every symbol.
+    """
+    out = empty(len(values), dtype=float64)
+    out[:] = nan
+    state = empty((len(starts), 6), dtype=float64)
+    inverse = 1.0 / timeperiod
+    for s in range(len(starts)):
+        if isnan(seed[s, 0]):
+            first, count, shift, total, squares = starts[s], 0, nan, 0.0, 0.0
+            countdown, deviation = 32 * timeperiod, nan
+        else:
+            first, count, shift, total, squares = resume[s], int(seed[s, 0]), seed[s, 1], seed[s, 2], seed[s, 3]
+            countdown, deviation = int(seed[s, 4]), seed[s, 5]
+            if first > starts[s]:
+                out[first - 1] = deviation
+        for i in range(first, ends[s]):
+            value = values[i]
+            if count == 0:
+                # leading missing values are skipped
+                if isnan(value):
+                    continue
+                shift = value
+            difference = value - shift
+            total += difference
+            squares += difference * difference
+            if count < timeperiod - 1:
+                count += 1
+                continue
+            count = timeperiod
+            mean = inverse * total
+            variance = inverse * squares - mean * mean
+            leaving = values[i - timeperiod + 1] - shift
+            squares -= leaving * leaving
+            resum = inverse * squares * 0.000001 > variance or leaving * leaving > squares * 1000000.0
+            if not resum:
+                countdown -= 1
+                resum = countdown == 0
+            if resum:
+                shift = 0.0
+                for j in range(i - timeperiod + 1, i + 1):
+                    shift += values[j]
+                shift *= inverse
+                total = 0.0
+                squares = 0.0
+                for j in range(i - timeperiod + 1, i + 1):
+                    difference = values[j] - shift
+                    total += difference
+                    squares += difference * difference
+                mean = inverse * total
+                variance = inverse * squares - mean * mean
+                if variance < inverse * squares * 1e-12:
+                    variance = 0.0
+                leaving = values[i - timeperiod + 1] - shift
+                squares -= leaving * leaving
+                countdown = 32 * timeperiod
+            total -= leaving
+            deviation = sqrt(variance)
+            out[i] = deviation
+        state[s, 0], state[s, 1], state[s, 2], state[s, 3] = count, shift, total, squares
+        state[s, 4], state[s, 5] = countdown, deviation
+    return out, state
+
+
+# the EMA steps fuse into multiply-adds where the CPU has them, as TA-Lib picks its FMA build there
+@njit(cache=True, fastmath={"contract"})
+def ema_sweep(values, starts, ends, timeperiods, resume, seed):
+    """EMAs of several periods in one sweep, one row per period, seeded with the SMA of the first n values like TA-Lib.
+
+    Leading NaNs of each symbol are skipped, later ones carry through the recursion as they do in TA-Lib. A symbol with
+    a seed per period (the values counted, their total and the EMA, as OnlineEMA keeps them) carries on from it at its
+    resume row, whose previous row gets the seeded EMA. Returns the EMAs and the same state after the last row of
+    every symbol, one row per period.
+    """
+    n_periods = len(timeperiods)
+    out = empty((n_periods, len(values)), dtype=float64)
+    out[:] = nan
+    state = empty((n_periods, len(starts), 3), dtype=float64)
+    for s in range(len(starts)):
+        for p in range(n_periods):
+            timeperiod = timeperiods[p]
+            k = 2.0 / (timeperiod + 1)
+            if isnan(seed[p, s, 0]):
+                first, count, total, prev = starts[s], 0, 0.0, nan
+            else:
+                first, count, total, prev = resume[s], int(seed[p, s, 0]), seed[p, s, 1], seed[p, s, 2]
+                if first > starts[s]:
+                    out[p, first - 1] = prev if count >= timeperiod else nan
+            for i in range(first, ends[s]):
+                if count < timeperiod:
+                    if count == 0 and isnan(values[i]):
+                        continue
+                    total += values[i]
+                    count += 1
+                    if count == timeperiod:
+                        prev = total / timeperiod
+                        out[p, i] = prev
+                else:
+                    prev = ((values[i] - prev) * k) + prev
+                    out[p, i] = prev
+            state[p, s, 0], state[p, s, 1], state[p, s, 2] = count, total, prev
+    return out, state
@@ -1,5 +1,5 @@
-from pandas import read_parquet
 from pathlib import Path
+from schema import read_frame
 
 
 def make_lines(path: Path, period: str, symbol: str, lines: list[str]) -> dict:
@@ -8,17 +8,13 @@ def make_lines(path: Path, period: str, symbol: str, lines: list[str]) -> dict:
     if len(lines) == 0:
         return None
 
-    sma_df = (
-        read_parquet(path=path / f"signals/{period}/sma.parquet")
-        .query(f'symbol == "{symbol}"')
-        .loc[:, ["Date"] + [line for line in lines if "sma" in line]]
-    )
+    sma_df = read_frame(path=path / f"signals/{period}/sma.parquet", filters=[("symbol", "==", symbol)]).loc[
+        :, ["Date"] + [line for line in lines if "sma" in line]
+    ]
 
-    ema_df = (
-        read_parquet(path=path / f"signals/{period}/ema.parquet")
-        .query(f'symbol == "{symbol}"')
-        .loc[:, ["Date"] + [line for line in lines if "ema" in line]]
-    )
+    ema_df = read_frame(path=path / f"signals/{period}/ema.parquet", filters=[("symbol", "==", symbol)]).loc[
+        :, ["Date"] + [line for line in lines if "ema" in line]
+    ]
     df = sma_df.merge(ema_df, how="inner", on="Date")
     print(df)
     return df
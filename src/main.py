@@ -6,13 +6,24 @@ from pandas import DataFrame, concat, read_parquet
 
 from tqdm.auto import tqdm
 from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from icecream import ic
 from joblib import Parallel, delayed
 from multiprocessing import cpu_count
 from typing import Optional
-from calcs import calculations
+from argparse import ArgumentParser, Namespace
+from contextlib import nullcontext, suppress
+from calcs import calculations, merged_signals
+from bench import BENCH_PATH, SCALES, SUITES, run_benchmarks, save_benchmarks
+from instrument import RunReport, measure, rows
+from registry import Indicator, default_indicators, select_indicators
+from resample import resample_ohlcv
+from schema import write_frame, write_part, read_frame, expand, PRICE_COLUMNS
+from stages import Manifest, SIGNAL_MODULES, code_digest, file_digest, fingerprint, frame_digest
 from stock_sectors import Sectors
 from sp_symbols import SP
-from utilities import make_directories, camelcase
+from utilities import make_directories, camelcase, SECTOR_ETFS
+from app_utilities import load_config
 import os
 
 
@@ -28,22 +39,20 @@ def yahoo_stock_prices(symbols: list, interval: str = "1d", period: str = "5y")
     return concat(yahoo_stock_prices).reset_index(drop=False).astype({"Date": str, "symbol": str})
 
 
+def price_filter(df: DataFrame, minimum_share_price: float = 1, maximum_share_price: float = 20000) -> DataFrame:
+    """The prices of the symbols whose first close is within the share price range"""
+    ticker_filter = (
+        df.sort_values("Date")
+        .drop_duplicates(subset=["symbol"], keep="first")
+        .query(f"Close >= {minimum_share_price}")
+        .query(f"Close <= {maximum_share_price}")
+        .loc[:, ["symbol"]]
+    )
+    return df.loc[df.symbol.isin(ticker_filter.symbol), :].reset_index(drop=True)
+
+
 def get_sector_etfs() -> DataFrame:
-    sector_etfs = {
-        "SPY": "S&P 500",
-        "XLC": "COMMUNICATION SERVICES",
-        "XLY": "CONSUMER DISCRETIONARY",
-        "XLP": "CONSUMER STAPLES",
-        "XLE": "ENERGY",
-        "XLF": "FINANCIALS",
-        "XLV": "HEALTH CARE",
-        "XLI": "INDUSTRIALS",
-        "XLB": "MATERIALS",
-        "XLRE": "REAL ESTATE",
-        "XLK": "INFORMATION TECHNOLOGY",
-        "XLU": "UTILITIES",
-    }
-    sector_etfs = {k: [camelcase(string=v)] for k, v in sector_etfs.items()}
+    sector_etfs = {k: [camelcase(string=v)] for k, v in SECTOR_ETFS.items()}
     df = (
         DataFrame(sector_etfs)
         .transpose()
@@ -54,6 +63,301 @@ def get_sector_etfs() -> DataFrame:
 
 
 DATA_PATH = "/Users/ab/Data/stock_data/"
+CONFIG_PATH = Path("./config/config.yaml").absolute()
+# threads writing the parquet files of a period
+WRITERS = 4
+# stages a run can refresh, and the periods signals are computed for
+STAGES = ["info", "prices", "signals"]
+PERIODS = ["D", "W", "M"]
+# batches of indicators a period is calculated in. Every batch builds its own panel, index closes and shared
+# intermediates, so more batches make a crash lose less work at the cost of repeating those in every run
+BATCHES = 1
+# symbols per batch when streaming the signals, the peak memory follows it rather than the universe
+BATCH_SYMBOLS = 500
+
+
+def indicator_spec(indicator: Indicator) -> dict:
+    """What an indicator computes, for the fingerprint of the signal stage"""
+    return {
+        "key": indicator.key,
+        "func": f"{indicator.func.__module__}.{indicator.func.__name__}",
+        "params": indicator.params,
+        "inputs": indicator.inputs,
+        "after": indicator.after,
+    }
+
+
+def write_signals(df: DataFrame, path: Path, calc_set: str) -> None:
+    """write_frame, measured as a write of the period's signals"""
+    with measure(path.stem, kind="write", calc_set=calc_set) as record:
+        write_frame(df=df, path=path)
+        record["rows"] = len(df)
+
+
+def signal_pipeline(
+    prices: DataFrame,
+    symbol_info: DataFrame,
+    calc_set: str,
+    data_path: Path,
+    indicators: list[Indicator],
+    n_jobs: int = 1,
+    incremental_signals: bool = False,
+    resume_signals: bool = True,
+    batches: int = BATCHES,
+    debug: bool = False,
+) -> None:
+    """Calculate the signals of one period in batches of indicators and write each result and the merged signals.
+
+    A manifest records the fingerprint of the prices, the signal code and the indicators, and every batch once its
+    results are written. A rerun with the same fingerprint skips the period when its merged signals were written and
+    otherwise reads the completed batches back and calculates only the remaining indicators. resume_signals False
+    starts over. The results of a batch are written while the next one is calculated. Each batch is a calculations
+    call of its own that recomputes the intermediates the batches share, so one batch is the default.
+    """
+    with measure("signal_pipeline", calc_set=calc_set):
+        signals_path = data_path / f"signals/{calc_set}"
+        df = prices.merge(symbol_info.loc[:, ["symbol", "index_symbol"]].drop_duplicates(), how="inner", on="symbol")
+        with measure("fingerprint"):
+            manifest = Manifest(
+                path=data_path / f"manifests/signals_{calc_set}.json",
+                stage_fingerprint=fingerprint(
+                    prices=frame_digest(df=df),
+                    code=code_digest(modules=SIGNAL_MODULES),
+                    indicators=[indicator_spec(indicator=indicator) for indicator in indicators],
+                ),
+                resume=resume_signals,
+            )
+        if manifest.done("merged"):
+            ic(f"Signals - {calc_set}: inputs unchanged, skipped")
+            return
+
+        completed = [indicator.key for indicator in indicators if manifest.done(indicator.key)]
+        pending = [indicator for indicator in indicators if indicator.key not in completed]
+        if completed:
+            ic(f"Signals - {calc_set}: resuming with {len(completed)} of {len(indicators)} indicators stored")
+        with measure("resume") as record:
+            calcs = {Path(path).stem: expand(read_frame(path=path)) for path in manifest.outputs(steps=completed)}
+            record["rows"] = rows(calcs)
+
+        size = max(-(-len(pending) // max(batches, 1)), 1)
+        # pyarrow releases the GIL while it encodes and writes, so the results are written during the next calculation
+        with ThreadPoolExecutor(max_workers=WRITERS) as writer:
+            written = []
+            try:
+                for start in range(0, len(pending), size):
+                    batch = pending[start : start + size]
+                    with measure("calculations", batch=start // size) as record:
+                        batch_calcs = calculations(
+                            df=df,
+                            calc_set=calc_set,
+                            n_jobs=n_jobs,
+                            signals_path=signals_path if incremental_signals else None,
+                            indicators=batch,
+                            debug=debug,
+                        )
+                        record["rows"] = rows(batch_calcs)
+                    calcs.update(batch_calcs)
+                    paths = [signals_path / f"{key}.parquet" for key in batch_calcs]
+                    writes = [
+                        writer.submit(write_signals, df=value.reset_index(drop=True), path=path, calc_set=calc_set)
+                        for value, path in zip(batch_calcs.values(), paths)
+                    ]
+                    written.append(([indicator.key for indicator in batch], writes, paths))
+                    # record the previous batches whose files are all written
+                    while written and all(write.done() for write in written[0][1]):
+                        _record_batch(manifest=manifest, batch=written.pop(0))
+
+                # the same column order however the indicators were batched or resumed
+                calcs = {key: calcs[key] for key in sorted(calcs, key=lambda key: (key != "index_close", key))}
+                with measure("merge") as record:
+                    merged = merged_signals(prices=prices, results=calcs, calc_set=calc_set)
+                    record["rows"] = len(merged)
+            except BaseException:
+                # batches written before a failure are recorded too, so the rerun resumes after them, but a batch that
+                # fails to write must not hide the error that stopped the run
+                for batch in written:
+                    with suppress(Exception):
+                        _record_batch(manifest=manifest, batch=batch)
+                raise
+            for batch in written:
+                _record_batch(manifest=manifest, batch=batch)
+            merged_path = signals_path / "merged.parquet"
+            write_signals(df=merged, path=merged_path, calc_set=calc_set)
+            manifest.record(steps=["merged"], outputs=[merged_path])
+
+
+def _record_batch(manifest: Manifest, batch: tuple[list[str], list[Future], list[Path]]) -> None:
+    """Wait for the files of a batch and mark its indicators completed"""
+    keys, writes, paths = batch
+    for write in writes:
+        write.result()
+    manifest.record(steps=keys, outputs=paths)
+
+
+def signal_pipelines(
+    prices: dict[str, DataFrame],
+    symbol_info: DataFrame,
+    data_path: Path,
+    indicators: list[Indicator],
+    workers: int = cpu_count(),
+    incremental_signals: bool = False,
+    resume_signals: bool = True,
+    debug: bool = False,
+) -> None:
+    """Run the signal pipeline of every period concurrently.
+
+    The period with the most bars (the daily one) is sharded over the worker processes. The others are calculated in
+    threads of this process, which otherwise only waits for those workers, so a full refresh takes about as long as the
+    daily pass. A single pool of worker processes is used because joblib cannot resize it while another period's
+    shards are running on it.
+    """
+    largest = max(prices, key=lambda calc_set: len(prices[calc_set]))
+    with ThreadPoolExecutor(max_workers=len(prices)) as scheduler:
+        pipelines = [
+            scheduler.submit(
+                signal_pipeline,
+                prices=period_prices,
+                symbol_info=symbol_info,
+                calc_set=calc_set,
+                data_path=data_path,
+                indicators=indicators,
+                n_jobs=workers if calc_set == largest else 1,
+                incremental_signals=incremental_signals,
+                resume_signals=resume_signals,
+                debug=debug,
+            )
+            for calc_set, period_prices in prices.items()
+        ]
+        # result() raises the first failure, the other periods still finish before the scheduler exits
+        for pipeline in pipelines:
+            pipeline.result()
+
+
+def symbol_batches(symbols: list[str], index_symbols: list[str], batch_symbols: int = BATCH_SYMBOLS) -> list[list[str]]:
+    """The index ETFs as the first batch, then the other symbols in batches of batch_symbols"""
+    index_symbols = sorted(set(index_symbols).intersection(symbols))
+    others = sorted(set(symbols).difference(index_symbols))
+    size = max(batch_symbols, 1)
+    return ([index_symbols] if index_symbols else []) + [
+        others[start : start + size] for start in range(0, len(others), size)
+    ]
+
+
+def stream_prices(
+    symbols: list[str],
+    data_path: Path,
+    minimum_share_price: float = 1,
+    maximum_share_price: float = 20000,
+    batch_symbols: int = BATCH_SYMBOLS,
+) -> int:
+    """Download the daily prices batch_symbols symbols at a time, writing every batch and its weekly and monthly bars
+    as one part of OHLCV/<period>/data.parquet, so only a batch of prices is in memory. Returns the daily rows."""
+    size = max(batch_symbols, 1)
+    part, n_rows, priced = 0, 0, []
+    for start in range(0, len(symbols), size):
+        prices_d_df = price_filter(
+            df=yahoo_stock_prices(symbols=symbols[start : start + size], interval="1d", period="5y"),
+            minimum_share_price=minimum_share_price,
+            maximum_share_price=maximum_share_price,
+        )
+        if prices_d_df.empty:
+            continue
+        # weekly and monthly bars are built from the daily bars of the batch, they are per symbol
+        for period, df in [
+            ("D", prices_d_df),
+            ("W", resample_ohlcv(df=prices_d_df, period="W")),
+            ("M", resample_ohlcv(df=prices_d_df, period="M")),
+        ]:
+            write_part(df=df, path=data_path / f"OHLCV/{period}/data.parquet", part=part, exact=PRICE_COLUMNS)
+        part += 1
+        n_rows += len(prices_d_df)
+        priced += prices_d_df["symbol"].unique().tolist()
+    DataFrame({"symbol": sorted(set(priced))}).to_parquet(path=data_path / "symbols/data.parquet")
+    return n_rows
+
+
+def stream_pipeline(
+    prices_path: Path,
+    symbols: list[str],
+    symbol_info: DataFrame,
+    calc_set: str,
+    data_path: Path,
+    indicators: list[Indicator],
+    n_jobs: int = 1,
+    batch_symbols: int = BATCH_SYMBOLS,
+    resume_signals: bool = True,
+    debug: bool = False,
+) -> None:
+    """Calculate the signals of one period a batch of symbols at a time, appending each batch to partitioned output.
+
+    Only a batch's prices and results are in memory, read from the OHLCV file and written as one part of
+    signals/<period>/<key>.parquet, a directory read_frame reads like a file. The index ETFs are the first batch, and
+    their closes, which the Mansfield RSI of every batch needs, are read once and passed to each batch. A manifest
+    records every written batch, so a rerun with the same prices, code, indicators and batches resumes after the last
+    one.
+    """
+    with measure("stream_pipeline", calc_set=calc_set):
+        signals_path = data_path / f"signals/{calc_set}"
+        info = symbol_info.loc[:, ["symbol", "index_symbol"]].drop_duplicates()
+        index_symbols = info["index_symbol"].dropna().unique().tolist()
+        batches = symbol_batches(symbols=symbols, index_symbols=index_symbols, batch_symbols=batch_symbols)
+        # the index ETFs of the universe, the first batch
+        index_batch = sorted(set(index_symbols).intersection(symbols))
+        with measure("fingerprint"):
+            manifest = Manifest(
+                path=data_path / f"manifests/stream_{calc_set}.json",
+                stage_fingerprint=fingerprint(
+                    prices=file_digest(path=prices_path),
+                    info=frame_digest(df=info.sort_values("symbol").reset_index(drop=True)),
+                    code=code_digest(modules=SIGNAL_MODULES),
+                    indicators=[indicator_spec(indicator=indicator) for indicator in indicators],
+                    batches=batches,
+                ),
+                resume=resume_signals,
+            )
+        pending = [number for number in range(len(batches)) if not manifest.done(f"batch_{number}")]
+        if not pending:
+            ic(f"Signals - {calc_set}: inputs unchanged, skipped")
+            return
+        if len(pending) < len(batches):
+            ic(f"Signals - {calc_set}: resuming with {len(batches) - len(pending)} of {len(batches)} batches stored")
+
+        with measure("index_prices") as record:
+            index_prices = (
+                expand(
+                    read_frame(
+                        path=prices_path, columns=["symbol", "Date", "Close"], filters=[("symbol", "in", index_batch)]
+                    )
+                )
+                if index_batch
+                else None
+            )
+            record["rows"] = 0 if index_prices is None else len(index_prices)
+
+        with ThreadPoolExecutor(max_workers=WRITERS) as writer:
+            for number in tqdm(pending, desc=f"Batches - {calc_set}"):
+                batch = batches[number]
+                with measure("batch", batch=number, symbols=len(batch)) as record:
+                    prices = expand(read_frame(path=prices_path, filters=[("symbol", "in", batch)]))
+                    df = prices.merge(info, how="inner", on="symbol")
+                    calcs = calculations(
+                        df=df,
+                        calc_set=calc_set,
+                        n_jobs=n_jobs,
+                        indicators=indicators,
+                        debug=debug,
+                        index_prices=index_prices,
+                    )
+                    # the column order of the merged signals signal_pipeline writes
+                    calcs = {key: calcs[key] for key in sorted(calcs, key=lambda key: (key != "index_close", key))}
+                    calcs["merged"] = merged_signals(prices=prices, results=calcs, calc_set=calc_set)
+                    record["rows"] = len(calcs["merged"])
+                    writes = [
+                        writer.submit(write_part, df=result, path=signals_path / f"{key}.parquet", part=number)
+                        for key, result in calcs.items()
+                    ]
+                    manifest.record(steps=[f"batch_{number}"], outputs=[write.result() for write in writes])
+                    del prices, df, calcs
 
 
 def main(
@@ -64,160 +368,296 @@ def main(
     maximum_share_price: float = 20000,
     s_and_p_only: bool = True,
     n_test: Optional[int] = None,
+    workers: int = cpu_count(),
+    incremental_signals: bool = False,
+    resume_signals: bool = True,
+    debug: bool = False,
+    report_path: Optional[Path] = None,
+    profile: Optional[list[str]] = None,
+    data_path: Path = DATA_PATH,
+    periods: Optional[list[str]] = None,
+    indicator_keys: Optional[list[str]] = None,
+    stream_signals: bool = False,
+    batch_symbols: int = BATCH_SYMBOLS,
 ) -> None:
-    """Main"""
+    """Main. A run report with the time, CPU time, memory and rows of every stage and indicator is written to
+    report_path (data_path/reports by default); the stages and indicators named in profile are also sampled.
 
-    data_path = Path(DATA_PATH).absolute()
-    make_directories(data_path=data_path)
+    periods limits the signals to some of D, W and M, and indicator_keys to some of the default indicators.
+    stream_signals calculates them batch_symbols symbols at a time from the OHLCV files, for universes whose prices
+    and signals do not fit in memory together.
+    """
+    if stream_signals and incremental_signals:
+        raise ValueError("Incremental signals read every stored signal, they cannot be streamed")
 
-    if refresh_info:
-        nasdaq = Nasdaq()
-        all_nasdaq = nasdaq().loc[:, ["symbol"]]
-
-        sectors = Sectors()
-        stock_info = sectors.all_stocks.merge(all_nasdaq, how="inner", on="symbol")
-        etf_info = sectors.all_etfs.merge(all_nasdaq, how="inner", on="symbol")
-
-        stock_info.to_parquet(data_path / "info/stock_info.parquet")
-        etf_info.to_parquet(data_path / "info/etf_info.parquet")
-        # s_and_p_info.to_parquet(data_path / "info/s_and_p_info.parquet")
-    else:
-        stock_info = read_parquet(data_path / "info/stock_info.parquet")
-        etf_info = read_parquet(data_path / "info/etf_info.parquet")
-        # s_and_p_info = read_parquet(data_path / "info/s_and_p_info.parquet")
-
-    symbol_info = concat([stock_info, etf_info], axis=0).drop_duplicates().sort_values("symbol").reset_index(drop=True)
-
-    ### Get the index ETFS for each symbol for Mansfield RSI
-    sector_etfs_df = get_sector_etfs()
-    symbol_info["sector"] = symbol_info["sector"].apply(lambda s: camelcase(s))
-    symbol_info = symbol_info.merge(right=sector_etfs_df, how="left", on="sector")
-    symbol_info["index_symbol"] = symbol_info["index_symbol"].fillna("SPY")
-    symbol_info.to_parquet(path=data_path / "info/merged_info.parquet")
-
-    data_symbols = symbol_info.loc[
-        (
-            (
-                (symbol_info["type"] == "stock") & (symbol_info["market_cap"] > 2500000)
-                | (symbol_info["type"] == "etf") & (symbol_info["market_cap"] > 1000000)
-            )
-            & (symbol_info["industry"] != "Shell Companies")
-            & (symbol_info["equity_type"] != "ADRs")
-            & (symbol_info["equity_type"] != "Units")
-        ),
-        ["symbol"],
-    ].reset_index(drop=True)
-
-    if s_and_p_only:
-        sp = SP()
-        s_and_p_info = sp().Symbol.to_list() + sector_etfs_df.index_symbol.to_list()
-        data_symbols = data_symbols.loc[data_symbols.symbol.isin(s_and_p_info), ["symbol"]].reset_index(drop=True)
-
-    if n_test is not None:
-        n_test = n_test if n_test <= len(data_symbols) else len(data_symbols)
-        # s_and_p_info = sp().Symbol.to_list() + sector_etfs_df.index_symbol.to_list()
-        data_symbols = (
-            concat([data_symbols.head(n_test).symbol, sector_etfs_df.index_symbol])
-            .reset_index(drop=False)
-            .rename(columns={0: "symbol"})
-            .loc[:, ["symbol"]]
-        )
-        # print(data_symbols)
-
-    if refresh_prices:
-        prices_d_df = yahoo_stock_prices(symbols=data_symbols.symbol, interval="1d", period="5y")
-
-        ticker_filter = (
-            prices_d_df.sort_values("Date")
-            .drop_duplicates(subset=["symbol"], keep="first")
-            .query(f"Close >= {minimum_share_price}")
-            .query(f"Close <= {maximum_share_price}")
-            .loc[:, ["symbol"]]
-        )
+    data_path = Path(data_path).absolute()
+    make_directories(data_path=data_path)
 
-        prices_d_df = prices_d_df.loc[prices_d_df.symbol.isin(ticker_filter.symbol), :].reset_index(drop=True)
-        prices_d_df.to_parquet(path=data_path / "OHLCV/D/data.parquet")
-
-        prices_wk_df = yahoo_stock_prices(symbols=ticker_filter.symbol, interval="1wk", period="5y")
-        # prices_wk_df = prices_wk_df.loc[prices_wk_df.symbol.isin(ticker_filter.symbol), :].reset_index(drop=True)
-        prices_wk_df.to_parquet(path=data_path / "OHLCV/W/data.parquet")
-
-        prices_mo_df = yahoo_stock_prices(symbols=ticker_filter.symbol, interval="1mo", period="5y")
-        # prices_mo_df = prices_mo_df.loc[prices_mo_df.symbol.isin(ticker_filter.symbol), :].reset_index(drop=True)
-        prices_mo_df.to_parquet(path=data_path / "OHLCV/M/data.parquet")
-
-        screener_symbols = prices_d_df.loc[:, ["symbol"]].sort_values("symbol").drop_duplicates().reset_index(drop=True)
-        screener_symbols.to_parquet(path=data_path / "symbols/data.parquet")
-
-    else:
-        prices_d_df = read_parquet(path=data_path / "OHLCV/D/data.parquet")
-        prices_wk_df = read_parquet(path=data_path / "OHLCV/W/data.parquet")
-        prices_mo_df = read_parquet(path=data_path / "OHLCV/M/data.parquet")
-        prices_d_df = prices_d_df.loc[prices_d_df.symbol.isin(data_symbols.symbol)].reset_index(drop=True)
-        prices_wk_df = prices_wk_df.loc[prices_wk_df.symbol.isin(data_symbols.symbol)].reset_index(drop=True)
-        prices_mo_df = prices_mo_df.loc[prices_mo_df.symbol.isin(data_symbols.symbol)].reset_index(drop=True)
-
-    # signal_symbols = (
-    #     prices_d_df.sort_values("Date")
-    #     .drop_duplicates(subset=["symbol"], keep="first")
-    #     .query("Close >= 2.5")
-    #     .loc[:, ["symbol"]]
-    # )
-
-    # prices_d_df = prices_d_df.merge(signal_symbols, on="symbol", how="inner").merge(
-    #     data_symbols, on="symbol", how="inner"
-    # )
-    # prices_wk_df = prices_wk_df.merge(signal_symbols, on="symbol", how="inner").merge(
-    #     data_symbols, on="symbol", how="inner"
-    # )
-    # prices_mo_df = prices_mo_df.merge(signal_symbols, on="symbol", how="inner").merge(
-    #     data_symbols, on="symbol", how="inner"
-    # )
-
-    if refresh_signals:
-        daily_calcs = calculations(
-            df=prices_d_df.merge(
-                symbol_info.loc[:, ["symbol", "index_symbol"]].drop_duplicates(), how="inner", on="symbol"
-            ),
-            calc_set="D",
-            n_jobs=4,
-        )
-        df = prices_d_df.copy(deep=True)
-        for key, value in tqdm(daily_calcs.items(), desc="Daily to disk"):
-            df = df.merge(
-                value.drop(columns=value.columns.intersection(["Volume"]), axis=1), how="left", on=["Date", "symbol"]
-            )
-            value.reset_index(drop=True).to_parquet(path=data_path / f"signals/D/{key}.parquet")
-        df.to_parquet(path=data_path / "signals/D/merged.parquet")
-
-        weekly_calcs = calculations(
-            df=prices_wk_df.merge(
-                symbol_info.loc[:, ["symbol", "index_symbol"]].drop_duplicates(), how="inner", on="symbol"
-            ),
-            calc_set="W",
-        )
-        df = prices_wk_df.copy(deep=True)
-        for key, value in tqdm(weekly_calcs.items(), desc="Weekly to disk"):
-            df = df.merge(
-                value.drop(columns=value.columns.intersection(["Volume"]), axis=1), how="left", on=["Date", "symbol"]
-            )
-            value.reset_index(drop=True).to_parquet(path=data_path / f"signals/W/{key}.parquet")
-        df.to_parquet(path=data_path / "signals/W/merged.parquet")
-
-        monthly_calcs = calculations(
-            df=prices_mo_df.merge(
-                symbol_info.loc[:, ["symbol", "index_symbol"]].drop_duplicates(), how="inner", on="symbol"
-            ),
-            calc_set="M",
-        )
-        df = prices_mo_df.copy(deep=True)
-        for key, value in tqdm(monthly_calcs.items(), desc="Monthly to disk"):
-            df = df.merge(
-                value.drop(columns=value.columns.intersection(["Volume"]), axis=1), how="left", on=["Date", "symbol"]
+    report = RunReport(profile=profile)
+    try:
+        with report.active():
+            with measure("info") as record:
+                if refresh_info:
+                    nasdaq = Nasdaq()
+                    all_nasdaq = nasdaq().loc[:, ["symbol"]]
+
+                    sectors = Sectors()
+                    stock_info = sectors.all_stocks.merge(all_nasdaq, how="inner", on="symbol")
+                    etf_info = sectors.all_etfs.merge(all_nasdaq, how="inner", on="symbol")
+
+                    stock_info.to_parquet(data_path / "info/stock_info.parquet")
+                    etf_info.to_parquet(data_path / "info/etf_info.parquet")
+                    # s_and_p_info.to_parquet(data_path / "info/s_and_p_info.parquet")
+                else:
+                    stock_info = read_parquet(data_path / "info/stock_info.parquet")
+                    etf_info = read_parquet(data_path / "info/etf_info.parquet")
+                    # s_and_p_info = read_parquet(data_path / "info/s_and_p_info.parquet")
+
+                symbol_info = (
+                    concat([stock_info, etf_info], axis=0)
+                    .drop_duplicates()
+                    .sort_values("symbol")
+                    .reset_index(drop=True)
+                )
+
+                ### Get the index ETFS for each symbol for Mansfield RSI
+                sector_etfs_df = get_sector_etfs()
+                symbol_info["sector"] = symbol_info["sector"].apply(lambda s: camelcase(s))
+                symbol_info = symbol_info.merge(right=sector_etfs_df, how="left", on="sector")
+                symbol_info["index_symbol"] = symbol_info["index_symbol"].fillna("SPY")
+                symbol_info.to_parquet(path=data_path / "info/merged_info.parquet")
+                record["rows"] = len(symbol_info)
+
+            data_symbols = symbol_info.loc[
+                (
+                    (
+                        (symbol_info["type"] == "stock") & (symbol_info["market_cap"] > 2500000)
+                        | (symbol_info["type"] == "etf") & (symbol_info["market_cap"] > 1000000)
+                    )
+                    & (symbol_info["industry"] != "Shell Companies")
+                    & (symbol_info["equity_type"] != "ADRs")
+                    & (symbol_info["equity_type"] != "Units")
+                ),
+                ["symbol"],
+            ].reset_index(drop=True)
+
+            if s_and_p_only:
+                sp = SP()
+                s_and_p_info = sp().Symbol.to_list() + sector_etfs_df.index_symbol.to_list()
+                data_symbols = data_symbols.loc[data_symbols.symbol.isin(s_and_p_info), ["symbol"]].reset_index(
+                    drop=True
+                )
+
+            if n_test is not None:
+                n_test = n_test if n_test <= len(data_symbols) else len(data_symbols)
+                # s_and_p_info = sp().Symbol.to_list() + sector_etfs_df.index_symbol.to_list()
+                data_symbols = (
+                    concat([data_symbols.head(n_test).symbol, sector_etfs_df.index_symbol])
+                    .reset_index(drop=False)
+                    .rename(columns={0: "symbol"})
+                    .loc[:, ["symbol"]]
+                )
+                # print(data_symbols)
+
+            with measure("prices") as record:
+                if refresh_prices and stream_signals:
+                    # the signals read the prices of a batch of symbols at a time, so they are downloaded that way
+                    stream_rows = stream_prices(
+                        symbols=data_symbols.symbol.tolist(),
+                        data_path=data_path,
+                        minimum_share_price=minimum_share_price,
+                        maximum_share_price=maximum_share_price,
+                        batch_symbols=batch_symbols,
+                    )
+                    prices_d_df = prices_wk_df = prices_mo_df = DataFrame()
+                elif refresh_prices:
+                    prices_d_df = price_filter(
+                        df=yahoo_stock_prices(symbols=data_symbols.symbol, interval="1d", period="5y"),
+                        minimum_share_price=minimum_share_price,
+                        maximum_share_price=maximum_share_price,
+                    )
+                    write_frame(df=prices_d_df, path=data_path / "OHLCV/D/data.parquet", exact=PRICE_COLUMNS)
+
+                    # weekly and monthly bars are built from the daily bars instead of being downloaded again
+                    prices_wk_df = resample_ohlcv(df=prices_d_df, period="W")
+                    write_frame(df=prices_wk_df, path=data_path / "OHLCV/W/data.parquet", exact=PRICE_COLUMNS)
+
+                    prices_mo_df = resample_ohlcv(df=prices_d_df, period="M")
+                    write_frame(df=prices_mo_df, path=data_path / "OHLCV/M/data.parquet", exact=PRICE_COLUMNS)
+
+                    screener_symbols = (
+                        prices_d_df.loc[:, ["symbol"]].sort_values("symbol").drop_duplicates().reset_index(drop=True)
+                    )
+                    screener_symbols.to_parquet(path=data_path / "symbols/data.parquet")
+
+                elif stream_signals:
+                    # the signals read the prices of a batch of symbols at a time
+                    prices_d_df = prices_wk_df = prices_mo_df = DataFrame()
+                else:
+                    prices_d_df = expand(read_frame(path=data_path / "OHLCV/D/data.parquet"))
+                    prices_wk_df = expand(read_frame(path=data_path / "OHLCV/W/data.parquet"))
+                    prices_mo_df = expand(read_frame(path=data_path / "OHLCV/M/data.parquet"))
+                    prices_d_df = prices_d_df.loc[prices_d_df.symbol.isin(data_symbols.symbol)].reset_index(drop=True)
+                    prices_wk_df = prices_wk_df.loc[prices_wk_df.symbol.isin(data_symbols.symbol)].reset_index(
+                        drop=True
+                    )
+                    prices_mo_df = prices_mo_df.loc[prices_mo_df.symbol.isin(data_symbols.symbol)].reset_index(
+                        drop=True
+                    )
+                record["rows"] = (
+                    stream_rows
+                    if refresh_prices and stream_signals
+                    else len(prices_d_df) + len(prices_wk_df) + len(prices_mo_df)
+                )
+
+            # signal_symbols = (
+            #     prices_d_df.sort_values("Date")
+            #     .drop_duplicates(subset=["symbol"], keep="first")
+            #     .query("Close >= 2.5")
+            #     .loc[:, ["symbol"]]
+            # )
+
+            # prices_d_df = prices_d_df.merge(signal_symbols, on="symbol", how="inner").merge(
+            #     data_symbols, on="symbol", how="inner"
+            # )
+            # prices_wk_df = prices_wk_df.merge(signal_symbols, on="symbol", how="inner").merge(
+            #     data_symbols, on="symbol", how="inner"
+            # )
+            # prices_mo_df = prices_mo_df.merge(signal_symbols, on="symbol", how="inner").merge(
+            #     data_symbols, on="symbol", how="inner"
+            # )
+
+            if refresh_signals:
+                with measure("signals") as record:
+                    config = load_config(path=CONFIG_PATH)["config"]
+                    indicators = select_indicators(
+                        indicators=default_indicators(
+                            patterns=config.get("patterns"),
+                            moving_averages=config.get("moving_averages"),
+                            crossovers=config.get("crossovers"),
+                            ratios=config.get("ratios"),
+                        ),
+                        keys=indicator_keys,
+                    )
+                    if stream_signals:
+                        # the downloaded prices were written, and are read back a batch at a time
+                        del prices_d_df, prices_wk_df, prices_mo_df
+                        universe = set(data_symbols.symbol)
+                        for period in periods or PERIODS:
+                            prices_path = data_path / f"OHLCV/{period}/data.parquet"
+                            symbols = read_frame(path=prices_path, columns=["symbol"])["symbol"].astype(str).unique()
+                            stream_pipeline(
+                                prices_path=prices_path,
+                                symbols=[symbol for symbol in symbols if symbol in universe],
+                                symbol_info=symbol_info,
+                                calc_set=period,
+                                data_path=data_path,
+                                indicators=indicators,
+                                n_jobs=workers,
+                                batch_symbols=batch_symbols,
+                                resume_signals=resume_signals,
+                                debug=debug,
+                            )
+                    else:
+                        prices = {"D": prices_d_df, "W": prices_wk_df, "M": prices_mo_df}
+                        prices = {period: prices[period] for period in periods or PERIODS}
+                        signal_pipelines(
+                            prices=prices,
+                            symbol_info=symbol_info,
+                            data_path=data_path,
+                            indicators=indicators,
+                            workers=workers,
+                            incremental_signals=incremental_signals,
+                            resume_signals=resume_signals,
+                            debug=debug,
+                        )
+                        record["rows"] = sum(len(df) for df in prices.values())
+    finally:
+        ic(f"Run report: {report.write(path=report_path or data_path / 'reports')}")
+
+
+def parse_args(args: Optional[list[str]] = None) -> Namespace:
+    """Command line options of a run"""
+    parser = ArgumentParser(description="Refresh the stock data and signals, or benchmark the engine on synthetic data")
+    parser.add_argument("--data-path", type=Path, default=Path(DATA_PATH), help="root of the info, OHLCV and signals")
+    parser.add_argument(
+        "--refresh",
+        nargs="*",
+        choices=STAGES,
+        default=["signals"],
+        help="stages to refresh, the others are read from disk (none when given without any)",
+    )
+    parser.add_argument(
+        "--universe", choices=["sp", "full"], default="sp", help="S&P 500 symbols or every listed symbol"
+    )
+    parser.add_argument("--n-test", type=int, default=None, help="only the first n symbols and the index ETFs")
+    parser.add_argument("--minimum-share-price", type=float, default=1)
+    parser.add_argument("--maximum-share-price", type=float, default=20000)
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="worker processes for the daily signals")
+    parser.add_argument("--periods", nargs="+", choices=PERIODS, default=PERIODS, help="periods to compute signals of")
+    parser.add_argument(
+        "--indicators", nargs="+", default=None, help="keys of the indicators to compute, all by default"
+    )
+    parser.add_argument("--incremental", action="store_true", help="only compute bars after the stored signals")
+    parser.add_argument("--no-resume", action="store_true", help="recompute signals a previous run already stored")
+    parser.add_argument(
+        "--stream", action="store_true", help="calculate the signals a batch of symbols at a time, in bounded memory"
+    )
+    parser.add_argument("--batch-symbols", type=int, default=BATCH_SYMBOLS, help="symbols per batch when streaming")
+    parser.add_argument("--debug", action="store_true", help="validate the columns in every indicator call")
+    parser.add_argument("--report-path", type=Path, default=None, help="where the run report goes")
+    parser.add_argument(
+        "--profile", nargs="+", default=None, metavar="STAGE", help="stages or indicators to sample with the profiler"
+    )
+    parser.add_argument("--bench", action="store_true", help="run the benchmark suite instead of refreshing data")
+    parser.add_argument("--bench-path", type=Path, default=BENCH_PATH, help="where benchmark results are stored")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--repeat", type=int, default=3, help="calls per benchmark, the best one is kept")
+    return parser.parse_args(args)
+
+
+def cli(args: Optional[list[str]] = None) -> None:
+    """Run main or the benchmark suite from the command line"""
+    options = parse_args(args=args)
+    if options.bench:
+        report = RunReport(profile=options.profile)
+        with report.active() if options.profile else nullcontext():
+            results = run_benchmarks(
+                data_path=options.bench_path / "data",
+                scales=options.scales,
+                suites=options.suites,
+                periods=options.periods,
+                repeat=options.repeat,
+                n_jobs=options.workers,
             )
-            value.reset_index(drop=True).to_parquet(path=data_path / f"signals/M/{key}.parquet")
-        df.to_parquet(path=data_path / "signals/M/merged.parquet")
+        print(results.to_string())
+        ic(f"Benchmarks: {save_benchmarks(results=results, path=options.bench_path)}")
+        if options.profile:
+            ic(f"Run report: {report.write(path=options.bench_path / 'reports')}")
+        return
+
+    main(
+        refresh_info="info" in options.refresh,
+        refresh_prices="prices" in options.refresh,
+        refresh_signals="signals" in options.refresh,
+        minimum_share_price=options.minimum_share_price,
+        maximum_share_price=options.maximum_share_price,
+        s_and_p_only=options.universe == "sp",
+        n_test=options.n_test,
+        workers=options.workers,
+        incremental_signals=options.incremental,
+        resume_signals=not options.no_resume,
+        debug=options.debug,
+        report_path=options.report_path,
+        profile=options.profile,
+        data_path=options.data_path,
+        periods=options.periods,
+        indicator_keys=options.indicators,
+        stream_signals=options.stream,
+        batch_symbols=options.batch_symbols,
+    )
 
 
 if __name__ == "__main__":
-    main(refresh_info=False, refresh_prices=False, refresh_signals=True, s_and_p_only=True, n_test=20)
+    cli()
@@ -0,0 +1,313 @@
+import json
+from math import isnan, nan
+from pathlib import Path
+
+
+STATES = {}
+
+
+class OnlineState:
+    """Indicator state that is updated one bar at a time and can be saved to disk and restored"""
+
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        STATES[cls.__name__] = cls
+
+    def state(self) -> dict:
+        """Plain dict of every slot, with nested states as dicts too"""
+        return {
+            "type": type(self).__name__,
+            "slots": {
+                name: value.state() if isinstance(value, OnlineState) else value
+                for name, value in ((name, getattr(self, name)) for name in self.__slots__)
+            },
+        }
+
+    @staticmethod
+    def restore(state: dict) -> "OnlineState":
+        """Rebuild a state object from the output of state()"""
+        obj = object.__new__(STATES[state["type"]])
+        for name, value in state["slots"].items():
+            setattr(obj, name, OnlineState.restore(value) if isinstance(value, dict) else value)
+        return obj
+
+
+class OnlineEMA(OnlineState):
+    """EMA seeded with the SMA of the first n values, matching talib.EMA"""
+
+    __slots__ = ("timeperiod", "k", "count", "total", "value")
+
+    def __init__(self, timeperiod: int = 10) -> None:
+        self.timeperiod = timeperiod
+        self.k = 2.0 / (timeperiod + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = nan
+
+    def update(self, value: float) -> float:
+        if self.count < self.timeperiod:
+            if self.count == 0 and isnan(value):
+                return nan
+            self.total += value
+            self.count += 1
+            if self.count < self.timeperiod:
+                return nan
+            self.value = self.total / self.timeperiod
+            return self.value
+        self.value = ((value - self.value) * self.k) + self.value
+        return self.value
+
+
+class OnlineRSI(OnlineState):
+    """Wilder RSI, matching talib.RSI"""
+
+    __slots__ = ("timeperiod", "count", "prev_value", "gain", "loss")
+
+    def __init__(self, timeperiod: int = 14) -> None:
+        self.timeperiod = timeperiod
+        self.count = -1
+        self.prev_value = nan
+        self.gain = 0.0
+        self.loss = 0.0
+
+    def update(self, value: float) -> float:
+        if self.count == -1:
+            if not isnan(value):
+                self.prev_value = value
+                self.count = 0
+            return nan
+        change = value - self.prev_value
+        self.prev_value = value
+        if self.count >= self.timeperiod:
+            self.loss *= self.timeperiod - 1
+            self.gain *= self.timeperiod - 1
+        if change < 0:
+            self.loss -= change
+        else:
+            self.gain += change
+        self.count += 1
+        if self.count < self.timeperiod:
+            return nan
+        self.loss /= self.timeperiod
+        self.gain /= self.timeperiod
+        total = self.gain + self.loss
+        return 100.0 * (self.gain / total) if not -0.00000001 < total < 0.00000001 else 0.0
+
+
+class OnlineTrendStreak(OnlineState):
+    """Length of the current run of equal values, starting at 1"""
+
+    __slots__ = ("prev", "length")
+
+    def __init__(self) -> None:
+        self.prev = nan
+        self.length = 0
+
+    def update(self, value: float) -> int:
+        self.length = self.length + 1 if self.length and value == self.prev else 1
+        self.prev = value
+        return self.length
+
+
+class OnlineThresholdStreak(OnlineState):
+    """Periods since the values last crossed the threshold, 0 on a cross or a missing value"""
+
+    __slots__ = ("threshold", "prev", "length")
+
+    def __init__(self, threshold: float = 1.0) -> None:
+        self.threshold = threshold
+        self.prev = nan
+        self.length = -1
+
+    def update(self, value: float) -> int:
+        crossed = (value >= self.threshold and self.prev < self.threshold) or (
+            value < self.threshold and self.prev >= self.threshold
+        )
+        self.length = 0 if self.length == -1 or isnan(value) or crossed else self.length + 1
+        self.prev = value
+        return self.length
+
+
+class OnlineMACD(OnlineState):
+    """MACD, signal, histogram, trend and streak, matching ta_lib.macd"""
+
+    __slots__ = ("fastperiod", "slowperiod", "buffer", "fast", "slow", "signal", "prev_macd", "streak")
+
+    def __init__(self, fastperiod: int = 12, slowperiod: int = 26, signalperiod: int = 9) -> None:
+        self.fastperiod = min(fastperiod, slowperiod)
+        self.slowperiod = max(fastperiod, slowperiod)
+        # closes until the slow EMA can be seeded, the fast EMA is seeded from the last of them
+        self.buffer = []
+        self.fast = nan
+        self.slow = nan
+        self.signal = OnlineEMA(timeperiod=signalperiod)
+        self.prev_macd = nan
+        self.streak = OnlineTrendStreak()
+
+    def update(self, value: float) -> tuple[float, float, float, int, int]:
+        macd = nan
+        if len(self.buffer) < self.slowperiod:
+            if self.buffer or not isnan(value):
+                self.buffer.append(value)
+            if len(self.buffer) == self.slowperiod:
+                self.slow = _mean(self.buffer)
+                self.fast = _mean(self.buffer[self.slowperiod - self.fastperiod :])
+                macd = self.fast - self.slow
+        else:
+            self.fast = ((value - self.fast) * (2.0 / (self.fastperiod + 1))) + self.fast
+            self.slow = ((value - self.slow) * (2.0 / (self.slowperiod + 1))) + self.slow
+            macd = self.fast - self.slow
+        signal = self.signal.update(macd) if not isnan(macd) else nan
+        # talib only reports the MACD once the signal line exists
+        macd = macd if not isnan(signal) else nan
+        trend = 1 if macd > self.prev_macd else -1 if macd < self.prev_macd else 0
+        self.prev_macd = macd
+        return macd, signal, macd - signal, trend, self.streak.update(trend)
+
+
+class OnlineOBV(OnlineState):
+    """On balance volume, matching talib.OBV"""
+
+    __slots__ = ("prev_close", "value")
+
+    def __init__(self) -> None:
+        self.prev_close = nan
+        self.value = nan
+
+    def update(self, close: float, volume: float) -> float:
+        if isnan(self.value):
+            self.value = volume
+        elif close > self.prev_close:
+            self.value += volume
+        elif close < self.prev_close:
+            self.value -= volume
+        self.prev_close = close
+        return self.value
+
+
+class OnlineHeikinAshi(OnlineState):
+    """Heikin Ashi candle, signal, trend and streak, matching ha.heikin_ashi_panel"""
+
+    __slots__ = ("prev_open", "prev_close", "streak")
+
+    def __init__(self) -> None:
+        self.prev_open = nan
+        self.prev_close = nan
+        self.streak = OnlineTrendStreak()
+
+    def update(self, open_: float, high: float, low: float, close: float) -> tuple:
+        ha_close = (open_ + high + low + close) / 4
+        first = self.streak.length == 0
+        ha_open = open_ if first else (self.prev_open + self.prev_close) / 2
+        ha_high = max(ha_open, ha_close, low, high)
+        ha_low = min(ha_open, ha_close, low, high)
+        is_increasing = ha_close > ha_open
+        is_increasing_yday = not first and self.prev_close > self.prev_open
+        signal = (
+            1 if is_increasing and not is_increasing_yday else -1 if is_increasing_yday and not is_increasing else 0
+        )
+        trend = 1 if ha_close >= ha_open else -1
+        self.prev_open = ha_open
+        self.prev_close = ha_close
+        return ha_open, ha_high, ha_low, ha_close, signal, trend, self.streak.update(trend)
+
+
+class OnlineEWM(OnlineState):
+    """Adjusted exponentially weighted mean, matching kernels.ewm_mean"""
+
+    __slots__ = ("alpha", "min_periods", "weighted", "old_wt", "nobs")
+
+    def __init__(self, alpha: float, min_periods: int = 0) -> None:
+        # pandas converts alpha to a centre of mass and back again
+        self.alpha = 1.0 / (1.0 + (1.0 / alpha - 1.0))
+        self.min_periods = max(min_periods, 1)
+        self.weighted = None
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, value: float) -> float:
+        is_observation = not isnan(value)
+        self.nobs += is_observation
+        if self.weighted is None:
+            self.weighted = value
+        elif not isnan(self.weighted):
+            self.old_wt *= 1.0 - self.alpha
+            if is_observation:
+                if self.weighted != value:
+                    self.weighted = (self.old_wt * self.weighted + value) / (self.old_wt + 1.0)
+                self.old_wt += 1.0
+        elif is_observation:
+            self.weighted = value
+        return self.weighted if self.nobs >= self.min_periods else nan
+
+
+class OnlineSupertrend(OnlineState):
+    """Supertrend, streak and bands, matching ta_lib.supertrend"""
+
+    __slots__ = ("multiplier", "atr", "prev_close", "lowerband", "upperband", "trend", "streak")
+
+    def __init__(self, timeperiod: int = 10, multiplier: float = 2.0) -> None:
+        self.multiplier = multiplier
+        self.atr = OnlineEWM(alpha=1 / timeperiod, min_periods=timeperiod)
+        self.prev_close = None
+        self.lowerband = nan
+        self.upperband = nan
+        self.trend = 1
+        self.streak = OnlineTrendStreak()
+
+    def update(self, high: float, low: float, close: float) -> tuple[int, int, float, float]:
+        tr = abs(high - low)
+        if self.prev_close is not None:
+            # NaN-skipping max, the same as kernels.true_range
+            for value in (abs(high - self.prev_close), abs(self.prev_close - low)):
+                if isnan(tr) or value > tr:
+                    tr = value
+        atr = self.atr.update(tr)
+        hl2 = (high + low) / 2
+        upperband = hl2 + (self.multiplier * atr)
+        lowerband = hl2 - (self.multiplier * atr)
+
+        if self.prev_close is not None:
+            if close > self.upperband:
+                self.trend = 1
+            elif close < self.lowerband:
+                self.trend = -1
+            else:
+                if self.trend == 1 and lowerband < self.lowerband:
+                    lowerband = self.lowerband
+                if self.trend == -1 and upperband > self.upperband:
+                    upperband = self.upperband
+            if self.trend == 1:
+                upperband = nan
+            else:
+                lowerband = nan
+
+        self.prev_close = close
+        self.lowerband = lowerband
+        self.upperband = upperband
+        return self.trend, self.streak.update(self.trend), lowerband, upperband
+
+
+def _mean(values: list[float]) -> float:
+    """Mean summed left to right, like the seed of a TA-Lib moving average"""
+    total = 0.0
+    for value in values:
+        total += value
+    return total / len(values)
+
+
+def save_states(states: dict[str, dict[str, OnlineState]], path: Path) -> None:
+    """Write the online states of every symbol to a JSON file"""
+    Path(path).write_text(
+        json.dumps({symbol: {name: state.state() for name, state in items.items()} for symbol, items in states.items()})
+    )
+
+
+def load_states(path: Path) -> dict[str, dict[str, OnlineState]]:
+    """Read the online states written by save_states"""
+    return {
+        symbol: {name: OnlineState.restore(state) for name, state in items.items()}
+        for symbol, items in json.loads(Path(path).read_text()).items()
+    }
@@ -0,0 +1,254 @@
+from pandas import DataFrame, concat
+from contextlib import contextmanager
+from numpy import (
+    ndarray,
+    flatnonzero,
+    ascontiguousarray,
+    float64,
+    int64,
+    r_,
+    zeros,
+    arange,
+    repeat,
+    full,
+    nan,
+    cumsum,
+    searchsorted,
+    unique,
+    add,
+    asarray,
+    column_stack,
+    stack,
+)
+from collections import Counter
+from tqdm.auto import tqdm
+from typing import Callable, Iterator, Optional
+from time import perf_counter, thread_time
+from instrument import add_totals
+from kernels import trend_streaks, threshold_streaks
+from schema import STATE_PREFIX
+
+# Suffix of the result holding the states an indicator's kernels ended on, one row per symbol
+STATE_SUFFIX = "_state"
+
+
+class Intermediate:
+    """A named series shared by several indicators, computed once per panel"""
+
+    def __init__(self, name: str, func: Callable, inputs: Optional[Callable] = None) -> None:
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+
+    def dependencies(self, **params) -> list[tuple[str, dict]]:
+        """Intermediates this one reads for the given parameters"""
+        return self.inputs(**params) if self.inputs is not None else []
+
+
+INTERMEDIATES: dict[str, Intermediate] = {}
+
+
+def intermediate(name: str, inputs: Optional[Callable] = None) -> Callable:
+    """Register a function of (panel, **params) as a cached intermediate"""
+
+    def register(func: Callable) -> Callable:
+        INTERMEDIATES[name] = Intermediate(name=name, func=func, inputs=inputs)
+        return func
+
+    return register
+
+
+def cache_key(name: str, params: dict) -> tuple:
+    return (name, tuple(sorted(params.items())))
+
+
+def state_key(key: str) -> str:
+    """Result key of the states an indicator kept"""
+    return f"{key}{STATE_SUFFIX}"
+
+
+class Panel:
+    """OHLCV panel sorted once by (symbol, Date) with per-symbol row offsets.
+
+    seeds are the states the recursive kernels of a previous run ended on, one row per symbol with the Date of its
+    last row. The kernels carry on from them at the resume row of each symbol, the first one after that Date, and
+    the symbols without seeds start from their first row.
+    """
+
+    def __init__(self, df: DataFrame, seeds: Optional[DataFrame] = None) -> None:
+        self.df = df.sort_values(["symbol", "Date"], kind="mergesort").reset_index(drop=True)
+        symbols = self.df["symbol"].to_numpy()
+        n = len(symbols)
+        boundaries = flatnonzero(symbols[1:] != symbols[:-1]) + 1
+        self.starts = r_[0, boundaries].astype(int64) if n else zeros(0, dtype=int64)
+        self.ends = r_[boundaries, n].astype(int64) if n else zeros(0, dtype=int64)
+        self.symbols = symbols[self.starts]
+        self.segment_index = repeat(arange(len(self.starts), dtype=int64), self.ends - self.starts)
+        self._arrays = {}
+        self._cache = {}
+        self.cache_uses = Counter()
+        self._seeds = None
+        self.resume = self.starts.copy()
+        if seeds is not None and len(seeds) and n:
+            self._seeds = seeds.set_index("symbol").reindex(self.symbols)
+            last = self._seeds["Date"].fillna("").to_numpy()
+            after = self.df["Date"].to_numpy() > last[self.segment_index]
+            # dates are sorted within each symbol, so the rows after the seed are a suffix of every symbol
+            self.resume = self.ends - add.reduceat(after.astype(int64), self.starts)
+        # the states the kernels ended on by name, and the names kept by each intermediate or open scope
+        self.states = {}
+        self._kept = {}
+        self._scopes = []
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @property
+    def n_symbols(self) -> int:
+        return len(self.starts)
+
+    def array(self, col: str) -> ndarray:
+        """Contiguous float64 array of a column, built once and reused"""
+        if col not in self._arrays:
+            self._arrays[col] = ascontiguousarray(self.df[col].to_numpy(dtype=float64))
+        return self._arrays[col]
+
+    def source(self, name: str) -> ndarray:
+        """A column of the panel, or a parameterless intermediate such as "ohlc4" """
+        return self.array(name) if name in self.df.columns else self.get(name)
+
+    def get(self, name: str, count: bool = True, **params) -> ndarray:
+        """Intermediate series for the whole panel, computed on first use and cached for the rest of the run.
+
+        count False is for the scheduler computing an intermediate ahead of its consumers, which is not a use.
+        """
+        key = cache_key(name=name, params=params)
+        if key not in self._cache:
+            with self.scope() as kept:
+                self._cache[key] = INTERMEDIATES[name].func(panel=self, **params)
+            self._kept[key] = kept
+        for names in self._scopes:
+            names.update(self._kept[key])
+        if count:
+            self.cache_uses[key] += 1
+        return self._cache[key]
+
+    @contextmanager
+    def scope(self) -> Iterator[set]:
+        """Names of the states kept while the block runs, by itself or by the intermediates it reads"""
+        names = set()
+        self._scopes.append(names)
+        try:
+            yield names
+        finally:
+            self._scopes.pop()
+
+    def seed(self, name: str, width: int) -> ndarray:
+        """The seeded state of a kernel, one row per symbol, NaN for the symbols that start from their first row"""
+        seed = full((self.n_symbols, width), nan, dtype=float64)
+        if self._seeds is None:
+            return seed
+        columns = [f"{STATE_PREFIX}{name}:{j}" for j in range(width)]
+        missing = set(columns).difference(self._seeds.columns)
+        if missing:
+            raise ValueError(f"The stored states have no {name}, recompute the signals without incremental")
+        seed[:] = self._seeds[columns].to_numpy(dtype=float64)
+        return seed
+
+    def keep(self, name: str, state: ndarray) -> None:
+        """Keep the state a kernel ended on, one row per symbol, for the next run to carry on from"""
+        self.states[name] = asarray(state, dtype=float64).reshape(self.n_symbols, -1)
+        for names in self._scopes:
+            names.add(name)
+
+    def state_frame(self, names: set) -> DataFrame:
+        """The kept states of the names, one row per symbol with the Date of its last row"""
+        columns = {"Date": self.df["Date"].to_numpy()[self.ends - 1], "symbol": self.symbols}
+        for name in sorted(names):
+            for j, values in enumerate(self.states[name].T):
+                columns[f"{STATE_PREFIX}{name}:{j}"] = values
+        return DataFrame(columns)
+
+    def streaks(self, names: list[str], values: ndarray, threshold: Optional[float] = None) -> ndarray:
+        """trend_streaks of the columns of values (threshold_streaks when a threshold is given), carried on from the
+        seeded streak of each column's name and kept for the next run"""
+        values = asarray(values).reshape(len(values), -1)
+        seeds = stack([self.seed(name, width=2) for name in names], axis=1)
+        lengths, previous = seeds[:, :, 0], seeds[:, :, 1]
+        if threshold is None:
+            out = trend_streaks(values, self.starts, resume=self.resume, previous=previous, lengths=lengths)
+        else:
+            out = threshold_streaks(
+                values, self.starts, threshold=threshold, resume=self.resume, previous=previous, lengths=lengths
+            )
+        last = self.ends - 1
+        for j, name in enumerate(names):
+            self.keep(name, column_stack([out[last, j], values[last, j]]))
+        return out
+
+    def cache_report(self) -> DataFrame:
+        """Every cached intermediate with the number of times it was reused, every use after the first"""
+        return DataFrame(
+            [
+                {"intermediate": name, "params": dict(params), "hits": max(self.cache_uses[(name, params)] - 1, 0)}
+                for name, params in self._cache
+            ],
+            columns=["intermediate", "params", "hits"],
+        )
+
+    def apply(self, func: Callable, *arrays: ndarray, n_outputs: int = 1, **kwargs):
+        """Run an array function (e.g. a TA-Lib call) on every symbol slice and stitch the outputs together"""
+        outputs = [full(len(self), nan, dtype=float64) for _ in range(n_outputs)]
+        for _, start, end in self.segments():
+            result = func(*[values[start:end] for values in arrays], **kwargs)
+            for out, values in zip(outputs, result if n_outputs > 1 else (result,)):
+                out[start:end] = values
+        return outputs[0] if n_outputs == 1 else tuple(outputs)
+
+    def shift(self, values: ndarray, periods: int) -> ndarray:
+        """Shift values within each symbol, like groupby("symbol").shift(periods)"""
+        out = full(len(values), nan, dtype=float64)
+        source = arange(len(values), dtype=int64) - periods
+        valid = (source >= self.starts[self.segment_index]) & (source < self.ends[self.segment_index])
+        out[valid] = values[source[valid]]
+        return out
+
+    def assign(self, **columns: ndarray) -> DataFrame:
+        """A (Date, symbol) frame aligned to the panel rows with the given columns"""
+        return self.df.loc[:, ["Date", "symbol"]].assign(**columns)
+
+    def segments(self) -> Iterator[tuple[str, int, int]]:
+        """Iterate over (symbol, start, end) offsets"""
+        return zip(self.symbols, self.starts.tolist(), self.ends.tolist())
+
+    def frame(self, start: int, end: int) -> DataFrame:
+        """Rows of a single symbol"""
+        return self.df.iloc[start:end]
+
+
+def run_indicators(panel: Panel, indicators: dict[str, tuple[Callable, dict]], desc: str = "Indicators") -> dict:
+    """Run every indicator over each symbol slice in a single pass of the panel"""
+    outputs = {key: [] for key in indicators}
+    wall, cpu = {key: 0.0 for key in indicators}, {key: 0.0 for key in indicators}
+    for _, start, end in tqdm(panel.segments(), total=panel.n_symbols, desc=desc):
+        data = panel.frame(start=start, end=end)
+        for key, (func, kwargs) in indicators.items():
+            start_wall, start_cpu = perf_counter(), thread_time()
+            outputs[key].append(func(df=data, **kwargs))
+            wall[key] += perf_counter() - start_wall
+            cpu[key] += thread_time() - start_cpu
+    results = {key: concat(frames, ignore_index=True) for key, frames in outputs.items() if frames}
+    for key in indicators:
+        add_totals(name=key, kind="indicator", wall_s=wall[key], cpu_s=cpu[key], rows=len(results.get(key, ())))
+    return results
+
+
+def shard_bounds(panel: Panel, n_shards: int) -> list[tuple[int, int]]:
+    """Split the panel into at most n_shards contiguous row ranges of whole symbols with similar bar counts"""
+    if not panel.n_symbols:
+        return []
+    bars = cumsum(panel.ends - panel.starts)
+    targets = bars[-1] * arange(1, n_shards, dtype=float64) / n_shards
+    cuts = unique(r_[0, searchsorted(bars, targets, side="left") + 1, panel.n_symbols])
+    cuts = cuts[cuts <= panel.n_symbols]
+    return [(int(panel.starts[a]), int(panel.ends[b - 1])) for a, b in zip(cuts[:-1], cuts[1:]) if b > a]
@@ -1,27 +1,84 @@
-from pandas import read_hdf, read_parquet
+from pandas import read_hdf
 from pathlib import Path
+from schema import read_frame
+
+# Candlestick patterns computed by ta_lib.pattern_recognition, the position in the list is the stored pattern_id
+CANDLE_PATTERNS = [
+    "CDL2CROWS",
+    "CDL3BLACKCROWS",
+    "CDL3INSIDE",
+    "CDL3LINESTRIKE",
+    "CDL3OUTSIDE",
+    "CDL3STARSINSOUTH",
+    "CDL3WHITESOLDIERS",
+    "CDLABANDONEDBABY",
+    "CDLADVANCEBLOCK",
+    "CDLBELTHOLD",
+    "CDLBREAKAWAY",
+    "CDLCLOSINGMARUBOZU",
+    "CDLCONCEALBABYSWALL",
+    "CDLCOUNTERATTACK",
+    "CDLDARKCLOUDCOVER",
+    "CDLDOJI",
+    "CDLDOJISTAR",
+    "CDLDRAGONFLYDOJI",
+    "CDLENGULFING",
+    "CDLEVENINGDOJISTAR",
+    "CDLEVENINGSTAR",
+    "CDLGAPSIDESIDEWHITE",
+    "CDLGRAVESTONEDOJI",
+    "CDLHAMMER",
+    "CDLHANGINGMAN",
+    "CDLHARAMI",
+    "CDLHARAMICROSS",
+    "CDLHIGHWAVE",
+    "CDLHIKKAKE",
+    "CDLHIKKAKEMOD",
+    "CDLHOMINGPIGEON",
+    "CDLIDENTICAL3CROWS",
+    "CDLINNECK",
+    "CDLINVERTEDHAMMER",
+    "CDLKICKING",
+    "CDLKICKINGBYLENGTH",
+    "CDLLADDERBOTTOM",
+    "CDLLONGLEGGEDDOJI",
+    "CDLLONGLINE",
+    "CDLMARUBOZU",
+    "CDLMATCHINGLOW",
+    "CDLMATHOLD",
+    "CDLMORNINGDOJISTAR",
+    "CDLMORNINGSTAR",
+    "CDLONNECK",
+    "CDLPIERCING",
+    "CDLRICKSHAWMAN",
+    "CDLRISEFALL3METHODS",
+    "CDLSEPARATINGLINES",
+    "CDLSHOOTINGSTAR",
+    "CDLSHORTLINE",
+    "CDLSPINNINGTOP",
+    "CDLSTALLEDPATTERN",
+    "CDLSTICKSANDWICH",
+    "CDLTAKURI",
+    "CDLTASUKIGAP",
+    "CDLTHRUSTING",
+    "CDLTRISTAR",
+    "CDLUNIQUE3RIVER",
+    "CDLUPSIDEGAP2CROWS",
+    "CDLXSIDEGAP3METHODS",
+]
 
 
 def get_patterns(path: Path, period: str, symbol: str) -> dict:
     """Read the pattern data from disk"""
-    df = (
-        read_parquet(path=path / f"signals/{period}/pattern_recognition.parquet")
-        .query(f'symbol == "{symbol}"')
-        .reset_index(drop=True)
-    )
-    value_cols = [col for col in df.columns if col not in ["Date", "symbol"]]
-
-    df = (
-        df.melt(id_vars=["Date"], value_name="value", value_vars=value_cols, var_name="indicator")
-        .sort_values("Date")
-        .groupby(["Date", "value"])
-        .agg(list)
-    )
-    df["indicator"] = df["indicator"].apply(lambda l: ";".join(l))
+    df = read_frame(
+        path=path / f"signals/{period}/pattern_recognition.parquet", filters=[("symbol", "==", symbol)]
+    ).sort_values("Date", kind="mergesort")
+    df["indicator"] = [CANDLE_PATTERNS[pattern_id] for pattern_id in df["pattern_id"]]
+    df = df.groupby(["Date", "value"])["indicator"].agg(";".join).reset_index(drop=False)
 
     return {
-        "up": df.query("value == 100").reset_index(drop=False).loc[:, ["Date", "indicator"]].to_dict(orient="list"),
-        "down": df.query("value == -100").reset_index(drop=False).loc[:, ["Date", "indicator"]].to_dict(orient="list"),
+        "up": df.loc[df["value"] == 10, ["Date", "indicator"]].to_dict(orient="list"),
+        "down": df.loc[df["value"] == -10, ["Date", "indicator"]].to_dict(orient="list"),
     }
 
 
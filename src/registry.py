@@ -0,0 +1,407 @@
+from graphlib import TopologicalSorter
+from pandas import DataFrame, Series
+from icecream import ic
+from typing import Callable, Optional
+
+from ta_lib import *
+from ha import heikin_ashi_panel
+from future_calcs import future_labels
+from screener import CROSSOVERS
+from numpy import ndarray, arange, int64, maximum, where, isin
+from panel import Panel, INTERMEDIATES, STATE_SUFFIX, cache_key, state_key, run_indicators
+from ta_utils import validate_panel, validated_panel
+from instrument import measure, rows
+
+
+class Indicator:
+    """An indicator result, the panel columns and intermediates it reads and the results it must follow"""
+
+    def __init__(
+        self,
+        key: str,
+        func: Callable,
+        params: Optional[dict] = None,
+        inputs: Optional[list[tuple[str, dict]]] = None,
+        after: Optional[list[str]] = None,
+        per_symbol: bool = False,
+        lookback: Optional[int] = None,
+        lookahead: int = 0,
+        columns: Optional[list[str]] = None,
+        seeded: bool = False,
+    ) -> None:
+        self.key = key
+        self.func = func
+        self.params = params or {}
+        self.inputs = inputs or []
+        self.after = after or []
+        self.per_symbol = per_symbol
+        # bars of history a row depends on (None for indicators that depend on all of it)
+        self.lookback = lookback
+        # carries its recursions on from the states the last run kept, so with those it only needs its lookback
+        self.seeded = seeded
+        # bars after a row that change its value
+        self.lookahead = lookahead
+        # panel columns it reads, directly or through its intermediates, validated once before the run
+        self.columns = ["Date", "symbol"] + (columns or [])
+
+
+def _crossover_windows(name: str, averages: list[str]) -> tuple[str, tuple[int, int]]:
+    """The kind and (short, long) windows of a crossover, which names two averages of one kind, e.g. [sma5, sma10]"""
+    kinds, windows = set(), []
+    for average in averages:
+        kind = next((kind for kind in MOVING_AVERAGES if average.startswith(kind)), None)
+        if kind is None or not average[len(kind) :].isdigit():
+            break
+        kinds.add(kind)
+        windows.append(int(average[len(kind) :]))
+    else:
+        if len(windows) == 2 and len(kinds) == 1:
+            return kinds.pop(), tuple(windows)
+    raise ValueError(
+        f"Crossover {name} must name two moving averages of one kind in {list(MOVING_AVERAGES)}, e.g. [sma5, sma10], "
+        f"not {averages}"
+    )
+
+
+def moving_average_indicators(
+    moving_averages: Optional[dict[str, list[int]]] = None,
+    crossovers: Optional[dict[str, list[str]]] = None,
+    ratios: Optional[dict[str, dict[str, list[list[int]]]]] = None,
+) -> list[Indicator]:
+    """One SMA and one EMA family indicator, with the windows per kind, the ratio pairs and streak pairs per kind and
+    the crossover pairs (the screener ones when None) to track streaks of. A kind missing from moving_averages or
+    ratios takes the MOVING_AVERAGES defaults, and its windows are the configured ones plus those its pairs use."""
+    crossover_pairs = {kind: [] for kind in MOVING_AVERAGES}
+    for name, averages in (CROSSOVERS if crossovers is None else crossovers).items():
+        kind, pair = _crossover_windows(name=name, averages=averages)
+        crossover_pairs[kind].append(pair)
+    indicators = []
+    for kind, defaults in MOVING_AVERAGES.items():
+        windows = list((moving_averages or {}).get(kind, defaults["windows"]))
+        kind_ratios = (ratios or {}).get(kind, {"pairs": defaults["ratios"], "streaks": defaults["streaks"]})
+        pairs = [tuple(pair) for pair in kind_ratios.get("pairs", [])]
+        streaks = [tuple(pair) for pair in kind_ratios.get("streaks", [])]
+        streaks += [pair for pair in crossover_pairs[kind] if pair not in streaks]
+        pairs += [pair for pair in streaks if pair not in pairs]
+        windows += sorted({window for pair in pairs for window in pair}.difference(windows))
+        if kind == "sma":
+            inputs = [("sma", {"col": "Close", "timeperiod": window}) for window in windows]
+            lookback = max(windows, default=1) - 1
+        else:
+            inputs = [("ema_family", {"col": "Close", "timeperiods": tuple(windows)})]
+            lookback = 0
+        indicators.append(
+            Indicator(
+                key=kind,
+                func=moving_average_family,
+                params={"kind": kind, "windows": windows, "ratios": pairs, "streaks": streaks, "col": "Close"},
+                inputs=inputs,
+                lookback=lookback,
+                columns=["Close"],
+                seeded=True,
+            )
+        )
+    return indicators
+
+
+def default_indicators(
+    patterns: Optional[list[str]] = None,
+    moving_averages: Optional[dict[str, list[int]]] = None,
+    crossovers: Optional[dict[str, list[str]]] = None,
+    ratios: Optional[dict[str, dict[str, list[list[int]]]]] = None,
+) -> list[Indicator]:
+    """Indicators computed for every symbol.
+
+    patterns are the candlestick patterns to look for (all when None), moving_averages the windows per kind ("sma",
+    "ema"), ratios the pairs per kind whose ratios and ratio streaks are computed and crossovers the moving average
+    pairs the screeners use.
+    """
+    indicators = [
+        Indicator(
+            key="heikin_ashi",
+            func=heikin_ashi_panel,
+            lookback=0,
+            columns=["Open", "High", "Low", "Close", "Volume"],
+            seeded=True,
+        ),
+        Indicator(
+            key="supertrend",
+            func=supertrend_panel,
+            params={"timeperiod": 10, "multiplier": 2.0},
+            inputs=[("true_range", {})],
+            lookback=1,
+            columns=["High", "Low", "Close"],
+            seeded=True,
+        ),
+        Indicator(
+            key="periods_since_extremes",
+            func=periods_since_extremes,
+            params={"num_periods": [10, 20, 40], "low_column": "Low", "high_column": "High"},
+            lookback=40,
+            columns=["Low", "High"],
+        ),
+        Indicator(
+            key="mansfield_rsi",
+            func=mansfield_rsi_panel,
+            inputs=[("sma", {"col": "relative_performance", "timeperiod": 40})],
+            columns=["Close", "index_close"],
+        ),
+        Indicator(
+            key="bollinger_bands",
+            func=bollinger_bands_panel,
+            inputs=[("sma", {"col": "Close", "timeperiod": 5}), ("stddev", {"col": "Close", "timeperiod": 5})],
+            lookback=4,
+            columns=["Close"],
+            seeded=True,
+        ),
+        Indicator(
+            key="rsi",
+            func=rsi_panel,
+            inputs=[("rsi_ema", {"col": "Close", "timeperiod": 14, "ema_length": 10})],
+            lookback=0,
+            columns=["Close"],
+            seeded=True,
+        ),
+        Indicator(
+            key="stochastic_rsi",
+            func=stochastic_rsi_panel,
+            inputs=[
+                (
+                    "stochastic_rsi",
+                    {"col": "Close", "timeperiod": 14, "fastk_period": 5, "fastd_period": 3, "fastd_matype": 0},
+                )
+            ],
+            lookback=0,
+            columns=["Close"],
+            seeded=True,
+        ),
+        Indicator(key="macd", func=macd_panel, lookback=1, columns=["Close"], seeded=True),
+        Indicator(
+            key="natr_14",
+            func=natr_panel,
+            params={"timeperiod": 14},
+            inputs=[("atr", {"timeperiod": 14})],
+            lookback=1,
+            columns=["High", "Low", "Close"],
+            seeded=True,
+        ),
+        Indicator(
+            key="volume_ema_10",
+            func=volume_ema_panel,
+            params={"timeperiod": 10},
+            inputs=[("ema", {"col": "Volume", "timeperiod": 10})],
+            lookback=0,
+            columns=["Volume"],
+            seeded=True,
+        ),
+        Indicator(
+            key="volume_sma_21",
+            func=volume_sma_panel,
+            params={"timeperiod": 21},
+            inputs=[("sma", {"col": "Volume", "timeperiod": 21})],
+            lookback=20,
+            columns=["Volume"],
+            seeded=True,
+        ),
+        Indicator(key="obv", func=obv_panel, lookback=0, columns=["Volume", "Close"], seeded=True),
+        *moving_average_indicators(moving_averages=moving_averages, crossovers=crossovers, ratios=ratios),
+        Indicator(
+            key="sata_moving_averages",
+            func=sata_moving_averages_panel,
+            inputs=[("ema", {"col": "ohlc4", "timeperiod": 10})]
+            + [("sma", {"col": "Close", "timeperiod": n}) for n in [7, 30, 40]],
+            # the ratios to the previous bar's averages
+            lookback=40,
+            columns=["Open", "High", "Low", "Close"],
+            seeded=True,
+        ),
+    ]
+    stage_params = {"short_moving_average": 50, "long_moving_average": 200, "trend_smoothing": 5}
+    indicators.append(
+        Indicator(
+            key="stages",
+            func=stages_panel,
+            params=stage_params,
+            inputs=[("block_sums", {"col": "Close"})],
+            # the smoothed change of the long average from the bar before its window
+            lookback=stage_params["long_moving_average"] + stage_params["trend_smoothing"] - 1,
+            columns=["Close"],
+        )
+    )
+    indicators.append(
+        Indicator(
+            key="linear_regression",
+            func=linear_regression,
+            params={"num_periods": [10, 20, 40], "deviations": 2, "col": "Close"},
+            lookback=40,
+            columns=["Close"],
+            seeded=True,
+        )
+    )
+    for num_periods in [1, 2, 5, 10, 20]:
+        indicators.append(
+            Indicator(
+                key=f"change_ratio_{num_periods}",
+                func=change_ratio_panel,
+                params={"num_periods": num_periods, "col": "Close"},
+                lookback=num_periods,
+                columns=["Close"],
+            )
+        )
+    indicators.append(
+        Indicator(
+            key="pattern_recognition",
+            func=pattern_recognition,
+            params={"patterns": patterns},
+            columns=["Open", "High", "Low", "Close"],
+        )
+    )
+    indicators.append(
+        Indicator(
+            key="future_labels",
+            func=future_labels,
+            params={"max_cols": ["Close", "High"], "end_cols": ["Close"], "horizons": [2, 5, 10, 20, 40]},
+            lookback=0,
+            lookahead=40,
+            columns=["Close", "High"],
+        )
+    )
+    return indicators
+
+
+def select_indicators(indicators: list[Indicator], keys: Optional[list[str]] = None) -> list[Indicator]:
+    """The indicators with the given keys (all of them when None), in their original order"""
+    if keys is None:
+        return indicators
+    unknown = set(keys).difference(indicator.key for indicator in indicators)
+    if unknown:
+        raise ValueError(
+            f"Unknown indicators: {', '.join(sorted(unknown))}. "
+            f"Indicators are: {', '.join(indicator.key for indicator in indicators)}"
+        )
+    return [indicator for indicator in indicators if indicator.key in keys]
+
+
+def _intermediate_graph(name: str, params: dict, graph: dict, nodes: dict) -> tuple:
+    """Add an intermediate and everything it reads to the graph"""
+    node = ("intermediate", cache_key(name=name, params=params))
+    if node not in graph:
+        nodes[node] = (name, params)
+        graph[node] = set()
+        for dep_name, dep_params in INTERMEDIATES[name].dependencies(**params):
+            graph[node].add(_intermediate_graph(name=dep_name, params=dep_params, graph=graph, nodes=nodes))
+    return node
+
+
+def execution_order(indicators: list[Indicator]) -> list[tuple[tuple, object]]:
+    """Intermediates and indicators in dependency order, each shared intermediate listed once"""
+    graph, nodes = {}, {}
+    keys = {indicator.key for indicator in indicators}
+    for indicator in indicators:
+        node = ("indicator", indicator.key)
+        nodes[node] = indicator
+        graph[node] = {("indicator", key) for key in indicator.after if key in keys}
+        for name, params in indicator.inputs:
+            graph[node].add(_intermediate_graph(name=name, params=params, graph=graph, nodes=nodes))
+    return [(node, nodes[node]) for node in TopologicalSorter(graph).static_order()]
+
+
+def run_registry(
+    panel: Panel, indicators: list[Indicator], desc: str = "Indicators", debug: bool = False
+) -> dict[str, DataFrame]:
+    """Compute every shared intermediate once, then every indicator, grouping the per-symbol ones into one pass.
+
+    A seeded indicator's result comes with the states its kernels ended on, under its state_key, for the next
+    incremental run to carry on from.
+
+    The panel is validated once against the columns every indicator declares, so the indicators skip their own
+    validate_columns calls. debug turns those calls back on, which repeats them for every symbol of the per-symbol
+    indicators.
+    """
+    validate_panel(
+        df_columns=panel.df.columns, required_columns={indicator.key: indicator.columns for indicator in indicators}
+    )
+    results = {}
+    per_symbol = {}
+    with validated_panel(debug=debug):
+        for (kind, _), item in execution_order(indicators=indicators):
+            if kind == "intermediate":
+                name, params = item
+                with measure(name, kind="intermediate") as record:
+                    record["rows"] = rows(panel.get(name, count=False, **params))
+            elif item.per_symbol:
+                per_symbol[item.key] = (item.func, item.params)
+            else:
+                ic(item.key)
+                with measure(item.key, kind="indicator") as record, panel.scope() as kept:
+                    result = item.func(panel=panel, **item.params)
+                    record["rows"] = rows(result)
+                results.update(result if isinstance(result, dict) else {item.key: result})
+                if item.seeded and kept:
+                    results[state_key(item.key)] = panel.state_frame(names=kept)
+        if per_symbol:
+            results.update(run_indicators(panel=panel, indicators=per_symbol, desc=desc))
+    return results
+
+
+def stored_seeds(
+    panel: Panel, indicators: list[Indicator], first_new: ndarray, states: dict[str, DataFrame]
+) -> DataFrame:
+    """The stored states of the indicators, for the symbols whose states all end on the bar before their new ones"""
+    has_previous = first_new > panel.starts
+    previous_date = Series(panel.df["Date"].to_numpy()[first_new[has_previous] - 1], index=panel.symbols[has_previous])
+    seeds = None
+    for indicator in indicators:
+        state = states.get(state_key(indicator.key))
+        if state is None:
+            return DataFrame(columns=["Date", "symbol"])
+        state = state.loc[state["Date"] == state["symbol"].map(previous_date)].set_index("symbol")
+        # a symbol stored before the indicator kept every state it keeps now starts over
+        state = state.loc[state.filter(regex=r":0$").notna().all(axis=1)]
+        if seeds is None:
+            seeds = state
+        else:
+            seeds = seeds.join(state.loc[:, state.columns.difference(seeds.columns)], how="inner")
+    return seeds.reset_index() if seeds is not None else DataFrame(columns=["Date", "symbol"])
+
+
+def run_incremental(
+    panel: Panel,
+    indicators: list[Indicator],
+    first_new: ndarray,
+    states: Optional[dict[str, DataFrame]] = None,
+    debug: bool = False,
+) -> dict[str, DataFrame]:
+    """Recompute the rows from first_new (a row offset per symbol) on, reading only the history each indicator needs.
+
+    Rows within an indicator's lookahead of the new bars are recomputed too. Symbols without new bars are skipped.
+    The seeded indicators carry on from the stored states (keyed by state_key), and read the whole history of the
+    symbols without one.
+    """
+    groups = {}
+    for indicator in indicators:
+        if indicator.seeded and indicator.lookahead:
+            raise ValueError(f"{indicator.key} carries on from its states, so it can not look ahead")
+        groups.setdefault((indicator.lookback, indicator.lookahead, indicator.seeded), []).append(indicator)
+
+    rows = arange(len(panel), dtype=int64)
+    updated = first_new < panel.ends
+    results = {}
+    for (lookback, lookahead, seeded), group in groups.items():
+        emit = maximum(first_new - lookahead, panel.starts)
+        begin = panel.starts if lookback is None else maximum(emit - lookback, panel.starts)
+        seeds = None
+        if seeded:
+            seeds = stored_seeds(panel=panel, indicators=group, first_new=first_new, states=states or {})
+            begin = where(isin(panel.symbols, seeds["symbol"]), begin, panel.starts)
+        selected = updated[panel.segment_index] & (rows >= begin[panel.segment_index])
+        # the first recomputed Date of each symbol, which also filters event tables that are not one row per bar
+        emit_date = Series(panel.df["Date"].to_numpy()[emit[updated]], index=panel.symbols[updated])
+        ic(f"Incremental - lookback {lookback}, lookahead {lookahead}, seeded {seeded}: {selected.sum()} rows")
+        sub_panel = Panel(df=panel.df.loc[selected], seeds=seeds)
+        for key, result in run_registry(panel=sub_panel, indicators=group, debug=debug).items():
+            if key.endswith(STATE_SUFFIX):
+                results[key] = result
+            else:
+                results[key] = result.loc[result["Date"] >= result["symbol"].map(emit_date)].reset_index(drop=True)
+    return results
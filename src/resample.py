@@ -0,0 +1,53 @@
+from pandas import DataFrame, to_datetime
+from numpy import ndarray, flatnonzero, r_, fmax, fmin, add, int64, isnan
+
+
+PERIODS = ["W", "M"]
+
+
+def period_start(dates: ndarray, period: str) -> ndarray:
+    """First calendar day of the week (Monday) or month of each date, like the Yahoo weekly and monthly bars"""
+    days = dates.astype("datetime64[D]")
+    if period == "W":
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 is the weekday with Monday as 0
+        return days - (days.view(int64) + 3) % 7
+    if period == "M":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Period must be one of {PERIODS}, not {period}")
+
+
+def _nansum_at(values: ndarray, starts: ndarray) -> ndarray:
+    """Sum of each run of values beginning at starts, skipping missing values like the Yahoo bars do"""
+    if values.dtype.kind == "f":
+        values = values.copy()
+        values[isnan(values)] = 0
+    return add.reduceat(values, starts)
+
+
+def resample_ohlcv(df: DataFrame, period: str = "W") -> DataFrame:
+    """Build weekly or monthly OHLCV bars from daily bars with one reduction per column over each (symbol, period)"""
+    df = df.sort_values(["symbol", "Date"], kind="mergesort").reset_index(drop=True)
+    symbols = df["symbol"].to_numpy()
+    starts_on = period_start(dates=to_datetime(df["Date"]).to_numpy(), period=period)
+
+    n = len(df)
+    if n == 0:
+        return df.loc[:, ["Date", "Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits", "symbol"]]
+    changed = (symbols[1:] != symbols[:-1]) | (starts_on[1:] != starts_on[:-1])
+    starts = r_[0, flatnonzero(changed) + 1]
+    ends = r_[starts[1:], n]
+
+    bars = {
+        "Date": starts_on[starts].astype(str),
+        "Open": df["Open"].to_numpy()[starts],
+        "High": fmax.reduceat(df["High"].to_numpy(), starts),
+        "Low": fmin.reduceat(df["Low"].to_numpy(), starts),
+        "Close": df["Close"].to_numpy()[ends - 1],
+        "Volume": _nansum_at(values=df["Volume"].to_numpy(), starts=starts),
+    }
+    if "Dividends" in df.columns:
+        bars["Dividends"] = _nansum_at(values=df["Dividends"].to_numpy(), starts=starts)
+    if "Stock Splits" in df.columns:
+        bars["Stock Splits"] = fmax.reduceat(df["Stock Splits"].to_numpy(), starts)
+    bars["symbol"] = symbols[starts]
+    return DataFrame(bars)
@@ -0,0 +1,128 @@
+import os
+import shutil
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import DataFrame, Series, to_datetime
+from numpy import iinfo, int8, int16, float64
+from pathlib import Path
+from typing import Optional
+
+
+# Columns stored as dictionaries and read back as categoricals
+CATEGORY_COLUMNS = ["symbol", "index_symbol"]
+# Integer flags (trends, signals, crossovers, stages and the pattern values) stored as int8
+FLAG_COLUMNS = [
+    "HA_Signal",
+    "HA_Trend",
+    "supertrend",
+    "macdtrend",
+    "stochastic_rsi_crossover",
+    "value",
+    "stage",
+    "Short_trend",
+    "Long_trend",
+    "Short_Long_trend",
+]
+# Floats that lose too much as float32, share volumes and their running total
+FLOAT64_COLUMNS = ["Volume", "obv"]
+# Prefix of the columns of the states the recursive kernels ended on, kept exact so a refresh carries on from them
+STATE_PREFIX = "state:"
+# The prices every indicator is computed from, kept exact in the OHLCV files so a rerun from disk matches a download
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+
+
+def _fits(values: Series, dtype: type) -> bool:
+    """True when every value of an integer column fits in the dtype, missing ones (of a nullable column) aside"""
+    values = values.dropna()
+    return values.empty or (iinfo(dtype).min <= values.min() and values.max() <= iinfo(dtype).max)
+
+
+def column_type(name: str, values: Series, exact: tuple[str, ...] = (), narrow: bool = True) -> Optional[pa.DataType]:
+    """Storage type of a column, None to keep the type Arrow infers. narrow False gives flags and streaks a width
+    that does not depend on their values, so every part of a partitioned dataset has the same type."""
+    if name == "Date":
+        return pa.date32()
+    if name in CATEGORY_COLUMNS:
+        return pa.dictionary(pa.int32(), pa.string())
+    if values.dtype.kind == "i":
+        if name in FLAG_COLUMNS and (not narrow or _fits(values, int8)):
+            return pa.int8() if narrow else pa.int16()
+        if name.lower().endswith("streak") and (not narrow or _fits(values, int16)):
+            return pa.int16() if narrow else pa.int32()
+        return None
+    if values.dtype.kind == "f":
+        full_precision = name in FLOAT64_COLUMNS or name in exact or name.startswith(STATE_PREFIX)
+        return pa.float64() if full_precision else pa.float32()
+    return None
+
+
+def storage_schema(df: DataFrame, exact: tuple[str, ...] = (), narrow: bool = True) -> pa.Schema:
+    """Compact Arrow schema of a frame: date32 dates, dictionary symbols, int8 flags, int16 streaks, float32 values"""
+    fields = []
+    for name in df.columns:
+        dtype = column_type(name=name, values=df[name], exact=exact, narrow=narrow)
+        fields.append(
+            pa.field(name, dtype if dtype is not None else pa.Schema.from_pandas(df[[name]]).field(name).type)
+        )
+    return pa.schema(fields)
+
+
+def write_frame(df: DataFrame, path: Path, exact: tuple[str, ...] = (), schema: Optional[pa.Schema] = None) -> None:
+    """Write a frame to parquet with the compact schema (or the given one), keeping the exact columns at full precision.
+
+    The file is written next to the path and renamed over it, so readers never see a partially written file. The
+    temporary name starts with an underscore, which pyarrow skips when it reads a directory, so a part left half
+    written by a crash is not read as a part of its dataset. A partitioned dataset at the path, left by a streaming
+    run, is replaced.
+    """
+    if "Date" in df.columns:
+        df = df.assign(Date=to_datetime(df["Date"]).to_numpy().astype("datetime64[D]"))
+    schema = schema if schema is not None else storage_schema(df=df, exact=exact)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False, safe=False)
+    temporary = Path(path).with_name(f"_{Path(path).name}.tmp")
+    pq.write_table(table, temporary)
+    if Path(path).is_dir():
+        shutil.rmtree(path)
+    os.replace(temporary, path)
+
+
+def write_part(df: DataFrame, path: Path, part: int, exact: tuple[str, ...] = ()) -> Path:
+    """Write a frame as one part of the partitioned dataset at path, a directory read_frame reads as one frame.
+
+    Parts are written in order. Every part takes the schema of the first one (with the exact columns at full
+    precision), so a column that is integer in one part and has missing values (floats) in another is stored the same
+    way in both.
+    """
+    path = Path(path)
+    if part == 0:
+        # the first part starts the dataset over, replacing a file or the parts of an earlier run
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+    path.mkdir(parents=True, exist_ok=True)
+    parts = sorted(path.glob("part-*.parquet"))
+    schema = pq.read_schema(parts[0]).remove_metadata() if parts else storage_schema(df=df, exact=exact, narrow=False)
+    part_path = path / f"part-{part:05d}.parquet"
+    write_frame(df=df, path=part_path, schema=schema)
+    return part_path
+
+
+def read_frame(path: Path, columns: Optional[list[str]] = None, filters: Optional[list] = None) -> DataFrame:
+    """Read a parquet file written by write_frame, or a partitioned dataset written by write_part, with Date as
+    datetime64 and the symbols as categoricals"""
+    return pq.read_table(path, columns=columns, filters=filters).to_pandas(date_as_object=False)
+
+
+def expand(df: DataFrame) -> DataFrame:
+    """Convert a frame read by read_frame back to the types the calculations use: string dates, string symbols and
+    float64 values"""
+    df = df.copy()
+    if "Date" in df.columns:
+        df["Date"] = df["Date"].to_numpy().astype("datetime64[D]").astype(str).astype(object)
+    for name in df.columns:
+        if name in CATEGORY_COLUMNS:
+            df[name] = df[name].astype(str).astype(object)
+        elif df[name].dtype.kind == "f":
+            df[name] = df[name].astype(float64)
+    return df
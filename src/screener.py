@@ -1,12 +1,27 @@
 from pandas import DataFrame, Series
 from numpy import where
+from typing import Optional
+
+
+# screener label to the (short, long) moving averages it crosses, overridden by config.crossovers
+CROSSOVERS = {
+    "sma1": ["sma5", "sma10"],
+    "sma2": ["sma10", "sma20"],
+    "sma3": ["sma20", "sma50"],
+    "sma4": ["sma20", "sma100"],
+    "sma5": ["sma30", "sma100"],
+    "sma6": ["sma50", "sma100"],
+    "sma7": ["sma50", "sma200"],
+    "sma8": ["sma100", "sma200"],
+}
 
 
 class Screener:
     def __init__(
         self,
+        crossovers: Optional[dict[str, list[str]]] = None,
     ):
-        pass
+        self.crossovers = crossovers or CROSSOVERS
 
     def apply_screeners(self, df: DataFrame, screeners: list[str], trend: int = 1) -> DataFrame:
         """Apply screeners"""
@@ -20,22 +35,9 @@ class Screener:
             df = self.macd_screener(df=df, trend=trend, max_streak=1000)
         if "srsi" in screeners and df is not None:
             df = self.stoch_rsi_screener(df=df, trend=trend)
-        if "sma1" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma5", ma2="sma10")
-        if "sma2" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma10", ma2="sma20")
-        if "sma3" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma20", ma2="sma50")
-        if "sma4" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma20", ma2="sma100")
-        if "sma5" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma30", ma2="sma100")
-        if "sma6" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma50", ma2="sma100")
-        if "sma7" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma50", ma2="sma200")
-        if "sma8" in screeners and df is not None:
-            df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1="sma100", ma2="sma200")
+        for label, (ma1, ma2) in self.crossovers.items():
+            if label in screeners and df is not None:
+                df = self.ma_screener(df=df, trend=trend, min_streak=1, max_streak=2, ma1=ma1, ma2=ma2)
         return df
 
     def ha_streak_screener(self, df: DataFrame, min_streak: int = 1, max_streak: int = 2, trend: int = 1) -> DataFrame:
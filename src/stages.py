@@ -0,0 +1,93 @@
+import json
+import os
+from hashlib import sha256
+from importlib import import_module
+from pathlib import Path
+from threading import Lock
+from pandas import DataFrame
+from pandas.util import hash_pandas_object
+
+
+# Bump when the manifest layout changes, so older manifests are ignored
+MANIFEST_VERSION = 1
+# Modules whose code decides the signal values, a change to any of them invalidates the stored signals
+SIGNAL_MODULES = [
+    "calcs",
+    "registry",
+    "panel",
+    "intermediates",
+    "kernels",
+    "ta_lib",
+    "ta_utils",
+    "ha",
+    "future_calcs",
+    "schema",
+]
+
+
+def file_digest(path: Path) -> str:
+    """sha256 of a file's bytes"""
+    digest = sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def frame_digest(df: DataFrame) -> str:
+    """sha256 of a frame's column names and values, ignoring the index"""
+    digest = sha256(json.dumps([str(col) for col in df.columns]).encode())
+    digest.update(hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def code_digest(modules: list[str]) -> str:
+    """sha256 of the source files of modules"""
+    digest = sha256()
+    for name in modules:
+        digest.update(name.encode())
+        digest.update(Path(import_module(name).__file__).read_bytes())
+    return digest.hexdigest()
+
+
+def fingerprint(**parts) -> str:
+    """sha256 of the digests and parameters a stage's outputs depend on"""
+    return sha256(json.dumps({"version": MANIFEST_VERSION, **parts}, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Manifest:
+    """Record of a pipeline stage: the fingerprint of its inputs, code and parameters and the steps it completed with
+    their output files.
+
+    A manifest with another fingerprint is discarded, so a stage only resumes from outputs of the same inputs. It is
+    rewritten after every completed step through a temporary file, so a crash leaves the previous manifest.
+    """
+
+    def __init__(self, path: Path, stage_fingerprint: str, resume: bool = True) -> None:
+        self.path = Path(path)
+        self.fingerprint = stage_fingerprint
+        self.steps = {}
+        self.lock = Lock()
+        if resume and self.path.exists():
+            stored = json.loads(self.path.read_text())
+            if stored.get("fingerprint") == self.fingerprint:
+                self.steps = stored.get("steps", {})
+
+    def done(self, step: str) -> bool:
+        """True when the step completed and all of its outputs are still on disk"""
+        outputs = self.steps.get(step)
+        return outputs is not None and all(Path(output).exists() for output in outputs)
+
+    def outputs(self, steps: list[str]) -> list[str]:
+        """Output files of the steps, each listed once"""
+        return list(dict.fromkeys(output for step in steps for output in self.steps.get(step, [])))
+
+    def record(self, steps: list[str], outputs: list[Path]) -> None:
+        """Mark the steps completed with the output files they wrote"""
+        with self.lock:
+            for step in steps:
+                self.steps[step] = [str(output) for output in outputs]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_suffix(".tmp")
+            temporary.write_text(json.dumps({"fingerprint": self.fingerprint, "steps": self.steps}, indent=2))
+            os.replace(temporary, self.path)
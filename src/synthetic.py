@@ -0,0 +1,139 @@
+from pandas import DataFrame, bdate_range, concat
+from numpy import exp, cumsum, maximum, minimum, round, where, arange, zeros, float64
+from numpy.random import default_rng
+from pathlib import Path
+from typing import Optional
+
+from resample import resample_ohlcv
+from schema import write_frame, PRICE_COLUMNS
+from utilities import SECTOR_ETFS, camelcase, make_directories
+
+
+# Exchange holidays of the synthetic calendar per year, as (month, day), shared by every symbol
+HOLIDAYS = [(1, 1), (1, 16), (2, 20), (4, 7), (5, 29), (7, 4), (9, 4), (11, 23), (12, 25)]
+
+
+def trading_days(n_bars: int, start: str = "2019-01-02") -> list[str]:
+    """n_bars business days from start, without the synthetic holidays"""
+    days = bdate_range(start=start, periods=int(n_bars * 1.06) + 20)
+    days = days[~days.map(lambda day: (day.month, day.day) in HOLIDAYS)]
+    return list(days[:n_bars].strftime("%Y-%m-%d"))
+
+
+def synthetic_prices(
+    n_symbols: int = 100,
+    n_bars: int = 1260,
+    seed: int = 0,
+    start: str = "2019-01-02",
+    late_listings: float = 0.2,
+    missing_bars: float = 0.005,
+    splits: float = 0.05,
+) -> DataFrame:
+    """Daily OHLCV bars shaped like the Yahoo download: every index ETF plus n_symbols stocks, deterministic for a seed.
+
+    Closes follow a market factor, the factor of the stock's sector and noise, so the index ETFs move with their
+    stocks. late_listings of the stocks start trading partway through, missing_bars of the bars are missing (halts),
+    opens gap from the previous close, and splits of the stocks have one split, flagged in Stock Splits with the prices
+    adjusted as Yahoo does. Dividends are paid quarterly by half the stocks.
+    """
+    rng = default_rng(seed)
+    dates = trading_days(n_bars=n_bars, start=start)
+    sectors = [symbol for symbol in SECTOR_ETFS if symbol != "SPY"]
+    market = rng.normal(0.0003, 0.01, n_bars)
+    sector_moves = {symbol: market + rng.normal(0, 0.006, n_bars) for symbol in sectors}
+
+    frames = []
+    symbols = list(SECTOR_ETFS) + [f"S{number:04d}" for number in range(n_symbols)]
+    for number, symbol in enumerate(symbols):
+        if symbol == "SPY":
+            returns, first = market, 0
+        elif symbol in sector_moves:
+            returns, first = sector_moves[symbol], 0
+        else:
+            beta = rng.uniform(0.6, 1.6)
+            returns = beta * sector_moves[sectors[number % len(sectors)]] + rng.normal(0, 0.015, n_bars)
+            first = int(rng.integers(0, n_bars // 2)) if rng.random() < late_listings else 0
+        kept = arange(first, n_bars)
+        if symbol not in SECTOR_ETFS:
+            kept = kept[rng.random(len(kept)) >= missing_bars]
+        n = len(kept)
+
+        close = rng.uniform(5, 400) * exp(cumsum(returns[kept]))
+        open_ = close * exp(-returns[kept] + rng.normal(0, 0.004, n))
+        open_[0] = close[0]
+        high = maximum(open_, close) * (1 + abs(rng.normal(0, 0.008, n)))
+        low = minimum(open_, close) * (1 - abs(rng.normal(0, 0.008, n)))
+        volume = round(rng.lognormal(13, 0.6, n) * (1 + 4 * abs(returns[kept]) / 0.01))
+
+        stock_splits = zeros(n)
+        if symbol not in SECTOR_ETFS and n > 1 and rng.random() < splits:
+            stock_splits[rng.integers(1, n)] = float(rng.choice([2, 3, 4]))
+        dividends = zeros(n)
+        if symbol in SECTOR_ETFS or number % 2 == 0:
+            paid = arange(n) % 63 == 40
+            dividends[paid] = round(close[paid] * 0.004, 2)
+
+        frames.append(
+            DataFrame(
+                {
+                    "index": arange(n),
+                    "Date": [dates[day] for day in kept],
+                    "Open": round(open_, 2),
+                    "High": round(high, 2),
+                    "Low": round(low, 2),
+                    "Close": round(close, 2),
+                    "Volume": volume.astype(float64),
+                    "Dividends": dividends,
+                    "Stock Splits": stock_splits,
+                    "symbol": symbol,
+                }
+            )
+        )
+    df = concat(frames, ignore_index=True)
+    # rounding can leave the high under the open or close
+    df["High"] = df[["Open", "High", "Close"]].max(axis=1)
+    df["Low"] = df[["Open", "Low", "Close"]].min(axis=1)
+    return df
+
+
+def synthetic_info(prices: DataFrame, seed: int = 0) -> DataFrame:
+    """Symbol info for the synthetic prices, with the columns main filters on and the sector of each stock's ETF"""
+    rng = default_rng(seed)
+    sectors = {symbol: camelcase(string=sector) for symbol, sector in SECTOR_ETFS.items()}
+    etfs = [symbol for symbol in SECTOR_ETFS if symbol != "SPY"]
+    symbols = prices["symbol"].drop_duplicates().to_list()
+    index_symbols = [
+        "SPY" if symbol in SECTOR_ETFS else etfs[number % len(etfs)] for number, symbol in enumerate(symbols)
+    ]
+    is_etf = [symbol in SECTOR_ETFS for symbol in symbols]
+    return DataFrame(
+        {
+            "symbol": symbols,
+            "type": where(is_etf, "etf", "stock"),
+            "sector": [sectors[index_symbol] for index_symbol in index_symbols],
+            "industry": "Synthetic",
+            "equity_type": "Common Stock",
+            "market_cap": round(rng.lognormal(23, 1.5, len(symbols))),
+            "index_symbol": index_symbols,
+        }
+    )
+
+
+def synthetic_dataset(
+    data_path: Path, n_symbols: int = 100, n_bars: int = 1260, seed: int = 0, periods: Optional[list[str]] = None
+) -> dict[str, DataFrame]:
+    """Write synthetic symbol info and OHLCV files in the layout main reads, returning the prices per period"""
+    data_path = Path(data_path)
+    make_directories(data_path=data_path)
+    (data_path / "info").mkdir(parents=True, exist_ok=True)
+    prices = {"D": synthetic_prices(n_symbols=n_symbols, n_bars=n_bars, seed=seed)}
+    for period in [period for period in periods or ["W", "M"] if period != "D"]:
+        prices[period] = resample_ohlcv(df=prices["D"], period=period)
+    for period, df in prices.items():
+        write_frame(df=df, path=data_path / f"OHLCV/{period}/data.parquet", exact=PRICE_COLUMNS)
+
+    info = synthetic_info(prices=prices["D"], seed=seed)
+    info.loc[info["type"] == "stock"].drop(columns="index_symbol").to_parquet(data_path / "info/stock_info.parquet")
+    info.loc[info["type"] == "etf"].drop(columns="index_symbol").to_parquet(data_path / "info/etf_info.parquet")
+    info.to_parquet(data_path / "info/merged_info.parquet")
+    return prices
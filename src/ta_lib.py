@@ -1,9 +1,51 @@
 import talib
-from pandas import DataFrame, concat, Series
+from pandas import DataFrame, Index, MultiIndex, factorize
 from ta_utils import validate_columns
-import math
-from numpy import where, array, append
+from numpy import (
+    stack,
+    where,
+    array,
+    empty,
+    nan,
+    float64,
+    int64,
+    int16,
+    int8,
+    column_stack,
+    around,
+    concatenate,
+    flatnonzero,
+    count_nonzero,
+    full,
+    lexsort,
+    zeros,
+    ndarray,
+    add,
+    isnan,
+    select,
+)
+from typing import Optional
+from numba import njit
 from scipy.stats import linregress
+from kernels import (
+    true_range,
+    ewm_mean,
+    trend_streaks,
+    threshold_streaks,
+    rolling_arg_extreme,
+    rolling_regression,
+    regression_angle,
+    block_sums,
+    window_means,
+    macd_sweep,
+    obv_sweep,
+    unseeded,
+    BLOCK,
+    REGRESSION_SUMS,
+)
+from panel import Panel
+from patterns import CANDLE_PATTERNS
+import intermediates  # noqa: F401 registers the shared intermediates
 
 
 __all__ = [
@@ -11,23 +53,109 @@ __all__ = [
     "rsi",
     "stochastic_rsi",
     "macd",
+    "macd_panel",
     "natr",
     "volume_sma",
     "volume_ema",
     "obv",
+    "obv_panel",
     "mansfield_rsi",
+    "mansfield_rsi_panel",
+    "index_closes",
     "sata_moving_averages",
     "supertrend",
+    "supertrend_sweep",
+    "supertrend_panel",
     "simple_moving_averages",
     "exponential_moving_averages",
     "pattern_recognition",
     "periods_since_bottom",
     "periods_since_top",
+    "periods_since_extremes",
     "find_slope_",
     "change_ratio",
+    "bollinger_bands_panel",
+    "rsi_panel",
+    "stochastic_rsi_panel",
+    "natr_panel",
+    "volume_ema_panel",
+    "volume_sma_panel",
+    "moving_average_family",
+    "MOVING_AVERAGES",
+    "sata_moving_averages_panel",
+    "linear_regression",
+    "linear_regression_channels",
+    "change_ratio_panel",
+    "stages",
+    "stages_panel",
 ]
 
 
+# windows, ratio pairs and the pairs whose ratio streaks are tracked, per moving average kind
+MOVING_AVERAGES = {
+    "sma": {
+        "windows": [5, 10, 15, 20, 30, 45, 50, 100, 200],
+        "ratios": [
+            (5, 20),
+            (5, 50),
+            (10, 15),
+            (10, 20),
+            (10, 50),
+            (10, 100),
+            (10, 200),
+            (15, 45),
+            (20, 50),
+            (20, 100),
+            (20, 200),
+            (30, 50),
+            (30, 100),
+            (30, 200),
+            (50, 100),
+            (50, 200),
+            (100, 200),
+        ],
+        "streaks": [
+            (5, 20),
+            (5, 50),
+            (10, 20),
+            (10, 50),
+            (10, 100),
+            (10, 200),
+            (20, 50),
+            (20, 100),
+            (20, 200),
+            (30, 50),
+            (30, 100),
+            (30, 200),
+            (50, 100),
+            (50, 200),
+            (100, 200),
+        ],
+    },
+    "ema": {
+        "windows": [5, 10, 20, 30, 50, 100, 200],
+        "ratios": [
+            (5, 20),
+            (5, 50),
+            (10, 20),
+            (10, 50),
+            (10, 100),
+            (10, 200),
+            (20, 50),
+            (20, 100),
+            (20, 200),
+            (30, 50),
+            (30, 100),
+            (30, 200),
+            (50, 100),
+            (50, 200),
+            (100, 200),
+        ],
+    },
+}
+MOVING_AVERAGES["ema"]["streaks"] = MOVING_AVERAGES["ema"]["ratios"]
+
+
 def bollinger_bands(df: DataFrame, timeperiod: int = 5) -> DataFrame:
     """Calculate bollinger bands"""
 
@@ -41,6 +169,16 @@ def bollinger_bands(df: DataFrame, timeperiod: int = 5) -> DataFrame:
     return df.loc[:, ["Date", "symbol", "upperband_bb", "middleband_bb", "lowerband_bb"]]
 
 
+def bollinger_bands_panel(panel: Panel, timeperiod: int = 5) -> DataFrame:
+    """Calculate bollinger bands from the shared SMA and standard deviation"""
+
+    middleband = panel.get("sma", col="Close", timeperiod=timeperiod)
+    deviation = panel.get("stddev", col="Close", timeperiod=timeperiod) * 2
+    return panel.assign(
+        upperband_bb=middleband + deviation, middleband_bb=middleband, lowerband_bb=middleband - deviation
+    )
+
+
 def rsi(df: DataFrame, timeperiod: int = 14, ema_length: int = 10) -> DataFrame:
     """Calculate RSI"""
 
@@ -54,6 +192,19 @@ def rsi(df: DataFrame, timeperiod: int = 14, ema_length: int = 10) -> DataFrame:
     return df.loc[:, ["Date", "symbol", rsi_col_name, rsi_ema_col_name]]
 
 
+def rsi_panel(panel: Panel, timeperiod: int = 14, ema_length: int = 10) -> DataFrame:
+    """Calculate RSI"""
+
+    return panel.assign(
+        **{
+            f"rsi_{timeperiod}": panel.get("rsi", col="Close", timeperiod=timeperiod),
+            f"rsi_{timeperiod}_ema_{ema_length}": panel.get(
+                "rsi_ema", col="Close", timeperiod=timeperiod, ema_length=ema_length
+            ),
+        }
+    )
+
+
 def stochastic_rsi(
     df: DataFrame, timeperiod: int = 14, fastk_period: int = 5, fastd_period: int = 3, fastd_matype: int = 0
 ) -> DataFrame:
@@ -77,6 +228,24 @@ def stochastic_rsi(
     return df.loc[:, ["Date", "symbol", "stochastic_rsi_K", "stochastic_rsi_D", "stochastic_rsi_crossover"]]
 
 
+def stochastic_rsi_panel(
+    panel: Panel, timeperiod: int = 14, fastk_period: int = 5, fastd_period: int = 3, fastd_matype: int = 0
+) -> DataFrame:
+    """Calculate Stochastic RSI from the shared RSI"""
+
+    fastk, fastd = panel.get(
+        "stochastic_rsi",
+        col="Close",
+        timeperiod=timeperiod,
+        fastk_period=fastk_period,
+        fastd_period=fastd_period,
+        fastd_matype=fastd_matype,
+    )
+    return panel.assign(
+        stochastic_rsi_K=fastk, stochastic_rsi_D=fastd, stochastic_rsi_crossover=where(fastk >= fastd, 1, -1)
+    )
+
+
 def macd(df: DataFrame, fastperiod: int = 12, slowperiod: int = 26, signalperiod: int = 9) -> DataFrame:
     """Calculate MACD"""
 
@@ -91,11 +260,37 @@ def macd(df: DataFrame, fastperiod: int = 12, slowperiod: int = 26, signalperiod
     df = df.assign(macdhist=macdhist)
     macdtrend = where(df["macd"] > df["macd"].shift(1), 1, where(df["macd"] < df["macd"].shift(1), -1, 0))
     df = df.assign(macdtrend=macdtrend)
-    macd_streak = df["macdtrend"].groupby((df["macdtrend"] != df["macdtrend"].shift(1)).cumsum()).cumcount() + 1
+    macd_streak = trend_streaks(values=df["macdtrend"].to_numpy(), starts=array([0]))[:, 0]
     df = df.assign(macdstreak=macd_streak)
     return df.loc[:, ["Date", "symbol", "macd", "macdsignal", "macdhist", "macdtrend", "macdstreak"]]
 
 
+def macd_panel(panel: Panel, fastperiod: int = 12, slowperiod: int = 26, signalperiod: int = 9) -> DataFrame:
+    """Calculate MACD for every symbol of the panel in one sweep"""
+
+    name = f"macd:{fastperiod}:{slowperiod}:{signalperiod}"
+    macd, macdsignal, macdhist, state = macd_sweep(
+        panel.array("Close"),
+        panel.starts,
+        panel.ends,
+        fastperiod,
+        slowperiod,
+        signalperiod,
+        panel.resume,
+        panel.seed(name, width=7 + max(fastperiod, slowperiod)),
+    )
+    panel.keep(name, state)
+    previous = panel.shift(values=macd, periods=1)
+    macdtrend = where(macd > previous, 1, where(macd < previous, -1, 0))
+    return panel.assign(
+        macd=macd,
+        macdsignal=macdsignal,
+        macdhist=macdhist,
+        macdtrend=macdtrend,
+        macdstreak=panel.streaks(names=[f"{name}:streak"], values=macdtrend)[:, 0],
+    )
+
+
 def natr(df: DataFrame, timeperiod: int = 14) -> DataFrame:
     """Calculate MACD"""
 
@@ -108,6 +303,14 @@ def natr(df: DataFrame, timeperiod: int = 14) -> DataFrame:
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def natr_panel(panel: Panel, timeperiod: int = 14) -> DataFrame:
+    """Calculate NATR from the shared true range"""
+
+    close = panel.array("Close")
+    atr = panel.get("atr", timeperiod=timeperiod)
+    return panel.assign(**{f"natr_{timeperiod}": where(close != 0, (atr / where(close != 0, close, 1)) * 100, 0)})
+
+
 def volume_ema(df: DataFrame, timeperiod: int = 10) -> DataFrame:
     """Calculate volume ema"""
 
@@ -120,6 +323,12 @@ def volume_ema(df: DataFrame, timeperiod: int = 10) -> DataFrame:
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def volume_ema_panel(panel: Panel, timeperiod: int = 10) -> DataFrame:
+    """Calculate volume ema"""
+
+    return panel.assign(**{f"vol_ema_{timeperiod}": panel.get("ema", col="Volume", timeperiod=timeperiod)})
+
+
 def volume_sma(df: DataFrame, timeperiod: int = 10) -> DataFrame:
     """Calculate volume sma"""
 
@@ -132,6 +341,12 @@ def volume_sma(df: DataFrame, timeperiod: int = 10) -> DataFrame:
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def volume_sma_panel(panel: Panel, timeperiod: int = 10) -> DataFrame:
+    """Calculate volume sma"""
+
+    return panel.assign(**{f"vol_sma_{timeperiod}": panel.get("sma", col="Volume", timeperiod=timeperiod)})
+
+
 def obv(df: DataFrame) -> DataFrame:
     """Calculate volume ema"""
 
@@ -143,6 +358,16 @@ def obv(df: DataFrame) -> DataFrame:
     return df.loc[:, ["Date", "symbol", "obv"]]
 
 
+def obv_panel(panel: Panel) -> DataFrame:
+    """Calculate on balance volume for every symbol of the panel in one sweep"""
+
+    obv, state = obv_sweep(
+        panel.array("Close"), panel.array("Volume"), panel.starts, panel.ends, panel.resume, panel.seed("obv", width=3)
+    )
+    panel.keep("obv", state)
+    return panel.assign(obv=obv)
+
+
 def simple_moving_averages(df: DataFrame) -> DataFrame:
     """Calculate SMA"""
 
@@ -193,25 +418,25 @@ def simple_moving_averages(df: DataFrame) -> DataFrame:
         }
     )
 
-    df = df.assign(
-        **{
-            "sma5_sma20_ratio_streak": identify_streaks(s=df["sma5_sma20_ratio"], streak_value=1.0),
-            "sma5_sma50_ratio_streak": identify_streaks(s=df["sma5_sma50_ratio"], streak_value=1.0),
-            "sma10_sma20_ratio_streak": identify_streaks(s=df["sma10_sma20_ratio"], streak_value=1.0),
-            "sma10_sma50_ratio_streak": identify_streaks(s=df["sma10_sma50_ratio"], streak_value=1.0),
-            "sma10_sma100_ratio_streak": identify_streaks(s=df["sma10_sma100_ratio"], streak_value=1.0),
-            "sma10_sma200_ratio_streak": identify_streaks(s=df["sma10_sma200_ratio"], streak_value=1.0),
-            "sma20_sma50_ratio_streak": identify_streaks(s=df["sma20_sma50_ratio"], streak_value=1.0),
-            "sma20_sma100_ratio_streak": identify_streaks(s=df["sma20_sma100_ratio"], streak_value=1.0),
-            "sma20_sma200_ratio_streak": identify_streaks(s=df["sma20_sma200_ratio"], streak_value=1.0),
-            "sma30_sma50_ratio_streak": identify_streaks(s=df["sma30_sma50_ratio"], streak_value=1.0),
-            "sma30_sma100_ratio_streak": identify_streaks(s=df["sma30_sma100_ratio"], streak_value=1.0),
-            "sma30_sma200_ratio_streak": identify_streaks(s=df["sma30_sma200_ratio"], streak_value=1.0),
-            "sma50_sma100_ratio_streak": identify_streaks(s=df["sma50_sma100_ratio"], streak_value=1.0),
-            "sma50_sma200_ratio_streak": identify_streaks(s=df["sma50_sma200_ratio"], streak_value=1.0),
-            "sma100_sma200_ratio_streak": identify_streaks(s=df["sma100_sma200_ratio"], streak_value=1.0),
-        }
-    )
+    streak_cols = [
+        "sma5_sma20_ratio",
+        "sma5_sma50_ratio",
+        "sma10_sma20_ratio",
+        "sma10_sma50_ratio",
+        "sma10_sma100_ratio",
+        "sma10_sma200_ratio",
+        "sma20_sma50_ratio",
+        "sma20_sma100_ratio",
+        "sma20_sma200_ratio",
+        "sma30_sma50_ratio",
+        "sma30_sma100_ratio",
+        "sma30_sma200_ratio",
+        "sma50_sma100_ratio",
+        "sma50_sma200_ratio",
+        "sma100_sma200_ratio",
+    ]
+    streaks = threshold_streaks(values=df.loc[:, streak_cols].to_numpy(), starts=array([0]), threshold=1.0)
+    df = df.assign(**{f"{col}_streak": streaks[:, i] for i, col in enumerate(streak_cols)})
 
     return df.loc[
         :,
@@ -263,6 +488,49 @@ def simple_moving_averages(df: DataFrame) -> DataFrame:
     ]
 
 
+def moving_average_family(
+    panel: Panel,
+    kind: str = "sma",
+    windows: Optional[list[int]] = None,
+    ratios: Optional[list[tuple[int, int]]] = None,
+    streaks: Optional[list[tuple[int, int]]] = None,
+    col: str = "Close",
+) -> DataFrame:
+    """Moving averages of any windows, with the ratio of each (short, long) pair and the streaks of some of them.
+
+    Each SMA is one running sum over the column (kept in the state of its window) and the EMAs share one sweep over it,
+    so extra windows and pairs are cheap. Windows only used by a pair are added to the output.
+    """
+    if kind not in MOVING_AVERAGES:
+        raise ValueError(f"Moving average kind must be one of {list(MOVING_AVERAGES)}, not {kind}")
+    defaults = MOVING_AVERAGES[kind]
+    ratios = [tuple(pair) for pair in (defaults["ratios"] if ratios is None else ratios)]
+    streaks = [tuple(pair) for pair in (defaults["streaks"] if streaks is None else streaks)]
+    ratios += [pair for pair in streaks if pair not in ratios]
+    windows = list(defaults["windows"] if windows is None else windows)
+    windows += sorted({window for pair in ratios for window in pair}.difference(windows))
+
+    if kind == "sma":
+        averages = {f"sma{window}": panel.get("sma", col=col, timeperiod=window) for window in windows}
+    else:
+        family = panel.get("ema_family", col=col, timeperiods=tuple(windows))
+        averages = {f"ema{window}": family[i] for i, window in enumerate(windows)}
+    ratio_values = {
+        f"{kind}{short}_{kind}{long}_ratio": averages[f"{kind}{short}"] / averages[f"{kind}{long}"]
+        for short, long in ratios
+    }
+    streak_cols = [f"{kind}{short}_{kind}{long}_ratio" for short, long in streaks]
+    streak_values = {}
+    if streak_cols:
+        values = panel.streaks(
+            names=[f"{col}:{name}_streak" for name in streak_cols],
+            values=column_stack([ratio_values[name] for name in streak_cols]),
+            threshold=1.0,
+        )
+        streak_values = {f"{name}_streak": values[:, i] for i, name in enumerate(streak_cols)}
+    return panel.assign(**averages, **ratio_values, **streak_values)
+
+
 def exponential_moving_averages(df: DataFrame) -> DataFrame:
     """Calculate EMA"""
 
@@ -306,25 +574,25 @@ def exponential_moving_averages(df: DataFrame) -> DataFrame:
         }
     )
 
-    df = df.assign(
-        **{
-            "ema5_ema20_ratio_streak": identify_streaks(s=df["ema5_ema20_ratio"], streak_value=1.0),
-            "ema5_ema50_ratio_streak": identify_streaks(s=df["ema5_ema50_ratio"], streak_value=1.0),
-            "ema10_ema20_ratio_streak": identify_streaks(s=df["ema10_ema20_ratio"], streak_value=1.0),
-            "ema10_ema50_ratio_streak": identify_streaks(s=df["ema10_ema50_ratio"], streak_value=1.0),
-            "ema10_ema100_ratio_streak": identify_streaks(s=df["ema10_ema100_ratio"], streak_value=1.0),
-            "ema10_ema200_ratio_streak": identify_streaks(s=df["ema10_ema200_ratio"], streak_value=1.0),
-            "ema20_ema50_ratio_streak": identify_streaks(s=df["ema20_ema50_ratio"], streak_value=1.0),
-            "ema20_ema100_ratio_streak": identify_streaks(s=df["ema20_ema100_ratio"], streak_value=1.0),
-            "ema20_ema200_ratio_streak": identify_streaks(s=df["ema20_ema200_ratio"], streak_value=1.0),
-            "ema30_ema50_ratio_streak": identify_streaks(s=df["ema30_ema50_ratio"], streak_value=1.0),
-            "ema30_ema100_ratio_streak": identify_streaks(s=df["ema30_ema100_ratio"], streak_value=1.0),
-            "ema30_ema200_ratio_streak": identify_streaks(s=df["ema30_ema200_ratio"], streak_value=1.0),
-            "ema50_ema100_ratio_streak": identify_streaks(s=df["ema50_ema100_ratio"], streak_value=1.0),
-            "ema50_ema200_ratio_streak": identify_streaks(s=df["ema50_ema200_ratio"], streak_value=1.0),
-            "ema100_ema200_ratio_streak": identify_streaks(s=df["ema100_ema200_ratio"], streak_value=1.0),
-        }
-    )
+    streak_cols = [
+        "ema5_ema20_ratio",
+        "ema5_ema50_ratio",
+        "ema10_ema20_ratio",
+        "ema10_ema50_ratio",
+        "ema10_ema100_ratio",
+        "ema10_ema200_ratio",
+        "ema20_ema50_ratio",
+        "ema20_ema100_ratio",
+        "ema20_ema200_ratio",
+        "ema30_ema50_ratio",
+        "ema30_ema100_ratio",
+        "ema30_ema200_ratio",
+        "ema50_ema100_ratio",
+        "ema50_ema200_ratio",
+        "ema100_ema200_ratio",
+    ]
+    streaks = threshold_streaks(values=df.loc[:, streak_cols].to_numpy(), starts=array([0]), threshold=1.0)
+    df = df.assign(**{f"{col}_streak": streaks[:, i] for i, col in enumerate(streak_cols)})
 
     return df.loc[
         :,
@@ -372,83 +640,145 @@ def exponential_moving_averages(df: DataFrame) -> DataFrame:
     ]
 
 
-def supertrend(df: DataFrame, timeperiod: int = 10, multiplier: float = 2.0) -> DataFrame:
-    validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", "Close", "High", "Low"])
-
-    high = df.High
-    low = df.Low
-    close = df.Close
+@njit(cache=True)
+def _supertrend_kernel(high, low, close, tr, starts, ends, timeperiods, multipliers, resume, seed):
+    """Supertrend trend and bands for several (timeperiod, multiplier) variants over flat arrays, one row per variant.
 
+    A symbol with a seed per variant (the ewm_mean state of its ATR, then the trend and final bands of its last row)
+    carries on from it at its resume row. Returns the same state after the last row of every symbol too.
+    """
     st_up = 1
     st_down = -1
-
-    price_diffs = [high - low, high - close.shift(1), close.shift(1) - low]
-    true_range = concat(price_diffs, axis=1)
-    true_range = true_range.abs().max(axis=1)
-
-    atr = true_range.ewm(alpha=1 / timeperiod, min_periods=timeperiod).mean()
+    n_variants = len(timeperiods)
+    trend = zeros((n_variants, len(close)), dtype=int64)
+    lowerbands = empty((n_variants, len(close)), dtype=float64)
+    upperbands = empty((n_variants, len(close)), dtype=float64)
+    state = empty((n_variants, len(starts), 6), dtype=float64)
 
     hl2 = (high + low) / 2
 
-    upperband = (hl2 + (multiplier * atr)).to_numpy()
-    lowerband = (hl2 - (multiplier * atr)).to_numpy()
-
-    supertrend = array([st_up] * len(df))
-
-    for i in range(1, len(df.index)):
-        curr = i
-        prev = i - 1
-
-        # if current close price crosses above upperband
-        if close.iloc[curr] > upperband[prev]:
-            supertrend[curr] = st_up
-        # if current close price crosses below lowerband
-        elif close.iloc[curr] < lowerband[prev]:
-            supertrend[curr] = st_down
-        # else, the trend continues
-        else:
-            supertrend[curr] = supertrend[prev]
-
-            # adjustment to the final bands
-            if supertrend[curr] == st_up and lowerband[curr] < lowerband[prev]:
-                lowerband[curr] = lowerband[prev]
-            if supertrend[curr] == st_down and upperband[curr] > upperband[prev]:
-                upperband[curr] = upperband[prev]
-
-        # to remove bands according to the trend direction
-        if supertrend[curr] == st_up:
-            upperband[curr] = None
-        else:
-            lowerband[curr] = None
-
-    df = df.loc[:, ["Date", "symbol"]]
-
-    supertrend[supertrend == 1] = 1
-    supertrend[supertrend == 0] = -1
-    df = df.assign(supertrend=supertrend)
-
-    # df["supertrend_change"] = where(
-    #     df["supertrend"] > df["supertrend"].shift(1), 1, where(df["supertrend"] < df["supertrend"].shift(1), -1, 0)
-    # )
-    supertrend_streak = df["supertrend"].groupby((df["supertrend"] != df["supertrend"].shift()).cumsum()).cumcount() + 1
-    df = df.assign(supertrend_streak=supertrend_streak)
+    for v in range(n_variants):
+        atr, atr_state = ewm_mean(tr, 1 / timeperiods[v], timeperiods[v], starts, ends, resume, seed[v, :, :3])
+        upperband = upperbands[v]
+        lowerband = lowerbands[v]
+        supertrend = trend[v]
+        for i in range(len(close)):
+            upperband[i] = hl2[i] + (multipliers[v] * atr[i])
+            lowerband[i] = hl2[i] - (multipliers[v] * atr[i])
+
+        for s in range(len(starts)):
+            if starts[s] == ends[s]:
+                continue
+            if isnan(seed[v, s, 0]):
+                supertrend[starts[s]] = st_up
+                first = starts[s] + 1
+                prev_trend, prev_lower, prev_upper = st_up, lowerband[starts[s]], upperband[starts[s]]
+            else:
+                first = resume[s]
+                prev_trend, prev_lower, prev_upper = int(seed[v, s, 3]), seed[v, s, 4], seed[v, s, 5]
+            for curr in range(first, ends[s]):
+                # if current close price crosses above upperband
+                if close[curr] > prev_upper:
+                    supertrend[curr] = st_up
+                # if current close price crosses below lowerband
+                elif close[curr] < prev_lower:
+                    supertrend[curr] = st_down
+                # else, the trend continues
+                else:
+                    supertrend[curr] = prev_trend
+
+                    # adjustment to the final bands
+                    if supertrend[curr] == st_up and lowerband[curr] < prev_lower:
+                        lowerband[curr] = prev_lower
+                    if supertrend[curr] == st_down and upperband[curr] > prev_upper:
+                        upperband[curr] = prev_upper
+
+                # to remove bands according to the trend direction
+                if supertrend[curr] == st_up:
+                    upperband[curr] = nan
+                else:
+                    lowerband[curr] = nan
+                prev_trend, prev_lower, prev_upper = supertrend[curr], lowerband[curr], upperband[curr]
+            state[v, s, :3] = atr_state[s]
+            state[v, s, 3], state[v, s, 4], state[v, s, 5] = prev_trend, prev_lower, prev_upper
+
+    return trend, lowerbands, upperbands, state
+
 
-    # df.loc[:, "lowerband"] = lowerband
-    # df.loc[:, "upperband"] = upperband
-    df = df.assign(lowerband_st=lowerband)
-    df = df.assign(upperband_st=upperband)
+def supertrend(df: DataFrame, timeperiod: int = 10, multiplier: float = 2.0) -> DataFrame:
+    """Calculate Supertrend"""
+    validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", "Close", "High", "Low"])
 
+    high = df.High.to_numpy(dtype=float64)
+    low = df.Low.to_numpy(dtype=float64)
+    close = df.Close.to_numpy(dtype=float64)
+    starts = array([0], dtype=int64)
+    ends = array([len(df)], dtype=int64)
+    trend, lowerband, upperband, _ = _supertrend_kernel(
+        high,
+        low,
+        close,
+        true_range(high, low, close, starts, ends),
+        starts,
+        ends,
+        array([timeperiod], dtype=int64),
+        array([multiplier], dtype=float64),
+        starts,
+        unseeded(n_symbols=1, width=6)[None],
+    )
+    streak = trend_streaks(values=trend.T, starts=array([0])).T
+    df = df.loc[:, ["Date", "symbol"]].assign(
+        supertrend=trend[0], supertrend_streak=streak[0], lowerband_st=lowerband[0], upperband_st=upperband[0]
+    )
     return df.loc[:, ["Date", "symbol", "supertrend", "supertrend_streak", "lowerband_st", "upperband_st"]]
 
 
+def supertrend_sweep(panel: Panel, variants: list[tuple[int, float]]) -> dict[tuple[int, float], DataFrame]:
+    """Calculate Supertrend for every (timeperiod, multiplier) variant over all symbols in one call"""
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Close", "High", "Low"])
+
+    names = [f"supertrend:{timeperiod}:{multiplier}" for timeperiod, multiplier in variants]
+    trend, lowerband, upperband, state = _supertrend_kernel(
+        panel.array("High"),
+        panel.array("Low"),
+        panel.array("Close"),
+        panel.get("true_range"),
+        panel.starts,
+        panel.ends,
+        array([timeperiod for timeperiod, _ in variants], dtype=int64),
+        array([multiplier for _, multiplier in variants], dtype=float64),
+        panel.resume,
+        stack([panel.seed(name, width=6) for name in names]),
+    )
+    for name, ended in zip(names, state):
+        panel.keep(name, ended)
+    streak = panel.streaks(names=[f"{name}:streak" for name in names], values=trend.T).T
+    return {
+        variant: panel.df.loc[:, ["Date", "symbol"]].assign(
+            supertrend=trend[v], supertrend_streak=streak[v], lowerband_st=lowerband[v], upperband_st=upperband[v]
+        )
+        for v, variant in enumerate(variants)
+    }
+
+
+def supertrend_panel(panel: Panel, timeperiod: int = 10, multiplier: float = 2.0) -> DataFrame:
+    """Calculate Supertrend over all symbols of the panel"""
+    return supertrend_sweep(panel=panel, variants=[(timeperiod, multiplier)])[(timeperiod, multiplier)]
+
+
 def periods_since_bottom(df: DataFrame, num_periods: int = 20, low_column: str = "Low") -> DataFrame:
     """Find the number of periods from the low of the last n periods"""
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", low_column])
 
     col_name = f"periods_since_{num_periods}_{low_column}_bottom"
-    df[col_name] = (
-        df[low_column].rolling(window=num_periods, min_periods=num_periods).apply(lambda l: list(l)[::-1].index(min(l)))
+    periods = rolling_arg_extreme(
+        df[low_column].to_numpy(dtype=float64),
+        array([0], dtype=int64),
+        array([len(df)], dtype=int64),
+        array([num_periods], dtype=int64),
+        False,
     )
+    df = df.assign(**{col_name: periods[0]})
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
@@ -457,42 +787,123 @@ def periods_since_top(df: DataFrame, num_periods: int = 20, high_column: str = "
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", high_column])
 
     col_name = f"periods_since_{num_periods}_{high_column}_top"
-    df[col_name] = (
-        df[high_column]
-        .rolling(window=num_periods, min_periods=num_periods)
-        .apply(lambda l: list(l)[::-1].index(max(l)))
+    periods = rolling_arg_extreme(
+        df[high_column].to_numpy(dtype=float64),
+        array([0], dtype=int64),
+        array([len(df)], dtype=int64),
+        array([num_periods], dtype=int64),
+        True,
     )
+    df = df.assign(**{col_name: periods[0]})
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def periods_since_extremes(
+    panel: Panel, num_periods: list[int] = [10, 20, 40], low_column: str = "Low", high_column: str = "High"
+) -> dict[str, DataFrame]:
+    """Periods since the bottom and the top of every window length, for all symbols in one sweep per column"""
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", low_column, high_column])
+
+    windows = array(num_periods, dtype=int64)
+    bottoms = rolling_arg_extreme(panel.array(low_column), panel.starts, panel.ends, windows, False)
+    tops = rolling_arg_extreme(panel.array(high_column), panel.starts, panel.ends, windows, True)
+
+    results = {}
+    for i, window in enumerate(num_periods):
+        results[f"periods_since_bottom_{window}"] = panel.df.loc[:, ["Date", "symbol"]].assign(
+            **{f"periods_since_{window}_{low_column}_bottom": bottoms[i]}
+        )
+    for i, window in enumerate(num_periods):
+        results[f"periods_since_top_{window}"] = panel.df.loc[:, ["Date", "symbol"]].assign(
+            **{f"periods_since_{window}_{high_column}_top": tops[i]}
+        )
+    return results
+
+
 def find_slope_(df: DataFrame, num_periods: int = 10, col: str = "Close") -> DataFrame:
     """Find the slope in degrees of the last n periods"""
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", col])
 
     col_name = f"slope_{num_periods}_{col}"
-    df[col_name] = talib.LINEARREG_SLOPE(df[col], timeperiod=num_periods).apply(
-        lambda slope: math.degrees(math.atan(slope)) / 90
+    slope, *_ = rolling_regression(
+        df[col].to_numpy(dtype=float64),
+        array([0], dtype=int64),
+        array([len(df)], dtype=int64),
+        array([num_periods], dtype=int64),
+        array([0], dtype=int64),
+        unseeded(1, REGRESSION_SUMS + num_periods)[None],
     )
+    df = df.assign(**{col_name: regression_angle(slope[0])})
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
 def linear_regression_channels(
     df: DataFrame, timeperiod: int = 10, deviations: int = 2, col: str = "Close"
 ) -> DataFrame:
-    """Find the slope in degrees of the last n periods"""
+    """Linear regression line of the last n periods with channels n residual deviations above and below"""
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", col])
 
-    col_names = [
-        f"lin_reg_{timeperiod}_{deviations}_{col}",
-        f"stddev_{timeperiod}_{deviations}_{col}",
-        f"lin_reg_upper_channel_{timeperiod}_{deviations}_{col}",
-        f"lin_reg_lower_channel_{timeperiod}_{deviations}_{col}",
-    ]
-    df[col_names[0]] = talib.LINEARREG(df[col], timeperiod=timeperiod)
-    df[col_names[1]] = talib.STDDEV(df[col], timeperiod=timeperiod, nbdev=deviations)
-    df[col_names[2]] = df[col_names[0]] + df[col_names[1]]
-    df[col_names[3]] = df[col_names[0]] - df[col_names[1]]
-    return df.loc[:, ["Date", "symbol"] + col_names]
+    _, _, fitted, resid_std, _ = rolling_regression(
+        df[col].to_numpy(dtype=float64),
+        array([0], dtype=int64),
+        array([len(df)], dtype=int64),
+        array([timeperiod], dtype=int64),
+        array([0], dtype=int64),
+        unseeded(1, REGRESSION_SUMS + timeperiod)[None],
+    )
+    return _channels(
+        frame=df.loc[:, ["Date", "symbol"]],
+        fitted=fitted[0],
+        resid_std=resid_std[0],
+        timeperiod=timeperiod,
+        deviations=deviations,
+        col=col,
+    )
+
+
+def _channels(
+    frame: DataFrame, fitted: ndarray, resid_std: ndarray, timeperiod: int, deviations: int, col: str
+) -> DataFrame:
+    suffix = f"{timeperiod}_{deviations}_{col}"
+    return frame.assign(
+        **{
+            f"lin_reg_{suffix}": fitted,
+            f"stddev_{suffix}": resid_std * deviations,
+            f"lin_reg_upper_channel_{suffix}": fitted + resid_std * deviations,
+            f"lin_reg_lower_channel_{suffix}": fitted - resid_std * deviations,
+        }
+    )
+
+
+def linear_regression(
+    panel: Panel, num_periods: list[int] = [10, 20, 40], deviations: int = 2, col: str = "Close"
+) -> dict[str, DataFrame]:
+    """Slope angle and regression channels of every window length, for all symbols in one pass"""
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", col])
+
+    names = [f"regression:{col}:{window}" for window in num_periods]
+    # the state of every window is as wide as the widest one, each keeping its own width
+    seed = full((len(num_periods), panel.n_symbols, REGRESSION_SUMS + max(num_periods)), nan, dtype=float64)
+    for i, (name, window) in enumerate(zip(names, num_periods)):
+        seed[i, :, : REGRESSION_SUMS + window] = panel.seed(name, width=REGRESSION_SUMS + window)
+    slope, _, fitted, resid_std, state = rolling_regression(
+        panel.array(col), panel.starts, panel.ends, array(num_periods, dtype=int64), panel.resume, seed
+    )
+    for i, (name, window) in enumerate(zip(names, num_periods)):
+        panel.keep(name, state[i, :, : REGRESSION_SUMS + window])
+    results = {}
+    for i, window in enumerate(num_periods):
+        results[f"find_slope_{window}"] = panel.assign(**{f"slope_{window}_{col}": regression_angle(slope[i])})
+    for i, window in enumerate(num_periods):
+        results[f"linear_regression_channels_{window}"] = _channels(
+            frame=panel.assign(),
+            fitted=fitted[i],
+            resid_std=resid_std[i],
+            timeperiod=window,
+            deviations=deviations,
+            col=col,
+        )
+    return results
 
 
 def change_ratio(df: DataFrame, num_periods: int = 1, col: str = "Close") -> DataFrame:
@@ -500,10 +911,17 @@ def change_ratio(df: DataFrame, num_periods: int = 1, col: str = "Close") -> Dat
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", col])
 
     col_name = f"change_{num_periods}_{col}"
-    df[col_name] = df[col] / df[col].shift(num_periods)
+    df = df.assign(**{col_name: df[col] / df[col].shift(num_periods)})
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def change_ratio_panel(panel: Panel, num_periods: int = 1, col: str = "Close") -> DataFrame:
+    """Find the ratio of a column compared to the value n periods ago"""
+
+    values = panel.array(col)
+    return panel.assign(**{f"change_{num_periods}_{col}": values / panel.shift(values=values, periods=num_periods)})
+
+
 def mansfield_rsi(df: DataFrame, num_periods: int = 40) -> DataFrame:  ###Finish this first 10/21/2023
     """Find the ratio of a column compared to the value n periods ago"""
     validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", "Close", "index_close"])
@@ -512,14 +930,65 @@ def mansfield_rsi(df: DataFrame, num_periods: int = 40) -> DataFrame:  ###Finish
     mrsi_relative_performance = (df.Close / df.index_close) * 100
     # print(mrsi_relative_performance)
     if mrsi_relative_performance.isna().all():
-        df[col_name] = 50
+        df = df.assign(**{col_name: 50})
         return df.loc[:, ["Date", "symbol", col_name]]
-    df[col_name] = (
-        (mrsi_relative_performance / talib.SMA(mrsi_relative_performance, timeperiod=num_periods)) - 1
-    ) * 100
+    df = df.assign(
+        **{
+            col_name: ((mrsi_relative_performance / talib.SMA(mrsi_relative_performance, timeperiod=num_periods)) - 1)
+            * 100
+        }
+    )
     return df.loc[:, ["Date", "symbol", col_name]]
 
 
+def index_closes(panel: Panel, index_prices: Optional[DataFrame] = None) -> tuple[ndarray, ndarray]:
+    """Close of each row's index ETF on the same date, gathered through a shared trading calendar.
+
+    The index ETFs are rows of the panel, or given as index_prices (symbol, Date and Close) when they are not, e.g.
+    read once for every batch of a streamed run. Returns the closes and a mask of the rows whose index traded on that
+    date.
+    """
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Close", "index_symbol"])
+    if index_prices is not None:
+        validate_columns(df_columns=index_prices.columns, required_columns=["Date", "symbol", "Close"])
+        rows = MultiIndex.from_arrays([index_prices["symbol"], index_prices["Date"]]).get_indexer(
+            MultiIndex.from_arrays([panel.df["index_symbol"], panel.df["Date"]])
+        )
+        found = rows >= 0
+        closes = full(len(panel), nan, dtype=float64)
+        closes[found] = index_prices["Close"].to_numpy(dtype=float64)[rows[found]]
+        return closes, found
+
+    date_codes, calendar = factorize(panel.df["Date"], sort=True)
+    index_symbols = Index(panel.df["index_symbol"].dropna().unique())
+    # one row of closes per index ETF, one column per trading day
+    grid = full((len(index_symbols), len(calendar)), nan, dtype=float64)
+    traded = zeros((len(index_symbols), len(calendar)), dtype=bool)
+    own_index = index_symbols.get_indexer(panel.df["symbol"])
+    is_index = own_index >= 0
+    grid[own_index[is_index], date_codes[is_index]] = panel.array("Close")[is_index]
+    traded[own_index[is_index], date_codes[is_index]] = True
+
+    row_index = index_symbols.get_indexer(panel.df["index_symbol"])
+    found = row_index >= 0
+    found[found] = traded[row_index[found], date_codes[found]]
+    closes = full(len(panel), nan, dtype=float64)
+    closes[found] = grid[row_index[found], date_codes[found]]
+    return closes, found
+
+
+def mansfield_rsi_panel(panel: Panel, num_periods: int = 40) -> DataFrame:
+    """Mansfield RSI against each symbol's index ETF, for all symbols together"""
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Close", "index_close"])
+
+    relative_performance = panel.source("relative_performance")
+    # the SMA of every symbol in one sweep over the panel
+    mansfield = (relative_performance / panel.get("sma", col="relative_performance", timeperiod=num_periods) - 1) * 100
+    # symbols without any index closes get a neutral 50
+    no_index = add.reduceat(~isnan(relative_performance), panel.starts) == 0
+    return panel.assign(**{f"mansfield_rsi_{num_periods}": where(no_index[panel.segment_index], 50, mansfield)})
+
+
 def sata_moving_averages(df: DataFrame) -> DataFrame:
     """Calculate SATA Moving Averages"""
 
@@ -532,163 +1001,72 @@ def sata_moving_averages(df: DataFrame) -> DataFrame:
     sata_ma7 = talib.SMA(df.Close, timeperiod=7)
     sata_ma6 = talib.SMA(df.Close, timeperiod=40)
 
-    df["sata_ma6"] = round(df.Close / sata_ma6, ndigits=3)
-    df["sata_ma7"] = round(sata_ma7 / sata_ma7.shift(1), ndigits=3)
-    df["sata_ma8"] = round(sata_ma8 / sata_ma8.shift(1), ndigits=3)
-    df["sata_ma9"] = round(sata_ma9 / sata_ma9.shift(1), ndigits=3)
+    df = df.assign(
+        sata_ma6=round(df.Close / sata_ma6, ndigits=3),
+        sata_ma7=round(sata_ma7 / sata_ma7.shift(1), ndigits=3),
+        sata_ma8=round(sata_ma8 / sata_ma8.shift(1), ndigits=3),
+        sata_ma9=round(sata_ma9 / sata_ma9.shift(1), ndigits=3),
+    )
 
     return df.loc[:, ["Date", "symbol", "sata_ma6", "sata_ma7", "sata_ma8", "sata_ma9"]]
 
 
-def pattern_recognition(df: DataFrame) -> DataFrame:
-    """Find all patterns"""
-    validate_columns(df_columns=df.columns, required_columns=["Date", "symbol", "Open", "High", "Low", "Close"])
-
-    df["CDL2CROWS"] = talib.CDL2CROWS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3BLACKCROWS"] = talib.CDL3BLACKCROWS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3INSIDE"] = talib.CDL3INSIDE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3LINESTRIKE"] = talib.CDL3LINESTRIKE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3OUTSIDE"] = talib.CDL3OUTSIDE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3STARSINSOUTH"] = talib.CDL3STARSINSOUTH(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDL3WHITESOLDIERS"] = talib.CDL3WHITESOLDIERS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLABANDONEDBABY"] = talib.CDLABANDONEDBABY(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLADVANCEBLOCK"] = talib.CDLADVANCEBLOCK(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLBELTHOLD"] = talib.CDLBELTHOLD(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLBREAKAWAY"] = talib.CDLBREAKAWAY(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLCLOSINGMARUBOZU"] = talib.CDLCLOSINGMARUBOZU(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLCONCEALBABYSWALL"] = talib.CDLCONCEALBABYSWALL(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLCOUNTERATTACK"] = talib.CDLCOUNTERATTACK(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLDARKCLOUDCOVER"] = talib.CDLDARKCLOUDCOVER(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLDOJI"] = talib.CDLDOJI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLDOJISTAR"] = talib.CDLDOJISTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLDRAGONFLYDOJI"] = talib.CDLDRAGONFLYDOJI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLENGULFING"] = talib.CDLENGULFING(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLEVENINGDOJISTAR"] = talib.CDLEVENINGDOJISTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLEVENINGSTAR"] = talib.CDLEVENINGSTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLGAPSIDESIDEWHITE"] = talib.CDLGAPSIDESIDEWHITE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLGRAVESTONEDOJI"] = talib.CDLGRAVESTONEDOJI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHAMMER"] = talib.CDLHAMMER(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHANGINGMAN"] = talib.CDLHANGINGMAN(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHARAMI"] = talib.CDLHARAMI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHARAMICROSS"] = talib.CDLHARAMICROSS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHIGHWAVE"] = talib.CDLHIGHWAVE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHIKKAKE"] = talib.CDLHIKKAKE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHIKKAKEMOD"] = talib.CDLHIKKAKEMOD(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLHOMINGPIGEON"] = talib.CDLHOMINGPIGEON(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLIDENTICAL3CROWS"] = talib.CDLIDENTICAL3CROWS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLINNECK"] = talib.CDLINNECK(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLINVERTEDHAMMER"] = talib.CDLINVERTEDHAMMER(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLKICKING"] = talib.CDLKICKING(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLKICKINGBYLENGTH"] = talib.CDLKICKINGBYLENGTH(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLLADDERBOTTOM"] = talib.CDLLADDERBOTTOM(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLLONGLEGGEDDOJI"] = talib.CDLLONGLEGGEDDOJI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLLONGLINE"] = talib.CDLLONGLINE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLMARUBOZU"] = talib.CDLMARUBOZU(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLMATCHINGLOW"] = talib.CDLMATCHINGLOW(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLMATHOLD"] = talib.CDLMATHOLD(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLMORNINGDOJISTAR"] = talib.CDLMORNINGDOJISTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLMORNINGSTAR"] = talib.CDLMORNINGSTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLONNECK"] = talib.CDLONNECK(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLPIERCING"] = talib.CDLPIERCING(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLRICKSHAWMAN"] = talib.CDLRICKSHAWMAN(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLRISEFALL3METHODS"] = talib.CDLRISEFALL3METHODS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSEPARATINGLINES"] = talib.CDLSEPARATINGLINES(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSHOOTINGSTAR"] = talib.CDLSHOOTINGSTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSHORTLINE"] = talib.CDLSHORTLINE(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSPINNINGTOP"] = talib.CDLSPINNINGTOP(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSTALLEDPATTERN"] = talib.CDLSTALLEDPATTERN(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLSTICKSANDWICH"] = talib.CDLSTICKSANDWICH(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLTAKURI"] = talib.CDLTAKURI(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLTASUKIGAP"] = talib.CDLTASUKIGAP(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLTHRUSTING"] = talib.CDLTHRUSTING(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLTRISTAR"] = talib.CDLTRISTAR(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLUNIQUE3RIVER"] = talib.CDLUNIQUE3RIVER(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLUPSIDEGAP2CROWS"] = talib.CDLUPSIDEGAP2CROWS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
-    df["CDLXSIDEGAP3METHODS"] = talib.CDLXSIDEGAP3METHODS(high=df.High, low=df.Low, open=df.Open, close=df.Close)
+def sata_moving_averages_panel(panel: Panel) -> DataFrame:
+    """Calculate SATA Moving Averages from the shared moving averages"""
 
-    return df.loc[
-        :,
-        [
-            "Date",
-            "symbol",
-            "CDL2CROWS",
-            "CDL3BLACKCROWS",
-            "CDL3INSIDE",
-            "CDL3LINESTRIKE",
-            "CDL3OUTSIDE",
-            "CDL3STARSINSOUTH",
-            "CDL3WHITESOLDIERS",
-            "CDLABANDONEDBABY",
-            "CDLADVANCEBLOCK",
-            "CDLBELTHOLD",
-            "CDLBREAKAWAY",
-            "CDLCLOSINGMARUBOZU",
-            "CDLCONCEALBABYSWALL",
-            "CDLCOUNTERATTACK",
-            "CDLDARKCLOUDCOVER",
-            "CDLDOJI",
-            "CDLDOJISTAR",
-            "CDLDRAGONFLYDOJI",
-            "CDLENGULFING",
-            "CDLEVENINGDOJISTAR",
-            "CDLEVENINGSTAR",
-            "CDLGAPSIDESIDEWHITE",
-            "CDLGRAVESTONEDOJI",
-            "CDLHAMMER",
-            "CDLHANGINGMAN",
-            "CDLHARAMI",
-            "CDLHARAMICROSS",
-            "CDLHIGHWAVE",
-            "CDLHIKKAKE",
-            "CDLHIKKAKEMOD",
-            "CDLHOMINGPIGEON",
-            "CDLIDENTICAL3CROWS",
-            "CDLINNECK",
-            "CDLINVERTEDHAMMER",
-            "CDLKICKING",
-            "CDLKICKINGBYLENGTH",
-            "CDLLADDERBOTTOM",
-            "CDLLONGLEGGEDDOJI",
-            "CDLLONGLINE",
-            "CDLMARUBOZU",
-            "CDLMATCHINGLOW",
-            "CDLMATHOLD",
-            "CDLMORNINGDOJISTAR",
-            "CDLMORNINGSTAR",
-            "CDLONNECK",
-            "CDLPIERCING",
-            "CDLRICKSHAWMAN",
-            "CDLRISEFALL3METHODS",
-            "CDLSEPARATINGLINES",
-            "CDLSHOOTINGSTAR",
-            "CDLSHORTLINE",
-            "CDLSPINNINGTOP",
-            "CDLSTALLEDPATTERN",
-            "CDLSTICKSANDWICH",
-            "CDLTAKURI",
-            "CDLTASUKIGAP",
-            "CDLTHRUSTING",
-            "CDLTRISTAR",
-            "CDLUNIQUE3RIVER",
-            "CDLUPSIDEGAP2CROWS",
-            "CDLXSIDEGAP3METHODS",
-        ],
-    ]
+    sata_ma9 = panel.get("ema", col="ohlc4", timeperiod=10)
+    sata_ma8 = panel.get("sma", col="Close", timeperiod=30)
+    sata_ma7 = panel.get("sma", col="Close", timeperiod=7)
+    sata_ma6 = panel.get("sma", col="Close", timeperiod=40)
+
+    return panel.assign(
+        sata_ma6=around(panel.array("Close") / sata_ma6, decimals=3),
+        sata_ma7=around(sata_ma7 / panel.shift(values=sata_ma7, periods=1), decimals=3),
+        sata_ma8=around(sata_ma8 / panel.shift(values=sata_ma8, periods=1), decimals=3),
+        sata_ma9=around(sata_ma9 / panel.shift(values=sata_ma9, periods=1), decimals=3),
+    )
 
 
-def identify_streaks(s: Series, streak_value: int = 1) -> array:
-    r = array([0])
-    arr = where(
-        ((s >= streak_value) & (s.shift(1) < streak_value))
-        | ((s < streak_value) & (s.shift(1) >= streak_value))
-        | s.isnull(),
-        0,
-        1,
+def pattern_recognition(panel: Panel, patterns: Optional[list[str]] = None) -> DataFrame:
+    """Find candlestick patterns, keeping only the hits as (symbol, Date, pattern_id, value) events.
+
+    pattern_id is the position of the pattern in CANDLE_PATTERNS. value is the TA-Lib output divided by 10 so that
+    every output (80, 100, 200 and their negatives) fits in an int8.
+    """
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Open", "High", "Low", "Close"])
+
+    patterns = CANDLE_PATTERNS if patterns is None else patterns
+    functions = [(CANDLE_PATTERNS.index(pattern), getattr(talib, pattern)) for pattern in patterns]
+    if not functions:
+        # no patterns to look for, so no events
+        return (
+            panel.df.loc[[], ["symbol", "Date"]]
+            .assign(pattern_id=zeros(0, dtype=int16), value=zeros(0, dtype=int8))
+            .reset_index(drop=True)
+        )
+    open_, high, low, close = panel.array("Open"), panel.array("High"), panel.array("Low"), panel.array("Close")
+
+    rows, pattern_ids, values = [], [], []
+    for _, start, end in panel.segments():
+        # slice the prices once per symbol and run every pattern on them
+        prices = dict(open=open_[start:end], high=high[start:end], low=low[start:end], close=close[start:end])
+        hits = [(pattern_id, func(**prices)) for pattern_id, func in functions]
+        segment_rows = concatenate([flatnonzero(hit) for _, hit in hits]).astype(int64)
+        segment_ids = concatenate([full(count_nonzero(hit), pattern_id, dtype=int16) for pattern_id, hit in hits])
+        order = lexsort((segment_ids, segment_rows))
+        rows.append(segment_rows[order] + start)
+        pattern_ids.append(segment_ids[order])
+        values.append(concatenate([hit[hit != 0] for _, hit in hits])[order] // 10)
+
+    rows = concatenate(rows) if rows else zeros(0, dtype=int64)
+    return DataFrame(
+        {
+            "symbol": panel.df["symbol"].to_numpy()[rows],
+            "Date": panel.df["Date"].to_numpy()[rows],
+            "pattern_id": concatenate(pattern_ids).astype(int16) if pattern_ids else zeros(0, dtype=int16),
+            "value": concatenate(values).astype(int8) if values else zeros(0, dtype=int8),
+        }
     )
-    for i in range(1, len(arr)):
-        q = r[-1] + 1 if arr[i] != 0 else 0
-        r = append(r, q)
-    return r
 
 
 def stages(
@@ -921,6 +1299,82 @@ def stages(
     ]
 
 
+# Weinstein stage of each (short MA trend, long MA trend, short/long MA trend) code, every other code is stage 0
+STAGE_TABLE = [
+    (1, 0, -1, 1),
+    (0, 0, 1, 2),
+    (0, 0, 2, 2),
+    (1, 0, 1, 2),
+    (1, 0, 2, 2),
+    (0, 1, 1, 2),
+    (0, 1, 2, 2),
+    (1, 1, 1, 2),
+    (1, 1, 2, 2),
+    (-1, 0, -2, -1),
+    (-1, 0, 1, -1),
+    (-1, 0, 2, -1),
+    (-1, -1, -2, -2),
+    (-1, -1, -1, -2),
+]
+
+
+def _stage_lookup(table: list[tuple[int, int, int, int]]) -> ndarray:
+    """The stage table as an array indexed by the three trend codes shifted to start at 0"""
+    codes = array(table, dtype=int64)
+    lookup = zeros((3, 3, 5), dtype=int8)
+    lookup[codes[:, 0] + 1, codes[:, 1] + 1, codes[:, 2] + 2] = codes[:, 3]
+    return lookup
+
+
+STAGES = _stage_lookup(table=STAGE_TABLE)
+
+
+def _moving_average_trend(panel: Panel, moving_average: ndarray, trend_smoothing: int, null_zone: float) -> ndarray:
+    """1 while the smoothed day over day change of a moving average is up by more than the null zone, -1 while it is
+    down by more and 0 otherwise"""
+    change = moving_average / panel.shift(values=moving_average, periods=1)
+    sums, counts = block_sums(change, panel.starts, panel.ends, BLOCK)
+    trend = window_means(change, sums, counts, panel.starts, panel.ends, trend_smoothing, BLOCK, True)
+    return where(trend < 1 - null_zone, -1, where(trend > 1 + null_zone, 1, 0)).astype(int8)
+
+
+def stages_panel(
+    panel: Panel, short_moving_average: int = 50, long_moving_average: int = 200, trend_smoothing: int = 5
+) -> DataFrame:
+    """Weinstein stages for every symbol of the panel from trailing moving averages, mapped with the STAGES array"""
+    validate_columns(df_columns=panel.df.columns, required_columns=["Date", "symbol", "Close"])
+
+    trend_null_zone = 0.0005
+    rel_trend_null_zone = 0.1
+
+    close = panel.array("Close")
+    sums, counts = panel.get("block_sums", col="Close")
+    short_ma = window_means(close, sums, counts, panel.starts, panel.ends, short_moving_average, BLOCK, True)
+    long_ma = window_means(close, sums, counts, panel.starts, panel.ends, long_moving_average, BLOCK, True)
+    short_trend = _moving_average_trend(panel, short_ma, trend_smoothing=trend_smoothing, null_zone=trend_null_zone)
+    long_trend = _moving_average_trend(panel, long_ma, trend_smoothing=trend_smoothing, null_zone=trend_null_zone)
+
+    ratio = short_ma / long_ma
+    ratio = where(isnan(ratio), 1.0, ratio)
+    short_long_trend = select(
+        [
+            ratio < 1 - trend_null_zone,
+            ratio < 1,
+            ratio <= 1 + trend_null_zone,
+            ratio > 1 + rel_trend_null_zone,
+        ],
+        [-2, -1, 1, 2],
+        default=0,
+    ).astype(int8)
+
+    return panel.assign(
+        stage=STAGES[short_trend + 1, long_trend + 1, short_long_trend + 2],
+        Short_trend=short_trend,
+        Long_trend=long_trend,
+        Short_Long_trend=short_long_trend,
+    )
+
+
 # # # a = talib.get_function_groups()
 # # # print(a)
 
@@ -1,4 +1,6 @@
 from pandas import Index
+from contextlib import contextmanager
+from threading import local
 
 
 class InvalidInputException(Exception):
@@ -9,9 +11,39 @@ class InvalidInputException(Exception):
         return self.msg
 
 
+# validated is True while the engine runs over a panel that was validated once against every indicator's columns,
+# per thread since the period pipelines run concurrently
+_panel_state = local()
+
+
+@contextmanager
+def validated_panel(debug: bool = False):
+    """Skip validate_columns inside the block, where the panel has already been validated (debug keeps the checks)"""
+    previous = getattr(_panel_state, "validated", False)
+    _panel_state.validated = not debug
+    try:
+        yield
+    finally:
+        _panel_state.validated = previous
+
+
 def validate_columns(df_columns: Index, required_columns: list[str]) -> None:
     """Validate required columns"""
+    if getattr(_panel_state, "validated", False):
+        return
     if [col for col in required_columns if col not in df_columns]:
         raise InvalidInputException(
             f"{', '.join(required_columns)} columns are required. DataFrame only included columns: {', '.join(list(df_columns))}"
         )
+
+
+def validate_panel(df_columns: Index, required_columns: dict[str, list[str]]) -> None:
+    """Validate the columns every indicator declares once for the whole panel, naming the indicators that lack any"""
+    missing = {key: [col for col in cols if col not in df_columns] for key, cols in required_columns.items()}
+    missing = {key: cols for key, cols in missing.items() if cols}
+    if missing:
+        raise InvalidInputException(
+            "Missing columns - "
+            + "; ".join(f"{key}: {', '.join(cols)}" for key, cols in missing.items())
+            + f". DataFrame only included columns: {', '.join(list(df_columns))}"
+        )
@@ -14,6 +14,22 @@ MARKET_HOLIDAYS = [
 
 rangebreaks = [dict(bounds=["sat", "mon"]), dict(values=MARKET_HOLIDAYS)]
 
+# Index ETFs the Mansfield RSI compares each symbol with, by sector
+SECTOR_ETFS = {
+    "SPY": "S&P 500",
+    "XLC": "COMMUNICATION SERVICES",
+    "XLY": "CONSUMER DISCRETIONARY",
+    "XLP": "CONSUMER STAPLES",
+    "XLE": "ENERGY",
+    "XLF": "FINANCIALS",
+    "XLV": "HEALTH CARE",
+    "XLI": "INDUSTRIALS",
+    "XLB": "MATERIALS",
+    "XLRE": "REAL ESTATE",
+    "XLK": "INFORMATION TECHNOLOGY",
+    "XLU": "UTILITIES",
+}
+
 
 def back_in_time(
     d: Optional[str] = None, days: Optional[int] = None, weeks: Optional[int] = None, years: Optional[int] = None